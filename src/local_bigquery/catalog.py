@@ -0,0 +1,108 @@
+import threading
+from typing import Callable, Optional
+
+from local_bigquery.models import Dataset
+
+# Column names, DuckDB types and nullability, in table order.
+Columns = list[tuple[str, str, bool]]
+
+
+class _Project:
+    def __init__(self, datasets: dict[str, Dataset], tables: dict[str, dict]):
+        self.version: Optional[int] = None
+        self.datasets = datasets
+        self.tables: dict[str, dict[str, Columns]] = {
+            dataset_id: tables.get(dataset_id, {}) for dataset_id in datasets
+        }
+
+
+class Catalog:
+    """
+    An in-process cache of each project's datasets and tables.
+
+    A project is loaded in full on first use. Changes made through `db` are
+    written through to the cache; anything that can't be tracked precisely
+    (DDL inside a query) invalidates it so the next read reloads.
+
+    When other processes share the catalog, `version` reads a counter that
+    every change, here or there, bumps through `bump`. Projects loaded at an
+    older version are reloaded.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[str], tuple[dict[str, Dataset], dict[str, dict[str, Columns]]]],
+        version: Callable[[], Optional[int]] = lambda: None,
+        bump: Callable[[], Optional[int]] = lambda: None,
+    ):
+        self.load = load
+        self.version = version
+        self.bump = bump
+        self.lock = threading.RLock()
+        self.projects: dict[str, _Project] = {}
+
+    def project(self, project_id: str) -> _Project:
+        version = self.version()
+        with self.lock:
+            project = self.projects.get(project_id)
+            if project is None or project.version != version:
+                project = self.projects[project_id] = _Project(*self.load(project_id))
+                project.version = version
+            return project
+
+    def changed(self, project: _Project):
+        version = self.bump()
+        # Nobody else changed the catalog in between, so the cache is current.
+        if version is not None and project.version == version - 1:
+            project.version = version
+
+    def invalidate(self, project_id: Optional[str] = None):
+        with self.lock:
+            if project_id is None:
+                self.projects.clear()
+            else:
+                self.projects.pop(project_id, None)
+        self.bump()
+
+    def list_datasets(self, project_id: str) -> list[Dataset]:
+        datasets = self.project(project_id).datasets
+        return [datasets[dataset_id] for dataset_id in sorted(datasets)]
+
+    def get_dataset(self, project_id: str, dataset_id: str) -> Optional[Dataset]:
+        return self.project(project_id).datasets.get(dataset_id)
+
+    def put_dataset(self, project_id: str, dataset_id: str, dataset: Dataset):
+        with self.lock:
+            project = self.project(project_id)
+            project.datasets[dataset_id] = dataset
+            project.tables.setdefault(dataset_id, {})
+            self.changed(project)
+
+    def drop_dataset(self, project_id: str, dataset_id: str):
+        with self.lock:
+            project = self.project(project_id)
+            project.datasets.pop(dataset_id, None)
+            project.tables.pop(dataset_id, None)
+            self.changed(project)
+
+    def list_tables(self, project_id: str, dataset_id: str) -> list[str]:
+        return sorted(self.project(project_id).tables.get(dataset_id, {}))
+
+    def get_table(
+        self, project_id: str, dataset_id: str, table_id: str
+    ) -> Optional[Columns]:
+        return self.project(project_id).tables.get(dataset_id, {}).get(table_id)
+
+    def put_table(
+        self, project_id: str, dataset_id: str, table_id: str, columns: Columns
+    ):
+        with self.lock:
+            project = self.project(project_id)
+            project.tables.setdefault(dataset_id, {})[table_id] = columns
+            self.changed(project)
+
+    def drop_table(self, project_id: str, dataset_id: str, table_id: str):
+        with self.lock:
+            project = self.project(project_id)
+            project.tables.get(dataset_id, {}).pop(table_id, None)
+            self.changed(project)
@@ -0,0 +1,74 @@
+import threading
+from typing import Callable, Hashable, Optional
+
+from local_bigquery.settings import settings
+
+
+class _Request:
+    def __init__(self, rows: list):
+        self.rows = rows
+        self.error: Optional[Exception] = None
+
+
+class _Batch:
+    def __init__(self):
+        self.requests: list[_Request] = []
+        self.num_rows = 0
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class InsertCoalescer:
+    """
+    Groups concurrent inserts to the same table into a single commit.
+
+    The first request for a table leads the batch: it waits for the window to
+    pass (or the batch to fill), then commits every queued request at once.
+    If that commit fails, requests are retried one by one so a single bad
+    request doesn't fail its neighbours.
+    """
+
+    def __init__(self, flush: Callable[[Hashable, list], None]):
+        self.flush = flush
+        self.lock = threading.Lock()
+        self.batches: dict[Hashable, _Batch] = {}
+
+    def submit(self, key: Hashable, rows: list):
+        request = _Request(rows)
+        with self.lock:
+            batch = self.batches.get(key)
+            leader = batch is None
+            if leader:
+                batch = self.batches[key] = _Batch()
+            batch.requests.append(request)
+            batch.num_rows += len(rows)
+            if batch.num_rows >= settings.insert_coalesce_max_rows:
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(settings.insert_coalesce_window_ms / 1000)
+            with self.lock:
+                del self.batches[key]
+            try:
+                self.flush_batch(key, batch)
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if request.error is not None:
+            raise request.error
+
+    def flush_batch(self, key: Hashable, batch: _Batch):
+        try:
+            self.flush(key, [row for r in batch.requests for row in r.rows])
+            return
+        except Exception as e:
+            if len(batch.requests) == 1:
+                batch.requests[0].error = e
+                return
+        for request in batch.requests:
+            try:
+                self.flush(key, request.rows)
+            except Exception as e:
+                request.error = e
@@ -0,0 +1,94 @@
+import asyncio
+import contextlib
+import threading
+import time
+from typing import Callable, TypeVar
+
+from fastapi.concurrency import run_in_threadpool
+
+from local_bigquery.settings import settings
+
+T = TypeVar("T")
+
+# Other worker processes can't wake this one, so with several workers waiters
+# check again this often.
+CROSS_PROCESS_RECHECK_SECONDS = 1.0
+
+
+class JobCompletions:
+    """
+    Wakes requests waiting on a job once it finishes.
+
+    Waiters are futures on the event loop, so a request holding out for a
+    long-running job costs no thread. Jobs finish on worker threads, which
+    resolve the futures through their loop.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiters: dict[tuple[str, str], set[asyncio.Future]] = {}
+        self.notified = 0
+
+    @contextlib.contextmanager
+    def subscribe(self, project_id: str, job_id: str):
+        key = (project_id, job_id)
+        waiter = asyncio.get_running_loop().create_future()
+        with self.lock:
+            self.waiters.setdefault(key, set()).add(waiter)
+        try:
+            yield waiter
+        finally:
+            with self.lock:
+                waiters = self.waiters.get(key)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self.waiters[key]
+
+    def notify(self, project_id: str, job_id: str):
+        with self.lock:
+            waiters = list(self.waiters.get((project_id, job_id), ()))
+            self.notified += 1
+        for waiter in waiters:
+            waiter.get_loop().call_soon_threadsafe(self.resolve, waiter)
+
+    @staticmethod
+    def resolve(waiter: asyncio.Future):
+        if not waiter.done():
+            waiter.set_result(None)
+
+    async def wait(
+        self,
+        project_id: str,
+        job_id: str,
+        timeout_seconds: float,
+        check: Callable[[], T],
+        done: Callable[[T], bool],
+    ) -> T:
+        """
+        Calls `check` until `done` says its result is final, or the timeout
+        passes, waiting for the job to finish in between.
+        """
+        deadline = time.monotonic() + timeout_seconds
+        while True:
+            # Subscribe before checking, so a job finishing in between
+            # still wakes us.
+            with self.subscribe(project_id, job_id) as waiter:
+                value = await run_in_threadpool(check)
+                remaining = deadline - time.monotonic()
+                if done(value) or remaining <= 0:
+                    return value
+                if settings.workers > 1:
+                    remaining = min(remaining, CROSS_PROCESS_RECHECK_SECONDS)
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(waiter, remaining)
+
+    def status(self) -> dict:
+        with self.lock:
+            return {
+                "waiting": sum(len(waiters) for waiters in self.waiters.values()),
+                "notified": self.notified,
+            }
+
+
+completions = JobCompletions()
@@ -0,0 +1,160 @@
+import logging
+import threading
+
+from local_bigquery import db, jobs
+from local_bigquery.completion import completions
+from local_bigquery.db import timestamp_now
+from local_bigquery.models import ErrorProto, Job, JobStatus
+from local_bigquery.settings import settings
+
+
+class ContinuousQueries:
+    """
+    Runs continuous query jobs, each on its own thread until it's cancelled.
+
+    Every cycle runs the query over just the rows inserted into its source
+    table since the last snapshot it processed, so history is never scanned
+    again. Jobs start from the snapshot current when they're submitted, and
+    the snapshot they've reached is recorded so they resume from it after a
+    restart.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running: dict[tuple[str, str], tuple[threading.Event, threading.Thread]]
+        self.running = {}
+        self.cycles = 0
+        self.rows = 0
+
+    def start(self, project_id: str, job: Job):
+        query = job.configuration.query
+        default_dataset = query.defaultDataset
+        query_project_id = default_dataset.projectId if default_dataset else project_id
+        dataset_id = default_dataset.datasetId if default_dataset else None
+        source_project_id, _, _ = db.continuous_source(
+            query_project_id, dataset_id, query.query
+        )
+        snapshot_id = db.latest_snapshot_id(source_project_id)
+        job.statistics.startTime = timestamp_now()
+        job.status = JobStatus(state="RUNNING")
+        db.update_job(project_id, job.jobReference.jobId, job)
+        db.set_continuous_snapshot(
+            project_id, job.jobReference.jobId, source_project_id, snapshot_id
+        )
+        self.launch(project_id, job, source_project_id, snapshot_id)
+
+    def resume(self):
+        """Restarts the continuous queries left running, e.g. by a restart."""
+        for row in db.list_continuous_queries():
+            project_id, job_id, source_project_id, snapshot_id = row
+            with self.lock:
+                if (project_id, job_id) in self.running:
+                    continue
+            job = db.get_job(project_id, job_id)
+            if job is not None:
+                self.launch(project_id, job, source_project_id, snapshot_id)
+
+    def launch(
+        self, project_id: str, job: Job, source_project_id: str, snapshot_id: int
+    ):
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=self.run,
+            args=(project_id, job, source_project_id, snapshot_id, stop),
+            name=f"local-bigquery-continuous-{job.jobReference.jobId}",
+            daemon=True,
+        )
+        with self.lock:
+            self.running[(project_id, job.jobReference.jobId)] = (stop, thread)
+        thread.start()
+
+    def run(
+        self,
+        project_id: str,
+        job: Job,
+        source_project_id: str,
+        snapshot_id: int,
+        stop: threading.Event,
+    ):
+        job_id = job.jobReference.jobId
+        query = job.configuration.query
+        default_dataset = query.defaultDataset
+        try:
+            while not stop.wait(settings.continuous_query_interval_ms / 1000):
+                # Another worker may have cancelled it.
+                current = db.get_job(project_id, job_id)
+                if current is None or current.status.state == "DONE":
+                    return
+                latest = db.latest_snapshot_id(source_project_id)
+                if latest <= snapshot_id:
+                    continue
+                rows = db.run_continuous_query(
+                    default_dataset.projectId if default_dataset else project_id,
+                    default_dataset.datasetId if default_dataset else None,
+                    query.query,
+                    snapshot_id + 1,
+                    latest,
+                    parameters=query.queryParameters,
+                )
+                snapshot_id = latest
+                db.set_continuous_snapshot(
+                    project_id, job_id, source_project_id, snapshot_id
+                )
+                with self.lock:
+                    self.cycles += 1
+                    self.rows += rows
+        except Exception as e:
+            logging.exception(f"Continuous job {project_id}:{job_id}")
+            if not stop.is_set():
+                job.statistics.endTime = timestamp_now()
+                job.status = JobStatus(
+                    state="DONE",
+                    errorResult=ErrorProto(reason=jobs.error_reason(e), message=str(e)),
+                )
+                db.update_job(project_id, job_id, job)
+                completions.notify(project_id, job_id)
+        finally:
+            with self.lock:
+                running = self.running.get((project_id, job_id))
+                if running is not None and running[0] is stop:
+                    del self.running[(project_id, job_id)]
+
+    def cancel(self, project_id: str, job: Job) -> Job:
+        """Stops a continuous job, marking it done as BigQuery does."""
+        job_id = job.jobReference.jobId
+        with self.lock:
+            running = self.running.pop((project_id, job_id), None)
+        if running is not None:
+            running[0].set()
+        job.statistics.endTime = timestamp_now()
+        job.status = JobStatus(
+            state="DONE",
+            errorResult=ErrorProto(
+                reason="stopped",
+                message="Job execution was cancelled: User requested cancellation",
+            ),
+        )
+        db.update_job(project_id, job_id, job)
+        completions.notify(project_id, job_id)
+        return job
+
+    def stop(self):
+        """Stops every thread, leaving their jobs running to be resumed."""
+        with self.lock:
+            running = list(self.running.values())
+            self.running.clear()
+        for stop, _ in running:
+            stop.set()
+        for _, thread in running:
+            thread.join()
+
+    def status(self) -> dict:
+        with self.lock:
+            return {
+                "running": len(self.running),
+                "cycles": self.cycles,
+                "rows": self.rows,
+            }
+
+
+continuous_queries = ContinuousQueries()
@@ -1,18 +1,45 @@
+import base64
 import contextlib
 import functools
 import inspect
-from datetime import datetime
+import itertools
+import json
+import os
+import pathlib
+import shutil
+import sqlite3
+import threading
+from datetime import datetime, timezone
 from functools import lru_cache
 from typing import Optional
 
 import duckdb
+import psycopg2
 import sqlglot
+from duckdb.typing import DuckDBPyType
 from py_mini_racer import MiniRacer
 
-from local_bigquery.errors import NotFoundError, AlreadyExistsError
+from local_bigquery import metadata, reservations, workers
+from local_bigquery.catalog import Catalog
+from local_bigquery.coalesce import InsertCoalescer
+from local_bigquery.errors import (
+    NotFoundError,
+    AlreadyExistsError,
+    InvalidError,
+    JobTimeoutError,
+)
+from local_bigquery.pool import CursorPool
+from local_bigquery.reservations import Budget
+from local_bigquery.singleflight import SingleFlight
+from local_bigquery.watchdog import watchdog
 from local_bigquery.models import (
     GetQueryResultsResponse,
     Job,
+    Job1,
+    Table,
+    TableDataList,
+    TableFieldSchema,
+    TableReference,
     QueryParameter,
     Row1,
     TableSchema,
@@ -28,13 +55,21 @@ from local_bigquery.models import (
 from local_bigquery.settings import settings
 from local_bigquery.transform import (
     bigquery_schema_to_sql,
+    field_type_to_sql,
+    quote_identifier,
     fill_missing_fields,
     bigquery_params_to_duckdb_params,
     duckdb_values_to_bigquery_values,
+    duckdb_field_to_bigquery_field,
     duckdb_fields_to_bigquery_fields,
+    field_to_type_name,
 )
 
 
+RESULTS_DATASET_ID = "_query_results"
+MAX_LIST_RESULTS = 1000
+
+
 def strip_quotes(value: Optional[str]) -> Optional[str]:
     if not value:
         return None
@@ -53,41 +88,166 @@ def build_table_name(
 
 
 def attach_project(conn, project):
-    metadata = settings.data_dir / f"{project}.ducklake"
     data_path = settings.data_dir / f"{project}"
+    if settings.ducklake_catalog:
+        # A shared catalog database keeps each project in a schema of its own.
+        conn.execute(
+            f"ATTACH IF NOT EXISTS 'ducklake:{settings.ducklake_catalog}' "
+            f"AS \"{project}\" (DATA_PATH '{data_path}', METADATA_SCHEMA '{project}')"
+        )
+        return
+    metadata = settings.data_dir / f"{project}.ducklake"
     conn.execute(
         f"ATTACH IF NOT EXISTS 'ducklake:sqlite:{metadata}' AS \"{project}\" (DATA_PATH '{data_path}')"
     )
 
 
+def find_projects() -> set[str]:
+    """Lists the projects that already have a DuckLake catalog."""
+    if not settings.ducklake_catalog:
+        return {project.stem for project in settings.data_dir.glob("*.ducklake")}
+    conn = psycopg2.connect(settings.ducklake_catalog.removeprefix("postgres:"))
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT schemaname FROM pg_tables WHERE tablename = 'ducklake_metadata'"
+            )
+            return {row[0] for row in cur.fetchall()}
+    finally:
+        conn.close()
+
+
+def temp_directory_root() -> pathlib.Path:
+    if settings.temp_directory:
+        return pathlib.Path(settings.temp_directory)
+    return settings.data_dir / "tmp"
+
+
+temp_directories = itertools.count()
+
+
+def connect(budget: Budget = Budget()):
+    """
+    Opens a DuckDB instance, with the server's resource settings unless the
+    budget overrides them.
+
+    Each instance spills to a directory of its own under the temp directory,
+    since instances can't share one.
+    """
+    conn = duckdb.connect()
+    threads = budget.threads or settings.threads
+    memory_limit = budget.memory_limit or settings.memory_limit
+    max_temp_directory_size = (
+        budget.max_temp_directory_size or settings.max_temp_directory_size
+    )
+    temp_directory = temp_directory_root() / f"{os.getpid()}-{next(temp_directories)}"
+    # DuckDB creates the directory when it first spills, but not its parents.
+    temp_directory.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        if threads > 0:
+            conn.execute(f"SET threads = {threads}")
+        if memory_limit:
+            conn.execute(f"SET memory_limit = {sql_literal(memory_limit)}")
+        conn.execute(f"SET temp_directory = {sql_literal(str(temp_directory))}")
+        if max_temp_directory_size:
+            size = sql_literal(max_temp_directory_size)
+            conn.execute(f"SET max_temp_directory_size = {size}")
+    except duckdb.Error as e:
+        conn.close()
+        raise InvalidError(f"Invalid resource settings: {e}")
+    return conn
+
+
+def clean_temp_directories():
+    """Deletes the spill directories of processes that have since died."""
+    root = temp_directory_root()
+    if not root.is_dir():
+        return
+    for item in root.iterdir():
+        pid = item.name.split("-", 1)[0]
+        if not pid.isdigit():
+            continue
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            shutil.rmtree(item, ignore_errors=True)
+        except PermissionError:
+            pass
+
+
 @lru_cache(maxsize=None)
 def get_default_connection():
-    settings.data_dir.mkdir(parents=True, exist_ok=True)
-    found_projects = {project.stem for project in settings.data_dir.glob("*.ducklake")}
-    projects = found_projects | {
-        settings.default_project_id,
-        settings.internal_project_id,
-    }
-    conn = duckdb.connect()
-    conn.execute("INSTALL ducklake;")
-    conn.execute("INSTALL sqlite;")
-    for project in projects:
-        attach_project(conn, project)
-        if project not in found_projects:
-            if project == settings.internal_project_id:
-                migrate(conn)
-            if project == settings.default_project_id:
-                dataset = (
-                    f'"{settings.default_project_id}"."{settings.default_dataset_id}"'
-                )
-                conn.execute(f"CREATE SCHEMA IF NOT EXISTS {dataset}")
+    # Workers sharing DATA_DIR initialise the catalogs one at a time.
+    with workers.exclusive("init"):
+        settings.data_dir.mkdir(parents=True, exist_ok=True)
+        clean_temp_directories()
+        found_projects = find_projects()
+        projects = found_projects | {
+            settings.default_project_id,
+            settings.internal_project_id,
+        }
+        conn = connect()
+        conn.execute("INSTALL ducklake;")
+        conn.execute("INSTALL sqlite;")
+        if settings.ducklake_catalog.startswith("postgres:"):
+            conn.execute("INSTALL postgres;")
+        for project in projects:
+            attach_project(conn, project)
+            if project == settings.internal_project_id and project in found_projects:
+                metadata.import_legacy(conn, project, settings.internal_dataset_id)
+            if project not in found_projects:
+                if project == settings.default_project_id:
+                    dataset = f'"{settings.default_project_id}"."{settings.default_dataset_id}"'
+                    conn.execute(f"CREATE SCHEMA IF NOT EXISTS {dataset}")
     return conn
 
 
 @lru_cache(maxsize=None)
 def get_default_connection_with_project(project_id: Optional[str] = None):
     conn = get_default_connection()
-    attach_project(conn, project_id)
+    with workers.exclusive("init"):
+        attach_project(conn, project_id)
+    return conn
+
+
+@lru_cache(maxsize=None)
+def get_project_connection(project_id: str):
+    """
+    Opens the DuckDB instance a project's cursors come from.
+
+    With `pool_instance_per_project`, each project gets an instance of its
+    own, so projects don't contend on one instance's locks. Every project is
+    still attached to it, so queries can reach across projects.
+    """
+    if not settings.pool_instance_per_project:
+        return get_default_connection_with_project(project_id)
+    get_default_connection()
+    conn = connect()
+    with workers.exclusive("init"):
+        for project in find_projects() | {project_id}:
+            attach_project(conn, project)
+    return conn
+
+
+@lru_cache(maxsize=None)
+def get_budget_connection(budget: Budget):
+    """
+    Opens a DuckDB instance for jobs with a budget, since DuckDB's thread and
+    memory limits apply to a whole instance. Jobs with the same budget share it.
+    """
+    get_default_connection()
+    conn = connect(budget)
+    with workers.exclusive("init"):
+        for project in find_projects():
+            attach_project(conn, project)
+    return conn
+
+
+@lru_cache(maxsize=None)
+def get_budget_project_connection(budget: Budget, project_id: str):
+    conn = get_budget_connection(budget)
+    with workers.exclusive("init"):
+        attach_project(conn, project_id)
     return conn
 
 
@@ -97,75 +257,105 @@ def reset():
         if item.is_file() or item.is_symlink():
             item.unlink()
         elif item.is_dir():
-            for sub_item in item.iterdir():
-                sub_item.unlink()
-            item.rmdir()
+            shutil.rmtree(item)
+    temp_directory_root().mkdir(parents=True, exist_ok=True)
+    metadata.reset()
+    catalog.invalidate()
+    pool.clear()
+    with budget_pools_lock:
+        cursor_pools = list(budget_pools.values())
+    for cursors in cursor_pools:
+        cursors.clear()
+
+
+class ActiveCursors:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.count += 1
+
+    def __exit__(self, *exc):
+        with self.lock:
+            self.count -= 1
+
+
+active_cursors = ActiveCursors()
+pool = CursorPool(
+    get_project_connection,
+    settings.pool_size_per_project,
+    settings.pool_checkout_timeout_seconds,
+)
+budget_pools: dict[Budget, CursorPool] = {}
+budget_pools_lock = threading.Lock()
+
+
+def budget_pool(budget: Budget) -> CursorPool:
+    """
+    The cursor pool for a budget. Budgets from connection properties are
+    capped, since each one keeps a DuckDB instance open for good.
+    """
+    with budget_pools_lock:
+        cursors = budget_pools.get(budget)
+        if cursors is None:
+            reserved = {reservations.budget(name) for name in settings.reservations}
+            overridden = [other for other in budget_pools if other not in reserved]
+            if budget not in reserved and len(overridden) >= settings.max_job_budgets:
+                raise InvalidError(
+                    f"Too many distinct resource budgets: at most "
+                    f"{settings.max_job_budgets} sets of connection properties "
+                    "can override the server's resource settings"
+                )
+            cursors = budget_pools[budget] = CursorPool(
+                functools.partial(get_budget_project_connection, budget),
+                settings.pool_size_per_project,
+                settings.pool_checkout_timeout_seconds,
+            )
+        return cursors
 
 
 @contextlib.contextmanager
-def cursor(project_id: Optional[str] = None, dataset_id: Optional[str] = None):
+def cursor(
+    project_id: Optional[str] = None,
+    dataset_id: Optional[str] = None,
+    budget: Optional[Budget] = None,
+):
     project_id = strip_quotes(project_id)
     dataset_id = strip_quotes(dataset_id or "main")
-    conn = get_default_connection_with_project(project_id)
-    cur = conn.cursor()
-    try:
-        cur.execute(f'USE "{project_id}"."{dataset_id}"')
-    except duckdb.CatalogException:
-        cur.execute(f'USE "{project_id}"."main"')
-    try:
+    cursors = budget_pool(budget) if budget else pool
+    with cursors.cursor(project_id, dataset_id) as cur, active_cursors:
         yield cur
         cur.commit()
-    finally:
-        cur.close()
 
 
-@contextlib.contextmanager
-def internal_cursor():
-    with cursor(settings.internal_project_id, settings.internal_dataset_id) as cur:
-        yield cur
+def mark_dirty(cur):
+    """Stops a cursor from being reused, whichever pool it came from."""
+    pool.mark_dirty(cur)
+    with budget_pools_lock:
+        cursor_pools = list(budget_pools.values())
+    for cursors in cursor_pools:
+        cursors.mark_dirty(cur)
 
 
-def migrate(conn):
-    dataset = f'"{settings.internal_project_id}"."{settings.internal_dataset_id}"'
-    conn.execute(f"CREATE SCHEMA IF NOT EXISTS {dataset}")
-    conn.execute(f"USE {dataset}")
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS datasets (
-            project_id TEXT,
-            dataset_id TEXT,
-            item JSON
-        );
-        CREATE TABLE IF NOT EXISTS models (
-            project_id TEXT,
-            dataset_id TEXT,
-            model_id TEXT,
-            item JSON
-        );
-        CREATE TABLE IF NOT EXISTS routines (
-            project_id TEXT,
-            dataset_id TEXT,
-            routine_id TEXT,
-            item JSON
-        );
-        CREATE TABLE IF NOT EXISTS tables (
-            project_id TEXT,
-            dataset_id TEXT,
-            table_id TEXT,
-            item JSON
-        );
-        CREATE TABLE IF NOT EXISTS jobs (
-            project_id TEXT,
-            job_id TEXT,
-            item JSON
-        );
-        CREATE TABLE IF NOT EXISTS query_results (
-            project_id TEXT,
-            job_id TEXT,
-            item JSON
-        );
-        """
-    )
+@contextlib.contextmanager
+def interrupt_after(cur, timeout_seconds: Optional[float]):
+    """Interrupts whatever the cursor is running once the timeout passes."""
+    if timeout_seconds is None:
+        yield
+        return
+    deadline = watchdog.watch(timeout_seconds, cur.interrupt)
+    try:
+        yield
+    except duckdb.InterruptException:
+        if deadline.fired:
+            raise JobTimeoutError(
+                f"Job execution was cancelled: Job timed out after {timeout_seconds}s"
+            )
+        raise
+    finally:
+        watchdog.cancel(deadline)
 
 
 @contextlib.contextmanager
@@ -207,64 +397,142 @@ def list_projects():
     ]
 
 
-def timestamp_now() -> str:
-    return str(int(datetime.now().timestamp()))
+def list_attached_projects() -> list[str]:
+    with cursor(settings.default_project_id, settings.default_dataset_id) as cur:
+        results = cur.sql(
+            "SELECT database_name FROM duckdb_databases() WHERE type = 'ducklake'"
+        )
+        return sorted(row[0] for row in results.fetchall())
 
 
-def list_datasets(project_id):
+def metadata_catalog_name(project_id: str) -> str:
+    if settings.ducklake_catalog:
+        return f'"__ducklake_metadata_{project_id}"."{project_id}"'
+    return f'"__ducklake_metadata_{project_id}"'
+
+
+def list_table_file_stats(project_id: str) -> list[dict]:
     project_id = strip_quotes(project_id)
-    with cursor(project_id, settings.default_dataset_id) as cur:
-        cur.execute(
+    lake = metadata_catalog_name(project_id)
+    with cursor(project_id) as cur:
+        results = cur.sql(
+            f"""
+                SELECT
+                    s.schema_name AS dataset_id,
+                    t.table_name AS table_id,
+                    count(f.data_file_id) AS file_count,
+                    coalesce(sum(f.file_size_bytes), 0) AS file_size_bytes
+                FROM {lake}.ducklake_table t
+                JOIN {lake}.ducklake_schema s
+                    ON s.schema_id = t.schema_id AND s.end_snapshot IS NULL
+                LEFT JOIN {lake}.ducklake_data_file f
+                    ON f.table_id = t.table_id AND f.end_snapshot IS NULL
+                WHERE t.end_snapshot IS NULL
+                GROUP BY ALL
             """
-                SELECT schema_name
-                FROM duckdb_schemas
-                WHERE database_name = $project_id
-            """,
-            {"project_id": project_id},
         )
-        dataset_ids = sorted([row[0] for row in cur.fetchall()])
-    return [get_dataset(project_id, dataset_id) for dataset_id in dataset_ids]
+        return [dict(zip(results.columns, row)) for row in results.fetchall()]
 
 
-def get_internal_dataset(project_id: str, dataset_id: str) -> Optional[Dataset]:
+def merge_table_files(project_id: str, dataset_id: str, table_id: str):
     project_id = strip_quotes(project_id)
     dataset_id = strip_quotes(dataset_id)
-    with internal_cursor() as cur:
+    table_id = strip_quotes(table_id)
+    with cursor(project_id, dataset_id) as cur:
+        cur.execute(
+            "CALL ducklake_merge_adjacent_files($project_id, $table_id, schema => $dataset_id)",
+            {"project_id": project_id, "dataset_id": dataset_id, "table_id": table_id},
+        )
+
+
+def expire_snapshots(project_id: str, max_age_seconds: int, max_count: int) -> int:
+    project_id = strip_quotes(project_id)
+    # Running continuous queries still have to read what's after their snapshot.
+    keep_from = min(
+        (
+            snapshot_id
+            for _, _, source_project_id, snapshot_id in list_continuous_queries()
+            if source_project_id == project_id
+        ),
+        default=None,
+    )
+    with cursor(project_id) as cur:
         cur.execute(
             """
-                SELECT item
-                FROM datasets
-                WHERE project_id = $project_id AND dataset_id = $dataset_id
+                SELECT snapshot_id
+                FROM (
+                    SELECT
+                        snapshot_id,
+                        snapshot_time,
+                        row_number() OVER (ORDER BY snapshot_id DESC) AS rank
+                    FROM ducklake_snapshots($project_id)
+                )
+                WHERE rank > 1 AND (
+                    ($max_age_seconds > 0
+                        AND snapshot_time < now() - to_seconds($max_age_seconds))
+                    OR ($max_count > 0 AND rank > $max_count)
+                ) AND ($keep_from::BIGINT IS NULL OR snapshot_id < $keep_from)
             """,
-            {"project_id": project_id, "dataset_id": dataset_id},
+            {
+                "project_id": project_id,
+                "max_age_seconds": max_age_seconds,
+                "max_count": max_count,
+                "keep_from": keep_from,
+            },
         )
-        row = cur.fetchone()
-        if row is None:
-            return None
-        item = row[0]
-    return Dataset.model_validate_json(item, by_alias=True)
+        versions = [row[0] for row in cur.fetchall()]
+        if versions:
+            cur.execute(
+                "CALL ducklake_expire_snapshots($project_id, versions => $versions)",
+                {"project_id": project_id, "versions": versions},
+            )
+    return len(versions)
 
 
-def get_dataset(project_id: str, dataset_id: str) -> Optional[Dataset]:
+def cleanup_old_files(project_id: str) -> int:
     project_id = strip_quotes(project_id)
-    dataset_id = strip_quotes(dataset_id)
-    with cursor(project_id, settings.default_dataset_id) as cur:
+    with cursor(project_id) as cur:
+        cur.execute(
+            "CALL ducklake_cleanup_old_files($project_id, cleanup_all => true)",
+            {"project_id": project_id},
+        )
+        return len(cur.fetchall())
+
+
+def delete_orphaned_files(project_id: str, min_age_seconds: int) -> int:
+    project_id = strip_quotes(project_id)
+    with cursor(project_id) as cur:
         cur.execute(
             """
-                SELECT schema_name
-                FROM duckdb_schemas
-                WHERE database_name = $project_id AND schema_name = $dataset_id
+                CALL ducklake_delete_orphaned_files(
+                    $project_id,
+                    older_than => now() - to_seconds($min_age_seconds)
+                )
             """,
-            {"project_id": project_id, "dataset_id": dataset_id},
-        )
-        found = cur.fetchone()
-        if not found:
-            return None
-    dataset = get_internal_dataset(project_id, dataset_id)
-    if dataset is not None:
-        return dataset
+            {"project_id": project_id, "min_age_seconds": min_age_seconds},
+        )
+        return len(cur.fetchall())
+
+
+def vacuum_catalog(project_id: str):
+    if settings.ducklake_catalog:
+        # Shared catalog databases are vacuumed by their own server.
+        return
+    project_id = strip_quotes(project_id)
+    conn = sqlite3.connect(settings.data_dir / f"{project_id}.ducklake", timeout=30)
+    try:
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+def timestamp_now() -> str:
+    return str(int(datetime.now().timestamp()))
+
+
+def default_dataset(project_id: str, dataset_id: str) -> Dataset:
     now = timestamp_now()
-    dataset = Dataset(
+    return Dataset(
         creationTime=now,
         datasetReference=DatasetReference(
             datasetId=dataset_id,
@@ -282,8 +550,102 @@ def get_dataset(project_id: str, dataset_id: str) -> Optional[Dataset]:
         storageBillingModel=StorageBillingModel.LOGICAL,
         type="DEFAULT",
     )
-    create_internal_dataset(project_id, dataset_id, dataset)
-    return dataset
+
+
+def load_catalog(project_id: str):
+    """Reads a project's datasets and table columns for the catalog cache."""
+    with cursor(project_id, settings.default_dataset_id) as cur:
+        cur.execute(
+            """
+                SELECT schema_name
+                FROM duckdb_schemas
+                WHERE database_name = $project_id
+            """,
+            {"project_id": project_id},
+        )
+        dataset_ids = [row[0] for row in cur.fetchall()]
+        cur.execute(
+            """
+                SELECT schema_name, table_name, column_name, data_type, is_nullable
+                FROM duckdb_columns()
+                WHERE database_name = $project_id
+                ORDER BY schema_name, table_name, column_index
+            """,
+            {"project_id": project_id},
+        )
+        tables = {}
+        for dataset_id, table_id, *column in cur.fetchall():
+            dataset_tables = tables.setdefault(dataset_id, {})
+            dataset_tables.setdefault(table_id, []).append(tuple(column))
+    rows = (
+        metadata.connection()
+        .execute(
+            "SELECT dataset_id, item FROM datasets WHERE project_id = ?",
+            (project_id,),
+        )
+        .fetchall()
+    )
+    stored = {
+        dataset_id: Dataset.model_validate_json(item, by_alias=True)
+        for dataset_id, item in rows
+    }
+    datasets = {
+        dataset_id: stored.get(dataset_id) or default_dataset(project_id, dataset_id)
+        for dataset_id in dataset_ids
+    }
+    return datasets, tables
+
+
+def shared_catalog_version() -> Optional[int]:
+    # Other workers can change the catalog, so its version is kept in the
+    # metadata store they share.
+    if settings.workers <= 1:
+        return None
+    return metadata.catalog_version()
+
+
+def bump_shared_catalog_version() -> Optional[int]:
+    if settings.workers <= 1:
+        return None
+    return metadata.bump_catalog_version()
+
+
+catalog = Catalog(load_catalog, shared_catalog_version, bump_shared_catalog_version)
+
+
+def warm_catalog():
+    for project_id in list_attached_projects():
+        catalog.project(project_id)
+        dataset_id = "main"
+        if project_id == settings.default_project_id:
+            dataset_id = settings.default_dataset_id
+        pool.warm(project_id, dataset_id, settings.pool_warm_cursors)
+
+
+def table_columns(cur, project_id: str, dataset_id: str, table_id: str):
+    cur.execute(
+        """
+            SELECT column_name, data_type, is_nullable
+            FROM duckdb_columns()
+            WHERE database_name = $project_id
+                AND schema_name = $dataset_id
+                AND table_name = $table_id
+            ORDER BY column_index
+        """,
+        {"project_id": project_id, "dataset_id": dataset_id, "table_id": table_id},
+    )
+    return cur.fetchall()
+
+
+def list_datasets(project_id):
+    project_id = strip_quotes(project_id)
+    return catalog.list_datasets(project_id)
+
+
+def get_dataset(project_id: str, dataset_id: str) -> Optional[Dataset]:
+    project_id = strip_quotes(project_id)
+    dataset_id = strip_quotes(dataset_id)
+    return catalog.get_dataset(project_id, dataset_id)
 
 
 def delete_dataset(project_id, dataset_id):
@@ -293,30 +655,35 @@ def delete_dataset(project_id, dataset_id):
         duckdb_sql = f'DROP SCHEMA "{project_id}"."{dataset_id}" CASCADE'
         with debug_sql(duckdb_sql=duckdb_sql):
             cur.sql(duckdb_sql)
-    with internal_cursor() as cur:
-        cur.execute(
+    with metadata.transaction() as conn:
+        conn.execute(
             """
             DELETE FROM datasets
-            WHERE project_id = $project_id AND dataset_id = $dataset_id
+            WHERE project_id = ? AND dataset_id = ?
             """,
-            {"project_id": project_id, "dataset_id": dataset_id},
+            (project_id, dataset_id),
+        )
+        conn.execute(
+            "DELETE FROM tables WHERE project_id = ? AND dataset_id = ?",
+            (project_id, dataset_id),
         )
+    catalog.drop_dataset(project_id, dataset_id)
 
 
 def create_internal_dataset(project_id: str, dataset_id: str, dataset: Dataset):
     project_id = strip_quotes(project_id)
     dataset_id = strip_quotes(dataset_id)
-    with internal_cursor() as cur:
-        cur.execute(
+    with metadata.transaction() as conn:
+        conn.execute(
             """
-                INSERT INTO datasets (project_id, dataset_id, item)
-                VALUES ($project_id, $dataset_id, $item)
+                INSERT OR REPLACE INTO datasets (project_id, dataset_id, item)
+                VALUES (?, ?, ?)
             """,
-            {
-                "project_id": project_id,
-                "dataset_id": dataset_id,
-                "item": dataset.model_dump_json(exclude_unset=True, by_alias=True),
-            },
+            (
+                project_id,
+                dataset_id,
+                dataset.model_dump_json(exclude_unset=True, by_alias=True),
+            ),
         )
 
 
@@ -330,6 +697,7 @@ def create_dataset(project_id, dataset_id, dataset: Dataset) -> Dataset:
         duckdb_sql = f'CREATE SCHEMA "{project_id}"."{dataset_id}"'
         with debug_sql(duckdb_sql=duckdb_sql):
             cur.sql(duckdb_sql)
+    catalog.put_dataset(project_id, dataset_id, dataset)
     return dataset
 
 
@@ -338,28 +706,15 @@ def update_dataset(project_id, dataset_id, dataset: Dataset) -> Dataset:
     dataset_id = strip_quotes(dataset_id)
     if not get_dataset(project_id, dataset_id):
         raise NotFoundError(f"Dataset {dataset_id} does not exist")
-    with internal_cursor() as cur:
-        cur.execute(
-            """
-                UPDATE datasets
-                SET item = $item
-                WHERE project_id = $project_id AND dataset_id = $dataset_id
-            """,
-            {
-                "project_id": project_id,
-                "dataset_id": dataset_id,
-                "item": dataset.model_dump_json(exclude_unset=True, by_alias=True),
-            },
-        )
+    create_internal_dataset(project_id, dataset_id, dataset)
+    catalog.put_dataset(project_id, dataset_id, dataset)
     return dataset
 
 
 def list_tables(project_id, dataset_id: Optional[str] = None) -> list[str]:
     project_id = strip_quotes(project_id)
-    dataset_id = strip_quotes(dataset_id)
-    with cursor(project_id, dataset_id) as cur:
-        result = cur.sql("SHOW TABLES")
-        return [table_name for table_name, *_ in result.fetchall()]
+    dataset_id = strip_quotes(dataset_id or "main")
+    return catalog.list_tables(project_id, dataset_id)
 
 
 def delete_table(project_id, dataset_id, table_id):
@@ -368,101 +723,805 @@ def delete_table(project_id, dataset_id, table_id):
         duckdb_sql = f"DROP TABLE {table_name}"
         with debug_sql(duckdb_sql=duckdb_sql):
             cur.sql(duckdb_sql)
+    project_id, dataset_id, table_id = map(
+        strip_quotes, (project_id, dataset_id, table_id)
+    )
+    set_table_resource(project_id, dataset_id, table_id, None)
+    catalog.drop_table(project_id, dataset_id, table_id)
 
 
-def create_table(project_id, dataset_id, table_id, schema: TableSchema):
+def create_table(
+    project_id,
+    dataset_id,
+    table_id,
+    schema: TableSchema,
+    resource: Optional[Table] = None,
+):
+    project_id = strip_quotes(project_id)
+    dataset_id = strip_quotes(dataset_id)
+    table_id = strip_quotes(table_id)
     table_name = build_table_name(project_id, dataset_id, table_id)
     with cursor(project_id, dataset_id) as cur:
         bq_sql = bigquery_schema_to_sql(schema.fields, table_name)
         duckdb_sql = sqlglot.transpile(bq_sql, read="bigquery", write="duckdb")[0]
         with debug_sql(bq_sql=bq_sql, duckdb_sql=duckdb_sql):
             cur.sql(duckdb_sql)
+        columns = table_columns(cur, project_id, dataset_id, table_id)
+    set_table_resource(project_id, dataset_id, table_id, resource)
+    catalog.put_table(project_id, dataset_id, table_id, columns)
+
+
+# Table fields derived from the live table rather than stored.
+COMPUTED_TABLE_FIELDS = {
+    "creationTime",
+    "etag",
+    "id",
+    "kind",
+    "lastModifiedTime",
+    "location",
+    "numBytes",
+    "numPhysicalBytes",
+    "numRows",
+    "selfLink",
+    "tableReference",
+    "type",
+}
+
+# Schema field attributes kept from the stored resource.
+STORED_FIELD_ATTRIBUTES = (
+    "collation",
+    "defaultValueExpression",
+    "description",
+    "maxLength",
+    "policyTags",
+    "precision",
+    "scale",
+)
 
+# Names BigQuery accepts for the same type.
+BIGQUERY_TYPE_ALIASES = {
+    "INT64": "INTEGER",
+    "FLOAT64": "FLOAT",
+    "BOOL": "BOOLEAN",
+    "STRUCT": "RECORD",
+}
+
+# Types duckdb_fields_to_bigquery_fields can't tell apart from another.
+REPORTED_TYPES = {
+    "NUMERIC": "FLOAT",
+    "BIGNUMERIC": "FLOAT",
+    "DATETIME": "TIMESTAMP",
+}
+
+
+def get_table_resource(project_id: str, dataset_id: str, table_id: str) -> dict:
+    row = (
+        metadata.connection()
+        .execute(
+            """
+                SELECT item
+                FROM tables
+                WHERE project_id = ? AND dataset_id = ? AND table_id = ?
+            """,
+            (project_id, dataset_id, table_id),
+        )
+        .fetchone()
+    )
+    return json.loads(row[0]) if row else {}
 
-def create_job(project_id: str, job_id: str, job: Job) -> Job:
-    project_id = strip_quotes(project_id)
-    job_id = strip_quotes(job_id)
-    if get_job(project_id, job_id):
-        raise AlreadyExistsError(f"Job {job_id} already exists")
-    with internal_cursor() as cur:
-        cur.sql(
+
+def set_table_resource(
+    project_id: str, dataset_id: str, table_id: str, resource: Optional[Table]
+):
+    with metadata.transaction() as conn:
+        if resource is None:
+            conn.execute(
+                """
+                    DELETE FROM tables
+                    WHERE project_id = ? AND dataset_id = ? AND table_id = ?
+                """,
+                (project_id, dataset_id, table_id),
+            )
+            return
+        conn.execute(
             """
-                INSERT INTO jobs (project_id, job_id, item)
-                VALUES ($project_id, $job_id, $item)
+                INSERT OR REPLACE INTO tables (project_id, dataset_id, table_id, item)
+                VALUES (?, ?, ?, ?)
             """,
-            params={
-                "project_id": project_id,
-                "job_id": job_id,
-                "item": job.model_dump_json(exclude_unset=True, by_alias=True),
-            },
+            (
+                project_id,
+                dataset_id,
+                table_id,
+                resource.model_dump_json(
+                    exclude_unset=True, by_alias=True, exclude=COMPUTED_TABLE_FIELDS
+                ),
+            ),
+        )
+
+
+def annotate_fields(fields: list[TableFieldSchema], stored: list[dict]):
+    """Copies descriptions, policy tags etc. from stored schema fields."""
+    stored_by_name = {field.get("name"): field for field in stored}
+    for field in fields:
+        stored_field = stored_by_name.get(field.name)
+        if stored_field is None:
+            continue
+        for attribute in STORED_FIELD_ATTRIBUTES:
+            if attribute in stored_field:
+                setattr(field, attribute, stored_field[attribute])
+        if field.fields:
+            annotate_fields(field.fields, stored_field.get("fields") or [])
+
+
+def normalise_type(bigquery_type: Optional[str]) -> str:
+    bigquery_type = (bigquery_type or "STRING").upper()
+    return BIGQUERY_TYPE_ALIASES.get(bigquery_type, bigquery_type)
+
+
+def reported_type(bigquery_type: Optional[str]) -> str:
+    bigquery_type = normalise_type(bigquery_type)
+    return REPORTED_TYPES.get(bigquery_type, bigquery_type)
+
+
+def declare_fields(fields: list[TableFieldSchema], stored: list[dict], nested=False):
+    """
+    Restores the types (and, for nested fields, modes) a table was declared
+    with, which the live table reports less precisely, e.g. NUMERIC as FLOAT.
+    A stored type is only trusted while it still matches the live column.
+    """
+    stored_by_name = {field.get("name"): field for field in stored}
+    for field in fields:
+        stored_field = stored_by_name.get(field.name)
+        if stored_field is None:
+            continue
+        stored_type = stored_field.get("type")
+        if stored_type and reported_type(stored_type) == reported_type(field.type):
+            field.type = stored_type
+        # DuckDB doesn't enforce REQUIRED inside structs, so only the
+        # resource knows which nested fields were declared so.
+        if nested and stored_field.get("mode") in ("NULLABLE", "REQUIRED"):
+            if (field.mode or "NULLABLE") == "NULLABLE":
+                field.mode = stored_field["mode"]
+        if field.fields:
+            declare_fields(field.fields, stored_field.get("fields") or [], True)
+
+
+def evolve_schema(
+    cur,
+    table_name: str,
+    current: list[TableFieldSchema],
+    requested: list[TableFieldSchema],
+):
+    """
+    Applies the schema changes BigQuery allows in place, adding NULLABLE or
+    REPEATED columns and relaxing REQUIRED columns, as metadata-only ALTERs.
+    Nested fields inside RECORDs evolve the same way.
+    """
+    statements: list[str] = []
+    evolve_fields(table_name, [], [], current, requested, statements)
+    for duckdb_sql in statements:
+        with debug_sql(duckdb_sql=duckdb_sql):
+            cur.execute(duckdb_sql)
+
+
+def evolve_fields(
+    table_name: str,
+    names: list[str],
+    path: list[str],
+    current: list[TableFieldSchema],
+    requested: list[TableFieldSchema],
+    statements: list[str],
+):
+    """
+    Checks one level of a schema change, adding the ALTERs it needs. `names`
+    are the enclosing fields, and `path` the column path DuckDB knows them by.
+    """
+    requested_by_name = {field.name: field for field in requested}
+    current_by_name = {field.name: field for field in current}
+    mismatch = f"Provided Schema does not match Table {table_name}."
+    for field in current:
+        if field.name not in requested_by_name:
+            name = ".".join([*names, field.name])
+            raise InvalidError(f"{mismatch} Field {name} is missing in new schema")
+    for field in requested:
+        name = ".".join([*names, field.name])
+        column = ".".join(
+            sqlglot.exp.to_identifier(part, quoted=True).sql("duckdb")
+            for part in [*path, field.name]
+        )
+        mode = field.mode or "NULLABLE"
+        existing = current_by_name.get(field.name)
+        if existing is None:
+            if mode == "REQUIRED":
+                raise InvalidError(f"{mismatch} Cannot add required field {name}")
+            data_type = sqlglot.exp.DataType.build(
+                field_type_to_sql(field), dialect="bigquery"
+            ).sql("duckdb")
+            statements.append(
+                f"ALTER TABLE {table_name} ADD COLUMN {column} {data_type}"
+            )
+            continue
+        if normalise_type(field.type) != normalise_type(existing.type):
+            raise InvalidError(
+                f"{mismatch} Field {name} has changed type "
+                f"from {existing.type} to {field.type}"
+            )
+        existing_mode = existing.mode or "NULLABLE"
+        if mode != existing_mode:
+            if existing_mode != "REQUIRED" or mode != "NULLABLE":
+                raise InvalidError(
+                    f"{mismatch} Field {name} has changed mode "
+                    f"from {existing_mode} to {mode}"
+                )
+            if not path:
+                statements.append(
+                    f"ALTER TABLE {table_name} ALTER COLUMN {column} DROP NOT NULL"
+                )
+        if normalise_type(field.type) == "RECORD":
+            # The fields of a repeated record are those of its elements.
+            element = [field.name, "element"] if mode == "REPEATED" else [field.name]
+            evolve_fields(
+                table_name,
+                [*names, field.name],
+                [*path, *element],
+                existing.fields or [],
+                field.fields or [],
+                statements,
+            )
+
+
+def update_table(
+    project_id: str,
+    dataset_id: str,
+    table_id: str,
+    table: Table,
+    replace: bool = False,
+) -> Table:
+    """
+    Patches (or with `replace`, updates) a table's stored resource, evolving
+    its schema in place when a new one is given.
+    """
+    project_id = strip_quotes(project_id)
+    dataset_id = strip_quotes(dataset_id)
+    table_id = strip_quotes(table_id)
+    current = get_table(project_id, dataset_id, table_id)
+    if table.schema_ is not None:
+        table_name = build_table_name(project_id, dataset_id, table_id)
+        with cursor(project_id, dataset_id) as cur:
+            cur.begin()
+            evolve_schema(cur, table_name, current.schema_.fields, table.schema_.fields)
+            columns = table_columns(cur, project_id, dataset_id, table_id)
+        catalog.put_table(project_id, dataset_id, table_id, columns)
+    resource = table.model_dump(
+        exclude_unset=True, by_alias=True, exclude=COMPUTED_TABLE_FIELDS
+    )
+    if not replace:
+        resource = get_table_resource(project_id, dataset_id, table_id) | resource
+    set_table_resource(project_id, dataset_id, table_id, Table.model_validate(resource))
+    return get_table(project_id, dataset_id, table_id)
+
+
+def list_table_storage_stats(
+    project_id: str,
+    dataset_id: Optional[str] = None,
+    table_id: Optional[str] = None,
+) -> list[dict]:
+    """
+    Reads tables' row and byte counts and modification times from the
+    DuckLake catalog, without touching their data files.
+    """
+    lake = metadata_catalog_name(project_id)
+    params = {"dataset_id": dataset_id, "table_id": table_id}
+    with cursor(project_id) as cur:
+        cur.execute(
+            f"""
+                SELECT
+                    s.schema_name,
+                    t.table_name,
+                    t.table_id,
+                    t.begin_snapshot,
+                    (
+                        SELECT coalesce(sum(f.record_count), 0)
+                        FROM {lake}.ducklake_data_file f
+                        WHERE f.table_id = t.table_id AND f.end_snapshot IS NULL
+                    ) - (
+                        SELECT coalesce(sum(d.delete_count), 0)
+                        FROM {lake}.ducklake_delete_file d
+                        WHERE d.table_id = t.table_id AND d.end_snapshot IS NULL
+                    ),
+                    (
+                        SELECT coalesce(sum(f.file_size_bytes), 0)
+                        FROM {lake}.ducklake_data_file f
+                        WHERE f.table_id = t.table_id AND f.end_snapshot IS NULL
+                    ),
+                    greatest(
+                        t.begin_snapshot,
+                        (
+                            SELECT max(f.begin_snapshot)
+                            FROM {lake}.ducklake_data_file f
+                            WHERE f.table_id = t.table_id
+                        ),
+                        (
+                            SELECT max(d.begin_snapshot)
+                            FROM {lake}.ducklake_delete_file d
+                            WHERE d.table_id = t.table_id
+                        )
+                    )
+                FROM {lake}.ducklake_table t
+                JOIN {lake}.ducklake_schema s
+                    ON s.schema_id = t.schema_id AND s.end_snapshot IS NULL
+                WHERE t.end_snapshot IS NULL
+                    AND ($dataset_id IS NULL OR s.schema_name = $dataset_id)
+                    AND ($table_id IS NULL OR t.table_name = $table_id)
+                ORDER BY s.schema_name, t.table_name
+            """,
+            params,
+        )
+        rows = cur.fetchall()
+        if not rows:
+            return []
+
+        # Small inserts and deletes are inlined into the catalog rather than
+        # written to files; those tables hold at most a few rows each, so
+        # count them directly.
+        inlined_data_tables = {}
+        try:
+            cur.execute(
+                f"SELECT table_id, table_name FROM {lake}.ducklake_inlined_data_tables"
+            )
+            for ducklake_table_id, inlined_table in cur.fetchall():
+                inlined_data_tables.setdefault(ducklake_table_id, []).append(
+                    inlined_table
+                )
+        except duckdb.CatalogException:
+            pass
+
+        stats = []
+        for row in rows:
+            dataset_id, table_id, ducklake_table_id, created, *counts = row
+            num_rows, num_bytes, modified = counts
+            for inlined_table in inlined_data_tables.get(ducklake_table_id, []):
+                cur.execute(
+                    f"""
+                        SELECT
+                            count(*) FILTER (end_snapshot IS NULL),
+                            max(greatest(begin_snapshot, end_snapshot))
+                        FROM {lake}."{inlined_table}"
+                    """
+                )
+                inlined_rows, inlined_modified = cur.fetchone()
+                num_rows += inlined_rows
+                modified = max(modified, inlined_modified or 0)
+            try:
+                cur.execute(
+                    f"""
+                        SELECT count(*), max(d.begin_snapshot)
+                        FROM {lake}."ducklake_inlined_delete_{ducklake_table_id}" d
+                        JOIN {lake}.ducklake_data_file f
+                            ON f.data_file_id = d.file_id AND f.end_snapshot IS NULL
+                    """
+                )
+                inlined_deletes, inlined_modified = cur.fetchone()
+                num_rows -= inlined_deletes
+                modified = max(modified, inlined_modified or 0)
+            except duckdb.CatalogException:
+                pass
+            stats.append(
+                {
+                    "dataset_id": dataset_id,
+                    "table_id": table_id,
+                    "num_rows": num_rows,
+                    "num_bytes": num_bytes,
+                    "creation_time": created,
+                    "last_modified_time": modified,
+                }
+            )
+
+        snapshots = {
+            stat[key]
+            for stat in stats
+            for key in ("creation_time", "last_modified_time")
+        }
+        cur.execute(
+            f"""
+                SELECT snapshot_id, epoch_ms(snapshot_time::TIMESTAMPTZ)
+                FROM {lake}.ducklake_snapshot
+                WHERE list_contains($snapshots, snapshot_id)
+            """,
+            {"snapshots": sorted(snapshots)},
         )
+        snapshot_times = dict(cur.fetchall())
+    for stat in stats:
+        stat["creation_time"] = snapshot_times.get(stat["creation_time"])
+        stat["last_modified_time"] = snapshot_times.get(stat["last_modified_time"])
+    return stats
+
+
+def get_table_storage_stats(project_id: str, dataset_id: str, table_id: str):
+    stats = list_table_storage_stats(project_id, dataset_id, table_id)
+    return stats[0] if stats else None
+
+
+def get_table(
+    project_id: str,
+    dataset_id: str,
+    table_id: str,
+    selected_fields: Optional[list[str]] = None,
+) -> Table:
+    project_id = strip_quotes(project_id)
+    dataset_id = strip_quotes(dataset_id)
+    table_id = strip_quotes(table_id)
+    columns = catalog.get_table(project_id, dataset_id, table_id)
+    if columns is None:
+        raise NotFoundError(f"Not found: Table {project_id}:{dataset_id}.{table_id}")
+    if selected_fields:
+        columns = [column for column in columns if column[0] in selected_fields]
+    fields = duckdb_fields_to_bigquery_fields(
+        [(name, DuckDBPyType(data_type)) for name, data_type, _ in columns]
+    )
+    for field, (_, _, is_nullable) in zip(fields, columns):
+        if not is_nullable and field.mode == "NULLABLE":
+            field.mode = "REQUIRED"
+    resource = get_table_resource(project_id, dataset_id, table_id)
+    stored_fields = (resource.get("schema") or {}).get("fields") or []
+    annotate_fields(fields, stored_fields)
+    declare_fields(fields, stored_fields)
+    table = Table.model_validate(resource)
+    table.id = f"{project_id}:{dataset_id}.{table_id}"
+    table.kind = "bigquery#table"
+    table.location = "US"
+    table.schema_ = TableSchema(fields=fields)
+    table.selfLink = (
+        f"/bigquery/v2/projects/{project_id}/datasets/{dataset_id}/tables/{table_id}"
+    )
+    table.tableReference = TableReference(
+        projectId=project_id, datasetId=dataset_id, tableId=table_id
+    )
+    table.type = "TABLE"
+    stats = get_table_storage_stats(project_id, dataset_id, table_id)
+    if stats is None:
+        # Only DuckLake tables have catalog statistics; anything else is a view.
+        table.type = "VIEW"
+        return table
+    table.creationTime = str(stats["creation_time"])
+    table.lastModifiedTime = str(stats["last_modified_time"])
+    table.numRows = str(stats["num_rows"])
+    table.numBytes = str(stats["num_bytes"])
+    table.numPhysicalBytes = table.numBytes
+    return table
+
+
+def encode_page_token(position: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_page_token(page_token: str, **types) -> dict:
+    """Decodes a page token, which must hold a value of each given type."""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(page_token.encode()))
+    except ValueError:
+        raise InvalidError("Invalid page token")
+    if not isinstance(position, dict) or not all(
+        isinstance(position.get(key), expected) for key, expected in types.items()
+    ):
+        raise InvalidError("Invalid page token")
+    return position
+
+
+def list_table_rows(
+    project_id,
+    dataset_id,
+    table_id,
+    selected_fields: Optional[list[str]] = None,
+    start_index: int = 0,
+    max_results: Optional[int] = None,
+    page_token: Optional[str] = None,
+) -> TableDataList:
+    project_id = strip_quotes(project_id)
+    table_name = build_table_name(project_id, dataset_id, table_id)
+    with cursor(project_id, dataset_id) as cur:
+        if page_token:
+            position = decode_page_token(
+                page_token, snapshot=int, rowid=(int, type(None)), totalRows=int
+            )
+        else:
+            cur.execute(
+                "SELECT id FROM ducklake_current_snapshot($project_id)",
+                {"project_id": project_id},
+            )
+            position = {"snapshot": cur.fetchone()[0], "rowid": None}
+        # Pin every page to the snapshot of the first page, and resume from the
+        # last row ID seen, which DuckLake uses to skip files outright.
+        snapshot = f"{table_name} AT (VERSION => {int(position['snapshot'])})"
+        columns = selected_columns(selected_fields) or "*"
+        duckdb_sql = f"SELECT rowid, {columns} FROM {snapshot}"
+        params = {}
+        if position["rowid"] is not None:
+            duckdb_sql += " WHERE rowid > $rowid"
+            params["rowid"] = position["rowid"]
+        duckdb_sql += " ORDER BY rowid"
+        if max_results is not None:
+            duckdb_sql += " LIMIT $limit"
+            params["limit"] = max_results + 1
+        if not page_token and start_index:
+            duckdb_sql += " OFFSET $offset"
+            params["offset"] = start_index
+        with debug_sql(duckdb_sql=duckdb_sql, params=params):
+            result = cur.execute(duckdb_sql, params)
+            duckdb_rows = result.fetchall()
+            # The snapshot is pinned, so later pages reuse the first page's count.
+            total_rows = position.get("totalRows")
+            if total_rows is None:
+                cur.execute(f"SELECT count(*) FROM {snapshot}")
+                total_rows = cur.fetchone()[0]
+
+    next_page_token = None
+    if max_results is not None and len(duckdb_rows) > max_results:
+        duckdb_rows = duckdb_rows[:max_results]
+        next_page_token = encode_page_token(
+            {
+                "snapshot": position["snapshot"],
+                "rowid": duckdb_rows[-1][0],
+                "totalRows": total_rows,
+            }
+        )
+    return TableDataList(
+        etag=str(position["snapshot"]),
+        pageToken=next_page_token,
+        rows=duckdb_values_to_bigquery_values([row[1:] for row in duckdb_rows]),
+        totalRows=str(total_rows),
+    )
+
+
+def selected_columns(selected_fields: Optional[list[str]]) -> str:
+    """
+    The quoted columns to read for `selectedFields`, where nested selections
+    like "record.field" project the whole top-level column.
+    """
+    fields = dict.fromkeys(f.strip().split(".")[0] for f in selected_fields or [])
+    return ", ".join(quote_identifier(field, "duckdb") for field in fields)
+
+
+def query_results_path(project_id: str, job_id: str) -> pathlib.Path:
+    project_id = strip_quotes(project_id)
+    job_id = strip_quotes(job_id)
+    return settings.data_dir / RESULTS_DATASET_ID / project_id / f"{job_id}.parquet"
+
+
+def create_read_session(
+    project_id: str,
+    dataset_id: str,
+    table_id: str,
+    selected_fields: Optional[list[str]] = None,
+    row_restriction: Optional[str] = None,
+    max_streams: int = 1,
+) -> dict:
+    project_id = strip_quotes(project_id)
+    dataset_id = strip_quotes(dataset_id)
+    table_id = strip_quotes(table_id)
+    columns = selected_columns(selected_fields)
+    with cursor(project_id, dataset_id) as cur:
+        if dataset_id == RESULTS_DATASET_ID:
+            path = query_results_path(project_id, table_id)
+            if not path.exists():
+                raise NotFoundError(f"Results for job {table_id} not found")
+            source = f"read_parquet('{path}', file_row_number = true)"
+            position = "file_row_number"
+            columns = columns or "* EXCLUDE (file_row_number)"
+        else:
+            cur.execute(
+                "SELECT id FROM ducklake_current_snapshot($project_id)",
+                {"project_id": project_id},
+            )
+            snapshot = cur.fetchone()[0]
+            table_name = build_table_name(project_id, dataset_id, table_id)
+            source = f"{table_name} AT (VERSION => {snapshot})"
+            position = "rowid"
+            columns = columns or "*"
+        where = "TRUE"
+        if row_restriction:
+            where = sqlglot.transpile(row_restriction, read="bigquery", write="duckdb")
+            where = where[0]
+        duckdb_sql = f"SELECT max({position}) + 1, count(*) FROM {source} WHERE {where}"
+        with debug_sql(bq_sql=row_restriction, duckdb_sql=duckdb_sql):
+            end, total_rows = cur.sql(duckdb_sql).fetchone()
+    end = end or 0
+    step = max(-(-end // max_streams), 1)
+    return {
+        "project_id": project_id,
+        "dataset_id": dataset_id,
+        "sql": f"SELECT {columns} FROM {source} WHERE ({where})",
+        "position": position,
+        "ranges": [(start, min(start + step, end)) for start in range(0, end, step)],
+        "total_rows": total_rows,
+    }
+
+
+def read_stream_sql(session: dict, stream: int, offset: int = 0) -> str:
+    start, end = session["ranges"][stream]
+    position = session["position"]
+    duckdb_sql = f"{session['sql']} AND {position} >= {start} AND {position} < {end}"
+    # Always in position order, so a read resumed at an offset skips exactly
+    # the rows the interrupted one sent.
+    duckdb_sql += f" ORDER BY {position}"
+    if offset:
+        duckdb_sql += f" OFFSET {int(offset)}"
+    return duckdb_sql
+
+
+def read_results_page(
+    project_id: str, path: pathlib.Path, start: int, end: int
+) -> list[TableRow]:
+    """Reads rows `start` to `end` of a query's results table."""
+    duckdb_sql = """
+        SELECT * EXCLUDE (file_row_number)
+        FROM read_parquet($path, file_row_number = true)
+        WHERE file_row_number >= $start AND file_row_number < $end
+        ORDER BY file_row_number
+    """
+    params = {"path": str(path), "start": start, "end": end}
+    with cursor(project_id) as cur, debug_sql(duckdb_sql=duckdb_sql, params=params):
+        rows = cur.execute(duckdb_sql, params).fetchall()
+    return duckdb_values_to_bigquery_values(rows)
+
+
+def get_query_results_page(
+    project_id: str,
+    job_id: str,
+    start_index: int = 0,
+    max_results: Optional[int] = None,
+    page_token: Optional[str] = None,
+) -> Optional[GetQueryResultsResponse]:
+    results = get_query_results(project_id, job_id)
+    if results is None:
+        return None
+    if page_token:
+        start_index = decode_page_token(page_token, offset=int)["offset"]
+    path = query_results_path(project_id, job_id)
+    if results.rows is None and results.jobComplete and path.exists():
+        # Rows kept in a results table are read from it a page at a time.
+        total_rows = int(results.totalRows or 0)
+        end = total_rows if max_results is None else start_index + max_results
+        rows = read_results_page(project_id, path, start_index, min(end, total_rows))
+    else:
+        total_rows = len(results.rows or [])
+        end = total_rows if max_results is None else start_index + max_results
+        rows = (results.rows or [])[start_index:end]
+    page = GetQueryResultsResponse.model_validate(
+        results.model_dump(exclude_unset=True, by_alias=True, exclude={"rows"})
+    )
+    if rows:
+        page.rows = rows
+    if end < total_rows:
+        page.pageToken = encode_page_token({"offset": end})
+    elif not results.jobComplete:
+        # Results written so far: more rows may follow this page.
+        page.pageToken = encode_page_token({"offset": max(start_index, total_rows)})
+    return page
+
+
+def create_job(project_id: str, job_id: str, job: Job) -> Job:
+    project_id = strip_quotes(project_id)
+    job_id = strip_quotes(job_id)
+    item = job.model_dump_json(exclude_unset=True, by_alias=True)
+    with metadata.transaction() as conn:
+        exists = conn.execute(
+            "SELECT 1 FROM jobs WHERE project_id = ? AND job_id = ?",
+            (project_id, job_id),
+        ).fetchone()
+        if exists:
+            raise AlreadyExistsError(f"Job {job_id} already exists")
+        metadata.put_job(conn, project_id, job_id, json.loads(item), item)
     return job
 
 
 def update_job(project_id: str, job_id: str, job: Job) -> Job:
     project_id = strip_quotes(project_id)
     job_id = strip_quotes(job_id)
-    with internal_cursor() as cur:
-        cur.sql(
-            """
-            UPDATE jobs
-            SET item = $item
-            WHERE project_id = $project_id AND job_id = $job_id
-            """,
-            params={
-                "project_id": project_id,
-                "job_id": job_id,
-                "item": job.model_dump_json(exclude_unset=True, by_alias=True),
-            },
-        )
+    item = job.model_dump_json(exclude_unset=True, by_alias=True)
+    with metadata.transaction() as conn:
+        metadata.put_job(conn, project_id, job_id, json.loads(item), item)
     return job
 
 
 def get_job(project_id: str, job_id: str) -> Optional[Job]:
     project_id = strip_quotes(project_id)
     job_id = strip_quotes(job_id)
-    with internal_cursor() as cur:
-        results = cur.sql(
+    row = (
+        metadata.connection()
+        .execute(
             """
                 SELECT item
                 FROM jobs
-                WHERE project_id = $project_id AND job_id = $job_id
+                WHERE project_id = ? AND job_id = ?
             """,
-            params={"project_id": project_id, "job_id": job_id},
+            (project_id, job_id),
         )
-        row = results.fetchone()
-        if not row:
-            return None
-        item = row[0]
-    return Job.model_validate_json(item, by_alias=True)
+        .fetchone()
+    )
+    if not row:
+        return None
+    return Job.model_validate_json(row[0], by_alias=True)
 
 
-def list_jobs(project_id: str) -> list[Job]:
+def list_jobs(
+    project_id: str,
+    max_results: Optional[int] = None,
+    page_token: Optional[str] = None,
+    states: Optional[list[str]] = None,
+    min_creation_time: Optional[int] = None,
+    max_creation_time: Optional[int] = None,
+    parent_job_id: Optional[str] = None,
+    minimal: bool = False,
+) -> tuple[list[Job1], Optional[str]]:
+    """
+    Lists a project's jobs, newest first, one page at a time.
+
+    Filters are applied by the jobs indexes, and pages continue from the last
+    (creation_time, job_id) seen, so each page costs the same however many
+    jobs the project has.
+    """
     project_id = strip_quotes(project_id)
-    with internal_cursor() as cur:
-        results = cur.sql(
-            """
-                SELECT item
+    max_results = min(max_results or MAX_LIST_RESULTS, MAX_LIST_RESULTS)
+    conditions = ["project_id = ?"]
+    params = [project_id]
+    if page_token:
+        position = decode_page_token(page_token, creationTime=int, jobId=str)
+        conditions.append("(creation_time, job_id) < (?, ?)")
+        params += [position["creationTime"], position["jobId"]]
+    if states:
+        conditions.append(f"state IN ({', '.join('?' for _ in states)})")
+        params += states
+    if min_creation_time is not None:
+        conditions.append("creation_time >= ?")
+        params.append(min_creation_time)
+    if max_creation_time is not None:
+        conditions.append("creation_time <= ?")
+        params.append(max_creation_time)
+    if parent_job_id:
+        conditions.append("parent_job_id = ?")
+        params.append(parent_job_id)
+    # The minimal projection leaves out the configuration, which is most of
+    # each job and the slowest part to validate.
+    item = "json_remove(item, '$.configuration')" if minimal else "item"
+    rows = (
+        metadata.connection()
+        .execute(
+            f"""
+                SELECT creation_time, job_id, {item}
                 FROM jobs
-                WHERE project_id = $project_id
+                WHERE {" AND ".join(conditions)}
+                ORDER BY creation_time DESC, job_id DESC
+                LIMIT ?
             """,
-            params={"project_id": project_id},
+            (*params, max_results + 1),
         )
-        return [
-            Job.model_validate_json(row[0], by_alias=True) for row in results.fetchall()
-        ]
+        .fetchall()
+    )
+    jobs = []
+    for _, _, item in rows[:max_results]:
+        job = Job1.model_validate_json(item, by_alias=True)
+        job.state = job.status.state if job.status else None
+        jobs.append(job)
+    next_page_token = None
+    if len(rows) > max_results:
+        creation_time, job_id, _ = rows[max_results - 1]
+        next_page_token = encode_page_token(
+            {"creationTime": creation_time, "jobId": job_id}
+        )
+    return jobs, next_page_token
 
 
 def delete_job(project_id: str, job_id: str):
     project_id = strip_quotes(project_id)
     job_id = strip_quotes(job_id)
-    with internal_cursor() as cur:
-        cur.sql(
+    with metadata.transaction() as conn:
+        conn.execute(
             """
                 DELETE FROM jobs
-                WHERE project_id = $project_id AND job_id = $job_id
+                WHERE project_id = ? AND job_id = ?
             """,
-            params={"project_id": project_id, "job_id": job_id},
+            (project_id, job_id),
         )
 
 
@@ -473,36 +1532,23 @@ def set_query_results(
 ) -> GetQueryResultsResponse:
     project_id = strip_quotes(project_id)
     job_id = strip_quotes(job_id)
-    with internal_cursor() as cur:
-        if get_query_results(project_id, job_id):
-            cur.sql(
-                """
-                    UPDATE query_results
-                    SET item = $item
-                    WHERE project_id = $project_id AND job_id = $job_id
-                """,
-                params={
-                    "project_id": project_id,
-                    "job_id": job_id,
-                    "item": query_results.model_dump_json(
-                        exclude_unset=True, by_alias=True
-                    ),
-                },
-            )
-        else:
-            cur.sql(
-                """
-                    INSERT INTO query_results (project_id, job_id, item)
-                    VALUES ($project_id, $job_id, $item)
-                """,
-                params={
-                    "project_id": project_id,
-                    "job_id": job_id,
-                    "item": query_results.model_dump_json(
-                        exclude_unset=True, by_alias=True
-                    ),
-                },
-            )
+    expire_time = None
+    if settings.query_results_ttl_seconds > 0:
+        expire_time = int(timestamp_now()) + settings.query_results_ttl_seconds
+    with metadata.transaction() as conn:
+        conn.execute(
+            """
+                INSERT OR REPLACE INTO query_results
+                    (project_id, job_id, expire_time, item)
+                VALUES (?, ?, ?, ?)
+            """,
+            (
+                project_id,
+                job_id,
+                expire_time,
+                query_results.model_dump_json(exclude_unset=True, by_alias=True),
+            ),
+        )
     return query_results
 
 
@@ -511,52 +1557,213 @@ def get_query_results(
 ) -> Optional[GetQueryResultsResponse]:
     project_id = strip_quotes(project_id)
     job_id = strip_quotes(job_id)
-    with internal_cursor() as cur:
-        results = cur.sql(
+    row = (
+        metadata.connection()
+        .execute(
             """
                 SELECT item
                 FROM query_results
-                WHERE project_id = $project_id AND job_id = $job_id
+                WHERE project_id = ? AND job_id = ?
+                    AND (expire_time IS NULL OR expire_time > ?)
             """,
-            params={"project_id": project_id, "job_id": job_id},
+            (project_id, job_id, int(timestamp_now())),
         )
-        row = results.fetchone()
-        if not row:
-            return None
-        item = row[0]
-    return GetQueryResultsResponse.model_validate_json(item, by_alias=True)
+        .fetchone()
+    )
+    if not row:
+        return None
+    return GetQueryResultsResponse.model_validate_json(row[0], by_alias=True)
 
 
-def query(
-    project_id,
-    dataset_id,
-    bq_sql,
-    parameters: Optional[list[QueryParameter]] = None,
-) -> tuple[list[TableRow], TableSchema]:
-    params = bigquery_params_to_duckdb_params(parameters)
-    with cursor(project_id, dataset_id) as cur:
-        result = None
-        trees = sqlglot.parse(bq_sql, "bigquery")
-        if has_external_query(trees):
-            setup_postgres_connection(cur)
+def delete_expired_query_results(now: int, limit: int) -> int:
+    """Deletes up to `limit` expired query results and their result tables."""
+    with metadata.transaction() as conn:
+        expired = conn.execute(
+            """
+                SELECT project_id, job_id
+                FROM query_results
+                WHERE expire_time <= ?
+                LIMIT ?
+            """,
+            (now, limit),
+        ).fetchall()
+        conn.executemany(
+            "DELETE FROM query_results WHERE project_id = ? AND job_id = ?",
+            expired,
+        )
+    for project_id, job_id in expired:
+        query_results_path(project_id, job_id).unlink(missing_ok=True)
+    return len(expired)
+
+
+def delete_expired_jobs(created_before: int, limit: int) -> int:
+    """
+    Deletes up to `limit` finished jobs created before the cutoff, with their
+    results. Jobs still pending or running, like continuous queries, are kept.
+    """
+    with metadata.transaction() as conn:
+        expired = conn.execute(
+            """
+                SELECT project_id, job_id
+                FROM jobs
+                WHERE creation_time < ? AND state = 'DONE'
+                LIMIT ?
+            """,
+            (created_before, limit),
+        ).fetchall()
+        conn.executemany(
+            "DELETE FROM jobs WHERE project_id = ? AND job_id = ?", expired
+        )
+        conn.executemany(
+            "DELETE FROM query_results WHERE project_id = ? AND job_id = ?",
+            expired,
+        )
+    for project_id, job_id in expired:
+        query_results_path(project_id, job_id).unlink(missing_ok=True)
+    return len(expired)
+
+
+def execute_statements(cur, project_id, dataset_id, bq_sql, params: dict):
+    """
+    Translates and runs each BigQuery statement, returning the relation and
+    translated tree of the last one.
+    """
+    result = None
+    result_tree = None
+    trees = sqlglot.parse(bq_sql, "bigquery")
+    if has_external_query(trees):
+        setup_postgres_connection(cur)
+    try:
         for tree in trees:
             if not tree:
                 continue
             if is_js_udf(tree):
                 bind_js_udf(cur, tree)
+                mark_dirty(cur)
                 continue
+            if has_session_state(tree):
+                mark_dirty(cur)
 
+            replaced = replaced_tables(project_id, dataset_id, tree)
             transform = bigquery_to_duckdb_sqlglot(project_id, dataset_id, params)
             tree = tree.transform(transform)
-            duckdb_sql = tree.sql("duckdb")
-            used_params = {
-                node.this.this: params.get(node.this.this)
-                for node in tree.dfs()
-                if isinstance(node, sqlglot.exp.Parameter)
-            }
-            with debug_sql(bq_sql=bq_sql, duckdb_sql=duckdb_sql, params=params):
-                result = cur.sql(duckdb_sql, params=used_params)
+            result = execute_translated(cur, bq_sql, tree, tree.sql("duckdb"), params)
+            result_tree = tree
+            for table in replaced:
+                set_table_resource(*table, None)
+    finally:
+        if any(is_ddl(tree) for tree in trees if tree and not is_js_udf(tree)):
+            # DDL may touch any project, so reload the whole catalog.
+            catalog.invalidate()
+    return result, result_tree
+
+
+def execute_translated(cur, bq_sql, tree, duckdb_sql: str, params: dict):
+    """Runs a statement already translated to DuckDB."""
+    used_params = {
+        node.this.this: params.get(node.this.this)
+        for node in tree.dfs()
+        if isinstance(node, sqlglot.exp.Parameter)
+    }
+    with debug_sql(bq_sql=bq_sql, duckdb_sql=duckdb_sql, params=params):
+        return cur.sql(duckdb_sql, params=used_params)
+
+
+def replaced_tables(project_id, dataset_id, tree) -> list[tuple[str, str, str]]:
+    """
+    The tables a statement drops or creates afresh, whose stored descriptions
+    and labels no longer apply.
+    """
+    if isinstance(tree, sqlglot.exp.Drop):
+        fresh = tree.args.get("kind") == "TABLE"
+    elif isinstance(tree, sqlglot.exp.Create):
+        fresh = tree.args.get("kind") == "TABLE" and (
+            tree.args.get("replace") or not tree.args.get("exists")
+        )
+    else:
+        fresh = False
+    table = tree.find(sqlglot.exp.Table) if fresh else None
+    if table is None:
+        return []
+    return [
+        (
+            strip_quotes(table.catalog) or project_id,
+            strip_quotes(table.db) or strip_quotes(dataset_id) or "main",
+            strip_quotes(table.name),
+        )
+    ]
 
+
+def query(
+    project_id,
+    dataset_id,
+    bq_sql,
+    parameters: Optional[list[QueryParameter]] = None,
+    results_path: Optional[pathlib.Path] = None,
+    budget: Optional[Budget] = None,
+    timeout_seconds: Optional[float] = None,
+) -> tuple[list[TableRow], TableSchema]:
+    params = bigquery_params_to_duckdb_params(parameters)
+    shareable = single_flight_key(project_id, dataset_id, bq_sql, params)
+    key, translated = shareable if shareable is not None else (None, None)
+
+    def run():
+        rows, schema = run_query(
+            project_id,
+            dataset_id,
+            bq_sql,
+            params,
+            results_path,
+            budget,
+            timeout_seconds,
+            translated,
+        )
+        written = results_path is not None and results_path.exists()
+        return rows, schema, results_path if written else None
+
+    if key is None:
+        rows, schema, _ = run()
+        return rows, schema
+    # The shared execution runs under the leader's timeout and budget, so only
+    # queries with the same ones can share it.
+    key = (*key, timeout_seconds, budget)
+    rows, schema, shared_path = single_flight.run(key, run, timeout_seconds)
+    if results_path is not None and shared_path not in (None, results_path):
+        # Only the query that runs writes its results table, the rest link it.
+        results_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(shared_path, results_path)
+        except OSError:
+            shutil.copyfile(shared_path, results_path)
+    return rows, schema
+
+
+def run_query(
+    project_id,
+    dataset_id,
+    bq_sql,
+    params: dict,
+    results_path: Optional[pathlib.Path],
+    budget: Optional[Budget],
+    timeout_seconds: Optional[float],
+    translated: Optional[sqlglot.exp.Expression] = None,
+) -> tuple[list[TableRow], TableSchema]:
+    """
+    Runs a query, or the single SELECT it was already translated into by
+    `single_flight_key`.
+    """
+    with (
+        cursor(project_id, dataset_id, budget) as cur,
+        interrupt_after(cur, timeout_seconds),
+    ):
+        if translated is not None:
+            duckdb_sql = translated.sql("duckdb")
+            result = execute_translated(cur, bq_sql, translated, duckdb_sql, params)
+            result_tree = translated
+        else:
+            result, result_tree = execute_statements(
+                cur, project_id, dataset_id, bq_sql, params
+            )
         if result is None:
             return [], TableSchema(fields=[], foreignTypeInfo=None)
 
@@ -564,15 +1771,298 @@ def query(
         bigquery_fields = duckdb_fields_to_bigquery_fields(duckdb_fields)
         bigquery_schema = TableSchema(fields=bigquery_fields, foreignTypeInfo=None)
 
+        if results_path is not None and isinstance(result_tree, sqlglot.exp.Query):
+            # Run the query once into a columnar results table, then read the
+            # response rows back from it.
+            results_path.parent.mkdir(parents=True, exist_ok=True)
+            with debug_sql(bq_sql=bq_sql, params=params):
+                result.write_parquet(str(results_path))
+            result = cur.sql(
+                "SELECT * FROM read_parquet($path)",
+                params={"path": str(results_path)},
+            )
+
         duckdb_rows = result.fetchall()
         bigquery_rows = duckdb_values_to_bigquery_values(duckdb_rows)
 
         return bigquery_rows, bigquery_schema
 
 
-def tabledata_insert_all(project_id, dataset_id, table_id, rows: list[Row1]):
+NONDETERMINISTIC_FUNCTIONS = (
+    sqlglot.exp.Rand,
+    sqlglot.exp.Randn,
+    sqlglot.exp.Uuid,
+    sqlglot.exp.CurrentDate,
+    sqlglot.exp.CurrentDatetime,
+    sqlglot.exp.CurrentTime,
+    sqlglot.exp.CurrentTimestamp,
+)
+
+
+# INFORMATION_SCHEMA views whose rewrite reads storage statistics, too costly
+# to compute just to find a query to share with.
+CATALOG_STATS_VIEWS = {"PARTITIONS", "TABLE_STORAGE"}
+
+
+def single_flight_key(
+    project_id, dataset_id, bq_sql, params: dict
+) -> Optional[tuple[tuple, sqlglot.exp.Expression]]:
+    """
+    Identifies a query that may share its execution with identical ones,
+    returning the key with the query's translated tree to run, or None if it
+    has to run on its own.
+
+    Only single, deterministic SELECTs qualify. The key is the translated
+    SQL, the parameters and the latest snapshot of every project the query
+    reads, so a query never shares results from before a commit it could see.
+    """
+    try:
+        trees = [tree for tree in sqlglot.parse(bq_sql, "bigquery") if tree]
+    except sqlglot.ParseError:
+        return None
+    if len(trees) != 1 or not isinstance(trees[0], sqlglot.exp.Query):
+        return None
+    tree = trees[0]
+    if has_external_query(trees) or tree.find(*NONDETERMINISTIC_FUNCTIONS):
+        return None
+    views = {
+        view
+        for table in tree.find_all(sqlglot.exp.Table)
+        if table.this and table.this.this
+        for schema, _, view in [strip_quotes(table.this.this).upper().partition(".")]
+        if schema == "INFORMATION_SCHEMA"
+    }
+    if views & CATALOG_STATS_VIEWS:
+        return None
+    projects = sorted(
+        {
+            strip_quotes(table.catalog) or project_id
+            for table in tree.find_all(sqlglot.exp.Table)
+        }
+        | {project_id}
+    )
+    try:
+        translated = tree.transform(
+            bigquery_to_duckdb_sqlglot(project_id, dataset_id, params)
+        )
+        snapshots = tuple(zip(projects, latest_snapshot_ids(project_id, projects)))
+    except (
+        duckdb.Error,
+        sqlglot.ParseError,
+        NotFoundError,
+        InvalidError,
+        NotImplementedError,
+    ):
+        # Let the query itself report the problem.
+        return None
+    key = (
+        project_id,
+        dataset_id,
+        translated.sql("duckdb"),
+        repr(sorted(params.items())),
+        snapshots,
+    )
+    return key, translated
+
+
+def latest_snapshot_id(project_id: str) -> int:
+    return latest_snapshot_ids(project_id, [project_id])[0]
+
+
+def latest_snapshot_ids(project_id: str, projects: list[str]) -> list[int]:
+    """The latest snapshots of projects, read through one of a project's cursors."""
+    latest = ", ".join(
+        f"(SELECT max(snapshot_id) FROM {metadata_catalog_name(project)}.ducklake_snapshot)"
+        for project in projects
+    )
+    with cursor(project_id) as cur:
+        # Fetch everything, so the catalog isn't left mid-read (and locked).
+        return list(cur.sql(f"SELECT {latest}").fetchall()[0])
+
+
+def query_incremental(
+    project_id,
+    dataset_id,
+    bq_sql,
+    parameters: Optional[list[QueryParameter]] = None,
+    budget: Optional[Budget] = None,
+    timeout_seconds: Optional[float] = None,
+    batch_rows: int = 10000,
+):
+    """
+    Runs a BigQuery query and yields its schema, then its rows a chunk at a
+    time as DuckDB produces them.
+    """
+    params = bigquery_params_to_duckdb_params(parameters)
+    with (
+        cursor(project_id, dataset_id, budget) as cur,
+        interrupt_after(cur, timeout_seconds),
+    ):
+        result, _ = execute_statements(cur, project_id, dataset_id, bq_sql, params)
+        if result is None:
+            yield TableSchema(fields=[], foreignTypeInfo=None)
+            return
+        duckdb_fields = list(zip(result.columns, result.types))
+        yield TableSchema(
+            fields=duckdb_fields_to_bigquery_fields(duckdb_fields),
+            foreignTypeInfo=None,
+        )
+        with debug_sql(bq_sql=bq_sql, params=params):
+            while chunk := result.fetchmany(batch_rows):
+                yield duckdb_values_to_bigquery_values(chunk)
+
+
+def continuous_source(project_id, dataset_id, bq_sql) -> tuple[str, str, str]:
+    """
+    Checks a continuous query is one it can run, returning the table it reads.
+
+    Continuous queries here are an `INSERT INTO ... SELECT` reading a single
+    table, so each new batch of rows in that table can be run on its own.
+    """
+    trees = [tree for tree in sqlglot.parse(bq_sql, "bigquery") if tree]
+    if len(trees) != 1 or not isinstance(trees[0], sqlglot.exp.Insert):
+        raise InvalidError(
+            "Continuous queries must be a single INSERT INTO ... SELECT statement"
+        )
+    tree = trees[0]
+    source = continuous_source_table(tree)
+    destination = tree.find(sqlglot.exp.Table)
+    source_id = continuous_table_id(project_id, dataset_id, source)
+    if source_id == continuous_table_id(project_id, dataset_id, destination):
+        raise InvalidError("Continuous queries can't insert into the table they read")
+    return source_id
+
+
+def continuous_source_table(tree) -> sqlglot.exp.Table:
+    """The one table an INSERT's query reads, besides its CTEs."""
+    query = tree.expression
+    if not isinstance(query, sqlglot.exp.Query):
+        raise InvalidError(
+            "Continuous queries must be a single INSERT INTO ... SELECT statement"
+        )
+    tables = [
+        table
+        for table in query.find_all(sqlglot.exp.Table)
+        if not is_cte_table(tree, table)
+    ]
+    if len(tables) != 1:
+        raise InvalidError("Continuous queries must read exactly one table")
+    return tables[0]
+
+
+def continuous_table_id(project_id, dataset_id, table) -> tuple[str, str, str]:
+    return (
+        strip_quotes(table.catalog) or project_id,
+        strip_quotes(table.db) or strip_quotes(dataset_id) or "main",
+        strip_quotes(table.name),
+    )
+
+
+def set_continuous_snapshot(
+    project_id: str, job_id: str, source_project_id: str, snapshot_id: int
+):
+    """Records the last snapshot a continuous query has processed."""
+    metadata.connection().execute(
+        """
+            INSERT INTO continuous_queries
+                (project_id, job_id, source_project_id, snapshot_id)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (project_id, job_id) DO UPDATE SET
+                source_project_id = excluded.source_project_id,
+                snapshot_id = excluded.snapshot_id
+        """,
+        (project_id, job_id, source_project_id, snapshot_id),
+    )
+
+
+def list_continuous_queries() -> list[tuple[str, str, str, int]]:
+    """
+    The running continuous queries, with the source project and last
+    snapshot each has processed.
+    """
+    return (
+        metadata.connection()
+        .execute(
+            """
+                SELECT c.project_id, c.job_id, c.source_project_id, c.snapshot_id
+                FROM continuous_queries c
+                JOIN jobs j ON j.project_id = c.project_id AND j.job_id = c.job_id
+                WHERE j.state = 'RUNNING'
+            """
+        )
+        .fetchall()
+    )
+
+
+def run_continuous_query(
+    project_id,
+    dataset_id,
+    bq_sql,
+    start_snapshot_id: int,
+    end_snapshot_id: int,
+    parameters: Optional[list[QueryParameter]] = None,
+) -> int:
+    """
+    Runs a continuous query over only the rows inserted into its source table
+    between two snapshots, returning how many rows it wrote.
+    """
+    params = bigquery_params_to_duckdb_params(parameters)
+    source_project_id, source_dataset_id, source_table_id = continuous_source(
+        project_id, dataset_id, bq_sql
+    )
+    tree = sqlglot.parse_one(bq_sql, "bigquery")
+    tree = tree.transform(bigquery_to_duckdb_sqlglot(project_id, dataset_id, params))
+    source = continuous_source_table(tree)
+    insertions = sqlglot.parse_one(
+        "SELECT * FROM ducklake_table_insertions("
+        f"{sql_literal(source_project_id)}, {sql_literal(source_dataset_id)}, "
+        f"{sql_literal(source_table_id)}, {int(start_snapshot_id)}, "
+        f"{int(end_snapshot_id)})",
+        "duckdb",
+    )
+    source.replace(insertions.subquery(source.alias_or_name))
+    duckdb_sql = tree.sql("duckdb")
+    used_params = {
+        node.this.this: params.get(node.this.this)
+        for node in tree.dfs()
+        if isinstance(node, sqlglot.exp.Parameter)
+    }
+    with (
+        cursor(project_id, dataset_id) as cur,
+        debug_sql(bq_sql=bq_sql, duckdb_sql=duckdb_sql, params=params),
+    ):
+        return cur.execute(duckdb_sql, used_params).fetchall()[0][0]
+
+
+def query_record_batches(
+    project_id,
+    dataset_id,
+    bq_sql,
+    parameters: Optional[list[QueryParameter]] = None,
+    batch_rows: int = 10000,
+):
+    """
+    Runs a BigQuery query and yields its Arrow schema, then its record batches.
+    Nothing is yielded for statements that produce no result set.
+
+    The cursor stays open until the generator is exhausted or closed, so rows
+    are streamed straight from DuckDB without being materialised.
+    """
+    params = bigquery_params_to_duckdb_params(parameters)
+    with cursor(project_id, dataset_id) as cur:
+        result, _ = execute_statements(cur, project_id, dataset_id, bq_sql, params)
+        if result is None:
+            return
+        with debug_sql(bq_sql=bq_sql, params=params):
+            reader = result.to_arrow_reader(batch_rows)
+            yield reader.schema
+            yield from reader
+
+
+def insert_rows(project_id, dataset_id, table_id, rows: list[Row1]):
     table_name = build_table_name(project_id, dataset_id, table_id)
     with cursor(project_id, dataset_id) as cur:
+        cur.begin()
         for row in rows:
             if not row.json_ or not row.json_.root:
                 continue
@@ -585,6 +2075,34 @@ def tabledata_insert_all(project_id, dataset_id, table_id, rows: list[Row1]):
                 cur.execute(sql, params)
 
 
+insert_coalescer = InsertCoalescer(lambda key, rows: insert_rows(*key, rows))
+single_flight = SingleFlight()
+
+
+def tabledata_insert_all(project_id, dataset_id, table_id, rows: list[Row1]):
+    if settings.insert_coalesce_window_ms <= 0:
+        insert_rows(project_id, dataset_id, table_id, rows)
+        return
+    key = (strip_quotes(project_id), strip_quotes(dataset_id), strip_quotes(table_id))
+    insert_coalescer.submit(key, rows)
+
+
+def is_ddl(tree):
+    return isinstance(
+        tree,
+        (sqlglot.exp.Create, sqlglot.exp.Drop, sqlglot.exp.Alter, sqlglot.exp.Command),
+    )
+
+
+def has_session_state(tree):
+    """Whether a statement leaves state behind on the cursor that runs it."""
+    if isinstance(tree, (sqlglot.exp.Set, sqlglot.exp.Use, sqlglot.exp.Command)):
+        return True
+    return isinstance(tree, sqlglot.exp.Create) and bool(
+        tree.find(sqlglot.exp.TemporaryProperty)
+    )
+
+
 def is_js_udf(tree):
     langs = [n for n in tree.dfs() if isinstance(n, sqlglot.exp.LanguageProperty)]
     return langs and langs[0].this.this == "js"
@@ -632,6 +2150,7 @@ def bind_js_udf(cur, tree):
 def bigquery_to_duckdb_sqlglot(project_id, dataset_id, params):
     def transform(node):
         node = bigquery_to_duckdb_sqlglot_wildcard(project_id, dataset_id, node)
+        node = bigquery_to_duckdb_information_schema(project_id, dataset_id, node)
         node = bigquery_to_duckdb_external_query(node, params)
         return node
 
@@ -682,6 +2201,283 @@ def bigquery_to_duckdb_sqlglot_wildcard(project_id, dataset_id, node):
     return sqlglot.exp.paren(unions)
 
 
+def sql_literal(value) -> str:
+    return sqlglot.exp.convert(value).sql("duckdb")
+
+
+def epoch_ms_to_iso(value: Optional[int]) -> Optional[str]:
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value / 1000, timezone.utc).isoformat()
+
+
+def values_sql(columns: dict[str, str], rows: list[tuple]) -> str:
+    """Builds a relation over literal rows, typed even when there are none."""
+    if not rows:
+        select = ", ".join(f"CAST(NULL AS {t}) AS {c}" for c, t in columns.items())
+        return f"SELECT {select} WHERE FALSE"
+    select = ", ".join(f"CAST({c} AS {t}) AS {c}" for c, t in columns.items())
+    values = ", ".join(
+        f"({', '.join(sql_literal(value) for value in row)})" for row in rows
+    )
+    return f"SELECT {select} FROM (VALUES {values}) AS v({', '.join(columns)})"
+
+
+def catalog_scope(project_id: str, dataset_id: Optional[str]) -> str:
+    scope = f"database_name = {sql_literal(project_id)}"
+    if dataset_id:
+        scope += f" AND schema_name = {sql_literal(dataset_id)}"
+    return scope
+
+
+def information_schema_tables(project_id: str, dataset_id: Optional[str]) -> str:
+    lake = metadata_catalog_name(project_id)
+    scope = catalog_scope(project_id, dataset_id)
+    return f"""
+        SELECT
+            o.database_name AS table_catalog,
+            o.schema_name AS table_schema,
+            o.table_name,
+            o.table_type,
+            o.is_insertable_into,
+            'NO' AS is_typed,
+            c.creation_time,
+            o.ddl
+        FROM (
+            SELECT
+                database_name,
+                schema_name,
+                table_name,
+                'BASE TABLE' AS table_type,
+                'YES' AS is_insertable_into,
+                sql AS ddl
+            FROM duckdb_tables()
+            WHERE {scope}
+            UNION ALL
+            SELECT database_name, schema_name, view_name, 'VIEW', 'NO', sql
+            FROM duckdb_views()
+            WHERE NOT internal AND {scope}
+        ) AS o
+        LEFT JOIN (
+            SELECT
+                s.schema_name,
+                t.table_name,
+                n.snapshot_time::TIMESTAMPTZ AS creation_time
+            FROM {lake}.ducklake_table AS t
+            JOIN {lake}.ducklake_schema AS s
+                ON s.schema_id = t.schema_id AND s.end_snapshot IS NULL
+            JOIN {lake}.ducklake_snapshot AS n ON n.snapshot_id = t.begin_snapshot
+            WHERE t.end_snapshot IS NULL
+            UNION ALL
+            SELECT
+                s.schema_name,
+                v.view_name,
+                n.snapshot_time::TIMESTAMPTZ
+            FROM {lake}.ducklake_view AS v
+            JOIN {lake}.ducklake_schema AS s
+                ON s.schema_id = v.schema_id AND s.end_snapshot IS NULL
+            JOIN {lake}.ducklake_snapshot AS n ON n.snapshot_id = v.begin_snapshot
+            WHERE v.end_snapshot IS NULL
+        ) AS c
+            ON c.schema_name = o.schema_name AND c.table_name = o.table_name
+    """
+
+
+def information_schema_columns(project_id: str, dataset_id: Optional[str]) -> str:
+    # Column types are spelled the BigQuery way from a small lookup of the
+    # DuckDB types in use, so the columns themselves are never materialised.
+    project = catalog.project(project_id)
+    duckdb_types = {
+        data_type
+        for current_dataset_id, tables in project.tables.items()
+        if not dataset_id or current_dataset_id == dataset_id
+        for columns in tables.values()
+        for _, data_type, _ in columns
+    }
+    type_names = []
+    for data_type in sorted(duckdb_types):
+        try:
+            field = duckdb_field_to_bigquery_field("", DuckDBPyType(data_type))
+        except ValueError:
+            continue
+        type_names.append((data_type, field_to_type_name(field)))
+    types = values_sql({"duckdb_type": "VARCHAR", "type_name": "VARCHAR"}, type_names)
+    return f"""
+        SELECT
+            c.database_name AS table_catalog,
+            c.schema_name AS table_schema,
+            c.table_name,
+            c.column_name,
+            c.column_index AS ordinal_position,
+            CASE WHEN c.is_nullable THEN 'YES' ELSE 'NO' END AS is_nullable,
+            coalesce(t.type_name, c.data_type) AS data_type,
+            'NO' AS is_hidden,
+            'NO' AS is_system_defined,
+            'NO' AS is_partitioning_column,
+            CAST(NULL AS BIGINT) AS clustering_ordinal_position,
+            CAST(NULL AS VARCHAR) AS collation_name,
+            coalesce(c.column_default, 'NULL') AS column_default,
+            CAST(NULL AS VARCHAR) AS rounding_mode
+        FROM duckdb_columns() AS c
+        LEFT JOIN ({types}) AS t ON t.duckdb_type = c.data_type
+        WHERE {catalog_scope(project_id, dataset_id)}
+    """
+
+
+def information_schema_jobs(project_id: str, dataset_id: Optional[str]) -> str:
+    # Jobs are read from the metadata store itself, so only the columns a
+    # query uses are fetched from SQLite.
+    def item(path):
+        return f"json_extract_string(j.item, '$.{path}')"
+
+    def seconds(path):
+        return f"to_timestamp(TRY_CAST({item(path)} AS BIGINT))"
+
+    return f"""
+        SELECT
+            to_timestamp(j.creation_time) AS creation_time,
+            j.project_id,
+            j.user_email,
+            j.job_id,
+            coalesce(
+                {item("configuration.jobType")},
+                CASE WHEN {item("configuration.query")} IS NOT NULL THEN 'QUERY' END
+            ) AS job_type,
+            {item("statistics.query.statementType")} AS statement_type,
+            coalesce(
+                {item("configuration.query.priority")}, 'INTERACTIVE'
+            ) AS priority,
+            {seconds("statistics.startTime")} AS start_time,
+            {seconds("statistics.endTime")} AS end_time,
+            {item("configuration.query.query")} AS query,
+            j.state,
+            j.parent_job_id,
+            TRY_CAST(
+                {item("statistics.totalBytesProcessed")} AS BIGINT
+            ) AS total_bytes_processed,
+            TRY_CAST({item("statistics.totalSlotMs")} AS BIGINT) AS total_slot_ms,
+            TRY_CAST({item("statistics.query.cacheHit")} AS BOOLEAN) AS cache_hit,
+            CASE WHEN {item("status.errorResult")} IS NOT NULL THEN struct_pack(
+                reason := {item("status.errorResult.reason")},
+                location := {item("status.errorResult.location")},
+                message := {item("status.errorResult.message")}
+            ) END AS error_result
+        FROM sqlite_scan({sql_literal(str(metadata.path()))}, 'jobs') AS j
+        WHERE j.project_id = {sql_literal(project_id)}
+    """
+
+
+def information_schema_table_storage(project_id: str, dataset_id: Optional[str]) -> str:
+    rows = [
+        (
+            project_id,
+            project_id,
+            stat["dataset_id"],
+            stat["table_id"],
+            epoch_ms_to_iso(stat["creation_time"]),
+            stat["num_rows"],
+            stat["num_bytes"],
+            stat["num_bytes"],
+            0,
+            stat["num_bytes"],
+            stat["num_bytes"],
+            0,
+            0,
+            epoch_ms_to_iso(stat["last_modified_time"]),
+            False,
+            "BASE TABLE",
+        )
+        for stat in list_table_storage_stats(project_id, dataset_id)
+    ]
+    columns = {
+        "project_id": "VARCHAR",
+        "table_catalog": "VARCHAR",
+        "table_schema": "VARCHAR",
+        "table_name": "VARCHAR",
+        "creation_time": "TIMESTAMPTZ",
+        "total_rows": "BIGINT",
+        "total_logical_bytes": "BIGINT",
+        "active_logical_bytes": "BIGINT",
+        "long_term_logical_bytes": "BIGINT",
+        "total_physical_bytes": "BIGINT",
+        "active_physical_bytes": "BIGINT",
+        "long_term_physical_bytes": "BIGINT",
+        "time_travel_physical_bytes": "BIGINT",
+        "storage_last_modified_time": "TIMESTAMPTZ",
+        "deleted": "BOOLEAN",
+        "table_type": "VARCHAR",
+    }
+    return values_sql(columns, rows)
+
+
+def information_schema_partitions(project_id: str, dataset_id: Optional[str]) -> str:
+    # Tables aren't partitioned, so each has a single NULL partition.
+    rows = [
+        (
+            project_id,
+            stat["dataset_id"],
+            stat["table_id"],
+            None,
+            stat["num_rows"],
+            stat["num_bytes"],
+            stat["num_bytes"],
+            epoch_ms_to_iso(stat["last_modified_time"]),
+            "ACTIVE",
+        )
+        for stat in list_table_storage_stats(project_id, dataset_id)
+    ]
+    columns = {
+        "table_catalog": "VARCHAR",
+        "table_schema": "VARCHAR",
+        "table_name": "VARCHAR",
+        "partition_id": "VARCHAR",
+        "total_rows": "BIGINT",
+        "total_logical_bytes": "BIGINT",
+        "total_billable_bytes": "BIGINT",
+        "last_modified_time": "TIMESTAMPTZ",
+        "storage_tier": "VARCHAR",
+    }
+    return values_sql(columns, rows)
+
+
+INFORMATION_SCHEMA_VIEWS = {
+    "TABLES": information_schema_tables,
+    "COLUMNS": information_schema_columns,
+    "JOBS": information_schema_jobs,
+    "JOBS_BY_PROJECT": information_schema_jobs,
+    "PARTITIONS": information_schema_partitions,
+    "TABLE_STORAGE": information_schema_table_storage,
+}
+
+
+def bigquery_to_duckdb_information_schema(project_id, dataset_id, node):
+    """
+    Rewrites `INFORMATION_SCHEMA` views into relations over the catalog.
+
+    Views may be qualified by a dataset, a region (covering the whole
+    project) and optionally a project. The scope is applied while building the
+    relation, and any other predicates are pushed into it by DuckDB.
+    """
+    if not isinstance(node, sqlglot.exp.Table):
+        return node
+    if not node.this or not node.this.this:
+        return node
+    schema, _, view = strip_quotes(node.this.this).upper().partition(".")
+    if schema != "INFORMATION_SCHEMA":
+        return node
+    if view not in INFORMATION_SCHEMA_VIEWS:
+        raise sqlglot.ParseError(f"INFORMATION_SCHEMA.{view} is not supported")
+    if node.catalog:
+        project_id = strip_quotes(node.catalog)
+    dataset_id = strip_quotes(node.db)
+    if dataset_id and dataset_id.lower().startswith("region-"):
+        dataset_id = None
+    if dataset_id and catalog.get_dataset(project_id, dataset_id) is None:
+        raise NotFoundError(f"Not found: Dataset {project_id}:{dataset_id}")
+    sql = INFORMATION_SCHEMA_VIEWS[view](project_id, dataset_id)
+    return sqlglot.parse_one(sql, read="duckdb").subquery(node.alias or view)
+
+
 def has_external_query(trees):
     return any(
         node
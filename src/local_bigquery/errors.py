@@ -1,3 +1,6 @@
+from typing import Optional
+
+
 class NotFoundError(Exception):
     def __init__(self, message: str):
         self.message = message
@@ -12,3 +15,28 @@ class AlreadyExistsError(Exception):
 
     def __str__(self):
         return f"AlreadyExistsError: {self.message}"
+
+
+class InvalidError(Exception):
+    def __init__(self, message: str):
+        self.message = message
+
+    def __str__(self):
+        return f"InvalidError: {self.message}"
+
+
+class RateLimitError(Exception):
+    def __init__(self, message: str, retry_after_seconds: Optional[int] = None):
+        self.message = message
+        self.retry_after_seconds = retry_after_seconds
+
+    def __str__(self):
+        return f"RateLimitError: {self.message}"
+
+
+class JobTimeoutError(Exception):
+    def __init__(self, message: str):
+        self.message = message
+
+    def __str__(self):
+        return f"JobTimeoutError: {self.message}"
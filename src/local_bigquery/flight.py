@@ -0,0 +1,76 @@
+import json
+import threading
+
+import duckdb
+import pyarrow as pa
+import pyarrow.flight as flight
+import sqlglot
+from google.protobuf import any_pb2, wrappers_pb2
+
+from local_bigquery import db
+from local_bigquery.errors import NotFoundError
+from local_bigquery.settings import settings
+
+STATEMENT_QUERY_TYPE = (
+    "type.googleapis.com/arrow.flight.protocol.sql.CommandStatementQuery"
+)
+
+
+def parse_command(command: bytes) -> dict:
+    """
+    Reads a query from a flight descriptor or ticket command.
+
+    Accepts a Flight SQL `CommandStatementQuery`, a JSON object with `query`
+    and optional `projectId`/`datasetId`, or plain BigQuery SQL.
+    """
+    message = any_pb2.Any()
+    try:
+        message.ParseFromString(command)
+    except Exception:
+        message = None
+    if message is not None and message.type_url == STATEMENT_QUERY_TYPE:
+        # CommandStatementQuery's first field is the query string, which is all
+        # a StringValue reads; the optional transaction ID is skipped.
+        query = wrappers_pb2.StringValue.FromString(message.value).value
+        return {"query": query}
+    text = command.decode()
+    if text.lstrip().startswith("{"):
+        return json.loads(text)
+    return {"query": text}
+
+
+class FlightServer(flight.FlightServerBase):
+    """
+    Serves BigQuery SQL over Arrow Flight, streaming record batches straight
+    from DuckDB without going through the JSON REST representation.
+    """
+
+    def get_flight_info(self, context, descriptor):
+        request = parse_command(descriptor.command)
+        ticket = flight.Ticket(json.dumps(request).encode())
+        endpoint = flight.FlightEndpoint(ticket, [])
+        return flight.FlightInfo(pa.schema([]), descriptor, [endpoint], -1, -1)
+
+    def do_get(self, context, ticket):
+        request = parse_command(ticket.ticket)
+        batches = db.query_record_batches(
+            request.get("projectId") or settings.default_project_id,
+            request.get("datasetId"),
+            request["query"],
+            batch_rows=settings.flight_batch_rows,
+        )
+        try:
+            schema = next(batches, None)
+        except (NotFoundError, sqlglot.ParseError, duckdb.Error) as e:
+            raise flight.FlightServerError(str(e))
+        if schema is None:
+            return flight.RecordBatchStream(pa.table({}))
+        return flight.GeneratorStream(schema, batches)
+
+
+def serve(port: int) -> FlightServer:
+    server = FlightServer(f"grpc://{settings.bigquery_host}:{port}")
+    threading.Thread(
+        target=server.serve, name="local-bigquery-flight", daemon=True
+    ).start()
+    return server
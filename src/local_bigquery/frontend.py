@@ -0,0 +1,201 @@
+import contextlib
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from typing import Optional
+
+import httpx
+from fastapi import FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
+
+from local_bigquery import db
+from local_bigquery.main import error_response
+from local_bigquery.settings import settings
+
+PROJECT_PATH = re.compile(r"/projects/([^/]+)")
+DEFAULT_GROUP = "default"
+# Headers that describe a single connection, or a body httpx has already decoded.
+HOP_HEADERS = {
+    "connection",
+    "content-encoding",
+    "content-length",
+    "host",
+    "keep-alive",
+    "transfer-encoding",
+}
+
+
+class Worker:
+    """A server process for one group of projects, restarted if it dies."""
+
+    def __init__(self, name: str, port: int, env: dict[str, str]):
+        self.name = name
+        self.port = port
+        self.env = env
+        self.url = f"http://127.0.0.1:{port}"
+        self.lock = threading.Lock()
+        self.process: Optional[subprocess.Popen] = None
+        self.starts = 0
+
+    def ensure_started(self):
+        with self.lock:
+            if self.process is not None and self.process.poll() is None:
+                return
+            self.process = subprocess.Popen(
+                [
+                    sys.executable,
+                    "-m",
+                    "uvicorn",
+                    "local_bigquery:app",
+                    "--host",
+                    "127.0.0.1",
+                    "--port",
+                    str(self.port),
+                ],
+                env={**os.environ, **self.env},
+            )
+            self.starts += 1
+            deadline = time.monotonic() + settings.worker_start_timeout_seconds
+            while time.monotonic() < deadline:
+                if self.process.poll() is not None:
+                    break
+                try:
+                    httpx.get(f"{self.url}/admin/pool", timeout=1)
+                    return
+                except httpx.TransportError:
+                    time.sleep(0.05)
+            raise RuntimeError(f"Worker {self.name} did not start in time")
+
+    def stop(self):
+        with self.lock:
+            if self.process is not None and self.process.poll() is None:
+                self.process.terminate()
+                self.process.wait()
+
+    def status(self) -> dict:
+        running = self.process is not None and self.process.poll() is None
+        return {
+            "url": self.url,
+            "pid": self.process.pid if running else None,
+            "running": running,
+            "starts": self.starts,
+        }
+
+
+class Router:
+    """
+    Routes each project to its worker process.
+
+    Projects listed in `project_groups` share their group's worker. With
+    `isolate_projects`, every other project that already exists gets a worker
+    of its own too, up to `max_workers` in all; otherwise they share the
+    default worker, which also serves requests that aren't for a project.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.groups = {
+            project_id: group
+            for group, project_ids in settings.project_groups.items()
+            for project_id in project_ids
+        }
+        self.workers: dict[str, Worker] = {}
+        self.worker(DEFAULT_GROUP)
+        for group in settings.project_groups:
+            self.worker(group)
+
+    def worker(self, group: str, limited: bool = False) -> Worker:
+        with self.lock:
+            worker = self.workers.get(group)
+            if worker is None and limited and len(self.workers) >= settings.max_workers:
+                worker = self.workers[DEFAULT_GROUP]
+            if worker is None:
+                port = settings.worker_base_port + len(self.workers)
+                env = {
+                    "DATA_DIR": str(settings.data_dir),
+                    # Workers share DATA_DIR, so they have to coordinate.
+                    "WORKERS": str(max(len(settings.project_groups) + 1, 2)),
+                    "MEMORY_LIMIT": settings.worker_memory_limit,
+                }
+                worker = self.workers[group] = Worker(group, port, env)
+            return worker
+
+    def route(self, path: str) -> Worker:
+        match = PROJECT_PATH.search(path)
+        if not match:
+            return self.worker(DEFAULT_GROUP)
+        project_id = match.group(1)
+        group = self.groups.get(project_id)
+        if group is not None:
+            return self.worker(group)
+        if settings.isolate_projects:
+            with self.lock:
+                worker = self.workers.get(project_id)
+            if worker is not None:
+                return worker
+            # Unknown project IDs mustn't each start a process.
+            if project_id in db.find_projects():
+                return self.worker(project_id, limited=True)
+        return self.worker(DEFAULT_GROUP)
+
+    def stop(self):
+        with self.lock:
+            workers = list(self.workers.values())
+        for worker in workers:
+            worker.stop()
+
+    def status(self) -> dict:
+        with self.lock:
+            return {
+                group: worker.status() for group, worker in sorted(self.workers.items())
+            }
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.router = Router()
+    app.state.client = httpx.AsyncClient(timeout=None)
+    await run_in_threadpool(app.state.router.worker(DEFAULT_GROUP).ensure_started)
+    yield
+    await app.state.client.aclose()
+    app.state.router.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.get("/frontend/workers")
+def frontend_workers(request: Request):
+    return request.app.state.router.status()
+
+
+@app.api_route(
+    "/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD"]
+)
+async def proxy(request: Request, path: str) -> Response:
+    worker = request.app.state.router.route(request.url.path)
+    await run_in_threadpool(worker.ensure_started)
+    try:
+        response = await request.app.state.client.request(
+            request.method,
+            f"{worker.url}{request.url.path}",
+            params=request.query_params,
+            headers={
+                k: v for k, v in request.headers.items() if k.lower() not in HOP_HEADERS
+            },
+            content=await request.body(),
+        )
+    except httpx.TransportError as e:
+        # The worker died mid-request, e.g. out of memory. It's restarted on
+        # the next request, so tell the client to retry.
+        return error_response(503, f"Worker {worker.name} failed: {e}", "backendError")
+    return Response(
+        content=response.content,
+        status_code=response.status_code,
+        headers={
+            k: v for k, v in response.headers.items() if k.lower() not in HOP_HEADERS
+        },
+    )
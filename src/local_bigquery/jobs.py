@@ -0,0 +1,244 @@
+import logging
+import pathlib
+import re
+import uuid
+from typing import Optional
+
+import duckdb
+import sqlglot
+
+from local_bigquery import db, reservations
+from local_bigquery.completion import completions
+from local_bigquery.db import timestamp_now
+from local_bigquery.errors import InvalidError, JobTimeoutError, NotFoundError
+from local_bigquery.models import (
+    AccelerationMode,
+    BiEngineMode,
+    BiEngineReason,
+    BiEngineStatistics,
+    Code,
+    Code2,
+    ErrorProto,
+    GetQueryResultsResponse,
+    Job,
+    JobConfiguration,
+    JobCreationReason,
+    JobReference,
+    JobStatistics,
+    JobStatistics2,
+    JobStatus,
+    SessionInfo,
+    TableReference,
+    TableRow,
+    TableSchema,
+)
+from local_bigquery.settings import settings
+
+
+# How long jobs.query waits for a query before returning, as BigQuery does.
+DEFAULT_QUERY_TIMEOUT_MS = 10_000
+
+
+JOB_ID = re.compile(r"[a-zA-Z0-9_-]{1,1024}")
+
+
+def validate_job_id(job_id: str) -> str:
+    if not JOB_ID.fullmatch(job_id):
+        raise InvalidError(
+            f"Invalid job ID {job_id!r}. Job IDs must be alphanumeric (plus "
+            "underscores and dashes) and at most 1024 characters long."
+        )
+    return job_id
+
+
+def submitted_configuration(configuration: JobConfiguration) -> dict:
+    """A job's configuration as it was submitted, without what running it added."""
+    submitted = configuration.model_dump(exclude_none=True, by_alias=True)
+    query = submitted.get("query") or {}
+    destination = query.get("destinationTable") or {}
+    if destination.get("datasetId") == db.RESULTS_DATASET_ID:
+        del query["destinationTable"]
+    return submitted
+
+
+def same_configuration(a: JobConfiguration, b: JobConfiguration) -> bool:
+    return submitted_configuration(a) == submitted_configuration(b)
+
+
+def results_table(project_id: str, job_id: str) -> Optional[pathlib.Path]:
+    """Where to write a query's results for the Storage Read API, if enabled."""
+    if settings.storage_api_port <= 0:
+        return None
+    return db.query_results_path(project_id, job_id)
+
+
+def query_job(
+    project_id: str, job_id: str, configuration: JobConfiguration, state: str
+) -> Job:
+    """Builds the resource for a query job that hasn't run yet."""
+    return Job(
+        configuration=configuration,
+        id=job_id,
+        jobCreationReason=JobCreationReason(code=Code2.REQUESTED),
+        jobReference=JobReference(jobId=job_id, location="US", projectId=project_id),
+        selfLink=f"/bigquery/v2/projects/{project_id}/jobs/{job_id}",
+        statistics=JobStatistics(
+            creationTime=timestamp_now(),
+            query=JobStatistics2(
+                biEngineStatistics=BiEngineStatistics(
+                    accelerationMode=AccelerationMode.BI_ENGINE_DISABLED,
+                    biEngineMode=BiEngineMode.DISABLED,
+                    biEngineReasons=[
+                        BiEngineReason(
+                            code=Code.OTHER_REASON,
+                            message="BI Engine is not emulated",
+                        )
+                    ],
+                ),
+                statementType="SELECT",
+            ),
+            sessionInfo=SessionInfo(sessionId=str(uuid.uuid4())),
+        ),
+        status=JobStatus(state=state),
+    )
+
+
+def run(
+    project_id: str, job: Job, reservation: Optional[str] = None
+) -> GetQueryResultsResponse:
+    """Runs a query job, then records its results and marks it done."""
+    job_id = job.jobReference.jobId
+    query = job.configuration.query
+    default_dataset = query.defaultDataset
+    results_path = results_table(project_id, job_id)
+    job.statistics.startTime = timestamp_now()
+    if reservation:
+        job.statistics.reservation_id = reservation
+    if query.writeIncrementalResults:
+        rows, schema = run_incremental(project_id, job, reservation)
+    else:
+        rows, schema = db.query(
+            default_dataset.projectId if default_dataset else project_id,
+            default_dataset.datasetId if default_dataset else None,
+            query.query,
+            parameters=query.queryParameters,
+            results_path=results_path,
+            budget=reservations.budget(reservation, query.connectionProperties),
+            timeout_seconds=job_timeout_seconds(job.configuration),
+        )
+    in_results_table = results_path is not None and results_path.exists()
+    if in_results_table:
+        query.destinationTable = TableReference(
+            projectId=project_id, datasetId=db.RESULTS_DATASET_ID, tableId=job_id
+        )
+    results = GetQueryResultsResponse(
+        cacheHit=False,
+        jobComplete=True,
+        jobReference=job.jobReference,
+        numDmlAffectedRows="0",
+        rows=rows,
+        schema=schema,
+        totalBytesProcessed="0",
+        totalRows=str(len(rows)),
+    )
+    # With a results table, pages are read back from it rather than stored.
+    stored = results.model_copy(update={"rows": None}) if in_results_table else results
+    db.set_query_results(project_id, job_id, stored)
+    job.statistics.completionRatio = 1.0
+    job.statistics.endTime = timestamp_now()
+    job.status = JobStatus(state="DONE")
+    db.update_job(project_id, job_id, job)
+    completions.notify(project_id, job_id)
+    return results
+
+
+def run_incremental(
+    project_id: str, job: Job, reservation: Optional[str] = None
+) -> tuple[list[TableRow], TableSchema]:
+    """
+    Runs a query, writing its results so far as DuckDB produces them, so
+    clients can page through the first rows while the rest are computed.
+
+    Results are rewritten each time the rows written so far have doubled,
+    which keeps the total written to about twice the final results.
+    """
+    job_id = job.jobReference.jobId
+    query = job.configuration.query
+    default_dataset = query.defaultDataset
+    chunks = db.query_incremental(
+        default_dataset.projectId if default_dataset else project_id,
+        default_dataset.datasetId if default_dataset else None,
+        query.query,
+        parameters=query.queryParameters,
+        budget=reservations.budget(reservation, query.connectionProperties),
+        timeout_seconds=job_timeout_seconds(job.configuration),
+        batch_rows=settings.incremental_results_batch_rows,
+    )
+    schema = next(chunks)
+    rows: list[TableRow] = []
+    written = 0
+    for chunk in chunks:
+        rows.extend(chunk)
+        if len(rows) < 2 * written:
+            continue
+        results = GetQueryResultsResponse(
+            jobComplete=False,
+            jobReference=job.jobReference,
+            rows=rows,
+            schema=schema,
+            totalRows=str(len(rows)),
+        )
+        db.set_query_results(project_id, job_id, results)
+        completions.notify(project_id, job_id)
+        written = len(rows)
+    return rows, schema
+
+
+def run_recorded(project_id: str, job: Job, reservation: Optional[str] = None):
+    """Runs a job, recording any failure on the job itself before raising it."""
+    try:
+        return run(project_id, job, reservation)
+    except Exception as e:
+        job.statistics.endTime = timestamp_now()
+        job.status = JobStatus(
+            state="DONE", errorResult=ErrorProto(reason=error_reason(e), message=str(e))
+        )
+        db.update_job(project_id, job.jobReference.jobId, job)
+        completions.notify(project_id, job.jobReference.jobId)
+        raise
+
+
+def run_queued(project_id: str, job: Job, reservation: Optional[str] = None):
+    """Runs a job that was queued, where nobody is waiting to see it fail."""
+    job.status = JobStatus(state="RUNNING")
+    db.update_job(project_id, job.jobReference.jobId, job)
+    try:
+        run_recorded(project_id, job, reservation)
+    except Exception:
+        logging.exception(f"Job {project_id}:{job.jobReference.jobId}")
+
+
+def job_timeout_seconds(configuration: JobConfiguration) -> Optional[float]:
+    if not configuration.jobTimeoutMs:
+        return None
+    try:
+        timeout_ms = int(configuration.jobTimeoutMs)
+    except ValueError:
+        raise InvalidError(f"Invalid jobTimeoutMs: {configuration.jobTimeoutMs}")
+    if timeout_ms <= 0:
+        raise InvalidError(f"Invalid jobTimeoutMs: {configuration.jobTimeoutMs}")
+    return timeout_ms / 1000
+
+
+def error_reason(e: Exception) -> str:
+    if isinstance(e, NotFoundError):
+        return "notFound"
+    if isinstance(e, InvalidError):
+        return "invalid"
+    if isinstance(e, JobTimeoutError):
+        return "timeout"
+    if isinstance(e, duckdb.OutOfMemoryException):
+        return "resourcesExceeded"
+    if isinstance(e, (sqlglot.ParseError, duckdb.Error)):
+        return "invalidQuery"
+    return "backendError"
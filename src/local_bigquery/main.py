@@ -1,8 +1,10 @@
+import contextlib
 import json
 import logging
 import pathlib
 import traceback
 import uuid
+from concurrent import futures
 from datetime import datetime
 from typing import Optional
 
@@ -12,16 +14,19 @@ from fastapi import APIRouter, Depends, FastAPI, Path, Query, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 
-from . import db
-from .db import timestamp_now
-from .errors import NotFoundError, AlreadyExistsError
+from . import db, jobs, maintenance, reservations, scheduler, workers
+from .completion import completions
+from .continuous import continuous_queries
+from .errors import (
+    NotFoundError,
+    AlreadyExistsError,
+    InvalidError,
+    JobTimeoutError,
+    RateLimitError,
+)
+from .settings import settings
 from .models import (
-    AccelerationMode,
     BatchDeleteRowAccessPoliciesRequest,
-    BiEngineMode,
-    BiEngineReason,
-    BiEngineStatistics,
-    Code,
     Code2,
     CommonQueryParams,
     Dataset,
@@ -34,10 +39,6 @@ from .models import (
     JobCancelResponse,
     JobCreationReason,
     JobList,
-    JobReference,
-    JobStatistics,
-    JobStatistics2,
-    JobStatus,
     ListModelsResponse,
     ListRoutinesResponse,
     ListRowAccessPoliciesResponse,
@@ -49,7 +50,6 @@ from .models import (
     QueryResponse,
     Routine,
     RowAccessPolicy,
-    SessionInfo,
     SetIamPolicyRequest,
     StateFilterEnum,
     Table,
@@ -66,7 +66,36 @@ from .models import (
 )
 
 
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    db.warm_catalog()
+    # With several workers, only one runs maintenance and the gRPC servers.
+    leader = workers.is_leader()
+    if leader:
+        maintenance.scheduler.start()
+        continuous_queries.resume()
+    storage_server = None
+    if leader and settings.storage_api_port > 0:
+        from . import storage
+
+        storage_server = storage.serve(settings.storage_api_port)
+    flight_server = None
+    if leader and settings.flight_port > 0:
+        from . import flight
+
+        flight_server = flight.serve(settings.flight_port)
+    yield
+    if flight_server is not None:
+        flight_server.shutdown()
+    if storage_server is not None:
+        storage_server.stop(grace=None)
+    maintenance.scheduler.stop()
+    scheduler.scheduler.stop()
+    continuous_queries.stop()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     contact={"name": "Google", "url": "https://google.com"},
     description="A data platform for customers to create, manage, share and query data.",
     license={
@@ -82,12 +111,19 @@ discovery = json.loads(
 )
 bigquery_router = APIRouter()
 discovery_router = APIRouter()
+admin_router = APIRouter()
 
 
-def error_response(status_code: int, message: str, reason: str) -> JSONResponse:
+def error_response(
+    status_code: int,
+    message: str,
+    reason: str,
+    headers: Optional[dict[str, str]] = None,
+) -> JSONResponse:
     logging.error(message)
     return JSONResponse(
         status_code=status_code,
+        headers=headers,
         content={
             "error": {
                 "errors": [
@@ -121,11 +157,38 @@ async def already_exists_error_handler(
     return error_response(409, str(e), "duplicate")
 
 
+@app.exception_handler(InvalidError)
+async def invalid_error_handler(request: Request, e: InvalidError) -> JSONResponse:
+    return error_response(400, str(e), "invalid")
+
+
+@app.exception_handler(RateLimitError)
+async def rate_limit_error_handler(request: Request, e: RateLimitError) -> JSONResponse:
+    headers = None
+    if e.retry_after_seconds is not None:
+        headers = {"Retry-After": str(e.retry_after_seconds)}
+    return error_response(429, str(e), "rateLimitExceeded", headers)
+
+
+@app.exception_handler(JobTimeoutError)
+async def job_timeout_error_handler(
+    request: Request, e: JobTimeoutError
+) -> JSONResponse:
+    return error_response(400, str(e), "timeout")
+
+
 @app.exception_handler(sqlglot.ParseError)
 async def parse_error_handler(request: Request, e: sqlglot.ParseError) -> JSONResponse:
     return error_response(400, str(e), "invalidQuery")
 
 
+@app.exception_handler(duckdb.OutOfMemoryException)
+async def out_of_memory_error_handler(
+    request: Request, e: duckdb.OutOfMemoryException
+) -> JSONResponse:
+    return error_response(400, str(e), "resourcesExceeded")
+
+
 @app.exception_handler(duckdb.Error)
 async def duckdb_error_handler(request: Request, e: duckdb.Error) -> JSONResponse:
     return error_response(400, str(e), "invalidQuery")
@@ -465,8 +528,9 @@ def bigquery_tables_insert(
     params: CommonQueryParams = Depends(),
     body: Table = None,
 ) -> Table:
-    db.create_table(project_id, dataset_id, body.tableReference.tableId, body.schema_)
-    return body
+    table_id = body.tableReference.tableId
+    db.create_table(project_id, dataset_id, table_id, body.schema_, resource=body)
+    return db.get_table(project_id, dataset_id, table_id)
 
 
 @bigquery_router.delete(
@@ -498,7 +562,12 @@ def bigquery_tables_get(
     view: Optional[View] = None,
     params: CommonQueryParams = Depends(),
 ) -> Table:
-    raise NotImplementedError("Get table is not implemented yet.")
+    return db.get_table(
+        project_id,
+        dataset_id,
+        table_id,
+        selected_fields=selected_fields.split(",") if selected_fields else None,
+    )
 
 
 @bigquery_router.patch(
@@ -515,7 +584,7 @@ def bigquery_tables_patch(
     params: CommonQueryParams = Depends(),
     body: Table = None,
 ) -> Table:
-    raise NotImplementedError("Patch table is not implemented yet.")
+    return db.update_table(project_id, dataset_id, table_id, body)
 
 
 @bigquery_router.put(
@@ -532,7 +601,7 @@ def bigquery_tables_update(
     params: CommonQueryParams = Depends(),
     body: Table = None,
 ) -> Table:
-    raise NotImplementedError("Update table is not implemented yet.")
+    return db.update_table(project_id, dataset_id, table_id, body, replace=True)
 
 
 @bigquery_router.get(
@@ -548,13 +617,21 @@ def bigquery_tabledata_list(
     format_options_use_int64_timestamp: Optional[bool] = Query(
         None, alias="formatOptions.useInt64Timestamp"
     ),
-    max_results: Optional[int] = Query(10, alias="maxResults"),
+    max_results: Optional[int] = Query(None, alias="maxResults"),
     page_token: Optional[str] = Query(None, alias="pageToken"),
     selected_fields: Optional[str] = Query(None, alias="selectedFields"),
     start_index: Optional[str] = Query(None, alias="startIndex"),
     params: CommonQueryParams = Depends(),
 ) -> TableDataList:
-    raise NotImplementedError("List table data is not implemented yet.")
+    return db.list_table_rows(
+        project_id,
+        dataset_id,
+        table_id,
+        selected_fields=selected_fields.split(",") if selected_fields else None,
+        start_index=int(start_index or 0),
+        max_results=max_results,
+        page_token=page_token,
+    )
 
 
 @bigquery_router.post(
@@ -701,7 +778,7 @@ def bigquery_jobs_list(
     project_id: str = Path(..., alias="projectId"),
     all_users: Optional[bool] = Query(None, alias="allUsers"),
     max_creation_time: Optional[str] = Query(None, alias="maxCreationTime"),
-    max_results: Optional[int] = Query(10, alias="maxResults"),
+    max_results: Optional[int] = Query(None, alias="maxResults"),
     min_creation_time: Optional[str] = Query(None, alias="minCreationTime"),
     page_token: Optional[str] = Query(None, alias="pageToken"),
     parent_job_id: Optional[str] = Query(None, alias="parentJobId"),
@@ -709,8 +786,22 @@ def bigquery_jobs_list(
     state_filter: Optional[list[StateFilterEnum]] = Query(None, alias="stateFilter"),
     params: CommonQueryParams = Depends(),
 ) -> JobList:
-    jobs = db.list_jobs(project_id)
-    return JobList(jobs=jobs)
+    # Every job belongs to the single local user, so allUsers has no effect.
+    # Creation times are stored in seconds but filtered in milliseconds.
+    jobs, next_page_token = db.list_jobs(
+        project_id,
+        max_results=max_results,
+        page_token=page_token,
+        states=[state.value.upper() for state in state_filter or []],
+        min_creation_time=int(min_creation_time) // 1000 if min_creation_time else None,
+        max_creation_time=int(max_creation_time) // 1000 if max_creation_time else None,
+        parent_job_id=parent_job_id,
+        minimal=projection == Projection.minimal,
+    )
+    job_list = JobList(jobs=jobs, kind="bigquery#jobList")
+    if next_page_token:
+        job_list.nextPageToken = next_page_token
+    return job_list
 
 
 @bigquery_router.post(
@@ -724,73 +815,74 @@ def bigquery_jobs_insert(
     params: CommonQueryParams = Depends(),
     body: Optional[Job] = None,
 ) -> Job:
-    default_dataset = body.configuration.query.defaultDataset
-    rows, schema = db.query(
-        default_dataset.projectId if default_dataset else project_id,
-        default_dataset.datasetId if default_dataset else None,
-        body.configuration.query.query,
-        parameters=body.configuration.query.queryParameters,
-    )
-    job_id = str(uuid.uuid4())
-    session_id = str(uuid.uuid4())
-    now = timestamp_now()
-    job_reference = JobReference(jobId=job_id, location="US", projectId=project_id)
-    job = Job(
-        configuration=body.configuration,
-        id=job_id,
-        jobCreationReason=JobCreationReason(code=Code2.REQUESTED),
-        jobReference=job_reference,
-        selfLink=f"/bigquery/v2/projects/{project_id}/jobs/{job_id}",
-        statistics=JobStatistics(
-            completionRatio=1.0,
-            creationTime=now,
-            endTime=now,
-            query=JobStatistics2(
-                biEngineStatistics=BiEngineStatistics(
-                    accelerationMode=AccelerationMode.BI_ENGINE_DISABLED,
-                    biEngineMode=BiEngineMode.DISABLED,
-                    biEngineReasons=[
-                        BiEngineReason(
-                            code=Code.OTHER_REASON,
-                            message="BI Engine is not emulated",
-                        )
-                    ],
-                ),
-                statementType="SELECT",
-            ),
-            sessionInfo=SessionInfo(sessionId=session_id),
-            startTime=now,
-        ),
-        status=JobStatus(state="DONE"),
-    )
-    db.create_job(project_id, job_id, job)
-    results_response = GetQueryResultsResponse(
-        cacheHit=False,
-        jobComplete=True,
-        jobReference=job_reference,
-        numDmlAffectedRows="0",
-        rows=rows,
-        schema=schema,
-        totalBytesProcessed="0",
-        totalRows=str(len(rows)),
+    job_id = body.jobReference.jobId if body.jobReference else None
+    job_id = jobs.validate_job_id(job_id) if job_id else str(uuid.uuid4())
+    priority = body.configuration.query.priority or scheduler.INTERACTIVE
+    reservation = reservations.find(project_id, body.configuration)
+    batch = priority.upper() == scheduler.BATCH
+    # Batch jobs wait in their queue, and clients poll until they're done.
+    job = jobs.query_job(
+        project_id, job_id, body.configuration, "PENDING" if batch else "RUNNING"
     )
-    db.set_query_results(project_id, job_id, results_response)
+    try:
+        db.create_job(project_id, job_id, job)
+    except AlreadyExistsError:
+        # A retry gets the job it already started, rather than running it again.
+        existing = db.get_job(project_id, job_id)
+        if existing is None or not jobs.same_configuration(
+            existing.configuration, body.configuration
+        ):
+            raise AlreadyExistsError(f"Already Exists: Job {project_id}:US.{job_id}")
+        return existing
+    if body.configuration.query.continuous:
+        start_continuous(project_id, job)
+        return job
+    try:
+        running = scheduler.scheduler.submit(
+            priority,
+            jobs.run_queued if batch else jobs.run_recorded,
+            project_id,
+            job,
+            reservation,
+            reservation=reservation,
+        )
+    except RateLimitError:
+        db.delete_job(project_id, job_id)
+        raise
+    if not batch:
+        running.result()
     return job
 
 
+def start_continuous(project_id: str, job: Job):
+    try:
+        continuous_queries.start(project_id, job)
+    except Exception:
+        db.delete_job(project_id, job.jobReference.jobId)
+        raise
+
+
 @bigquery_router.get(
     "/projects/{projectId}/jobs/{jobId}",
     response_model=Job,
     response_model_exclude_unset=True,
     tags=["jobs"],
 )
-def bigquery_jobs_get(
+async def bigquery_jobs_get(
     project_id: str = Path(..., alias="projectId"),
     job_id: str = Path(..., alias="jobId"),
     location: Optional[str] = None,
+    timeout_ms: Optional[int] = Query(0, alias="timeoutMs"),
     params: CommonQueryParams = Depends(),
 ) -> Job:
-    job = db.get_job(project_id, job_id)
+    # Not part of the BigQuery API: with timeoutMs, wait for the job to finish.
+    job = await completions.wait(
+        project_id,
+        job_id,
+        (timeout_ms or 0) / 1000,
+        lambda: db.get_job(project_id, job_id),
+        lambda job: job is None or job.status is None or job.status.state == "DONE",
+    )
     if job is None:
         raise NotFoundError(f'Job "{job_id}" not found in project "{project_id}"')
     return job
@@ -811,6 +903,9 @@ def bigquery_jobs_cancel(
     job = db.get_job(project_id, job_id)
     if job is None:
         raise NotFoundError(f'Job "{job_id}" not found in project "{project_id}"')
+    query = job.configuration.query if job.configuration else None
+    if query and query.continuous and job.status.state != "DONE":
+        job = continuous_queries.cancel(project_id, job)
     return JobCancelResponse(job=job)
 
 
@@ -843,74 +938,74 @@ def bigquery_jobs_query(
     params: CommonQueryParams = Depends(),
     body: QueryRequest = None,
 ) -> QueryResponse:
-    default_dataset = body.defaultDataset
-    rows, schema = db.query(
-        default_dataset.projectId if default_dataset else project_id,
-        default_dataset.datasetId if default_dataset else None,
-        body.query,
-        parameters=body.queryParameters,
-    )
     job_id = str(uuid.uuid4())
-    session_id = str(uuid.uuid4())
-    now = timestamp_now()
-    job_reference = JobReference(jobId=job_id, location="US", projectId=project_id)
-    job = Job(
-        configuration=body.to_job_configuration(),
-        id=job_id,
-        jobCreationReason=JobCreationReason(code=Code2.REQUESTED),
-        jobReference=job_reference,
-        selfLink=f"/bigquery/v2/projects/{project_id}/jobs/{job_id}",
-        statistics=JobStatistics(
-            completionRatio=1.0,
-            creationTime=now,
-            endTime=now,
-            query=JobStatistics2(
-                biEngineStatistics=BiEngineStatistics(
-                    accelerationMode=AccelerationMode.BI_ENGINE_DISABLED,
-                    biEngineMode=BiEngineMode.DISABLED,
-                    biEngineReasons=[
-                        BiEngineReason(
-                            code=Code.OTHER_REASON,
-                            message="BI Engine is not emulated",
-                        )
-                    ],
-                ),
-                statementType="SELECT",
-            ),
-            sessionInfo=SessionInfo(sessionId=session_id),
-            startTime=now,
-        ),
-        status=JobStatus(state="DONE"),
-    )
+    configuration = body.to_job_configuration()
+    reservation = reservations.find(project_id, configuration)
+    job = jobs.query_job(project_id, job_id, configuration, "RUNNING")
     db.create_job(project_id, job_id, job)
-    query_results = GetQueryResultsResponse(
-        cacheHit=False,
-        jobComplete=True,
-        jobReference=job_reference,
-        numDmlAffectedRows="0",
-        rows=rows,
-        schema=schema,
-        totalBytesProcessed="0",
-        totalRows=str(len(rows)),
-    )
-    db.set_query_results(project_id, job_id, query_results)
+    if configuration.query.continuous:
+        # Continuous queries run until cancelled, so there's nothing to wait for.
+        start_continuous(project_id, job)
+        return QueryResponse(
+            creationTime=job.statistics.creationTime,
+            jobComplete=False,
+            jobCreationReason=JobCreationReason(code=Code2.REQUESTED),
+            jobReference=job.jobReference,
+            location="US",
+            queryId=job_id,
+        )
+    try:
+        running = scheduler.scheduler.submit(
+            scheduler.INTERACTIVE,
+            jobs.run_recorded,
+            project_id,
+            job,
+            reservation,
+            reservation=reservation,
+        )
+    except RateLimitError:
+        db.delete_job(project_id, job_id)
+        raise
+    timeout_ms = body.timeoutMs
+    if timeout_ms is None:
+        timeout_ms = jobs.DEFAULT_QUERY_TIMEOUT_MS
+    statistics = job.statistics
+    try:
+        results = running.result(timeout=timeout_ms / 1000)
+    except futures.TimeoutError:
+        # The query keeps running, and clients poll getQueryResults for it.
+        response = QueryResponse(
+            creationTime=statistics.creationTime,
+            jobComplete=False,
+            jobCreationReason=JobCreationReason(code=Code2.REQUESTED),
+            jobReference=job.jobReference,
+            location="US",
+            queryId=job_id,
+        )
+        partial = db.get_query_results_page(project_id, job_id)
+        if partial is not None and partial.rows:
+            response.rows = partial.rows
+            response.schema_ = partial.schema_
+            response.totalRows = partial.totalRows
+            response.pageToken = partial.pageToken
+        return response
     return QueryResponse(
         cacheHit=False,
-        creationTime=now,
-        endTime=now,
+        creationTime=statistics.creationTime,
+        endTime=statistics.endTime,
         jobComplete=True,
         jobCreationReason=JobCreationReason(code=Code2.REQUESTED),
-        jobReference=job_reference,
+        jobReference=job.jobReference,
         location="US",
         numDmlAffectedRows="0",
         queryId=job_id,
-        rows=rows,
-        schema=schema,
-        sessionInfo=SessionInfo(sessionId=session_id),
-        startTime=now,
+        rows=results.rows,
+        schema=results.schema_,
+        sessionInfo=statistics.sessionInfo,
+        startTime=statistics.startTime,
         totalBytesBilled="0",
         totalBytesProcessed="0",
-        totalRows=str(len(rows)),
+        totalRows=results.totalRows,
         totalSlotMs="0",
     )
 
@@ -921,20 +1016,56 @@ def bigquery_jobs_query(
     response_model_exclude_unset=True,
     tags=["jobs"],
 )
-def bigquery_jobs_get_query_results(
+async def bigquery_jobs_get_query_results(
     project_id: str = Path(..., alias="projectId"),
     job_id: str = Path(..., alias="jobId"),
     format_options_use_int64_timestamp: Optional[bool] = Query(
         None, alias="formatOptions.useInt64Timestamp"
     ),
     location: Optional[str] = None,
-    max_results: Optional[int] = Query(10, alias="maxResults"),
+    max_results: Optional[int] = Query(None, alias="maxResults"),
     page_token: Optional[str] = Query(None, alias="pageToken"),
-    start_index: Optional[str] = Query(None, alias="startIndex"),
+    start_index: Optional[int] = Query(0, alias="startIndex"),
     timeout_ms: Optional[int] = Query(None, alias="timeoutMs"),
     params: CommonQueryParams = Depends(),
 ) -> GetQueryResultsResponse:
-    results = db.get_query_results(project_id, job_id)
+    def check():
+        results = db.get_query_results_page(
+            project_id, job_id, start_index or 0, max_results, page_token
+        )
+        incomplete = results is None or not results.jobComplete
+        job = db.get_job(project_id, job_id) if incomplete else None
+        return results, job
+
+    def done(value) -> bool:
+        results, job = value
+        if results is not None and (results.jobComplete or results.rows):
+            return True
+        return job is None or job.status is None or job.status.state == "DONE"
+
+    if timeout_ms is None:
+        timeout_ms = jobs.DEFAULT_QUERY_TIMEOUT_MS
+    # Hold the request until the job finishes or the timeout passes.
+    results, job = await completions.wait(
+        project_id, job_id, timeout_ms / 1000, check, done
+    )
+    if job is not None and job.status and job.status.errorResult:
+        # Clients fetch the job itself to find out why it failed.
+        return GetQueryResultsResponse(
+            errors=[job.status.errorResult],
+            jobComplete=True,
+            jobReference=job.jobReference,
+        )
+    if job is not None and job.status and job.status.state != "DONE":
+        # Incremental results are returned as far as they've been written.
+        return results or GetQueryResultsResponse(
+            jobComplete=False, jobReference=job.jobReference
+        )
+    if results is None and job is not None:
+        raise NotFoundError(
+            f"Not found: Table {project_id}:{db.RESULTS_DATASET_ID}.{job_id}, "
+            "the results of this job have expired"
+        )
     if results is None:
         raise NotFoundError(
             f'No results for job "{job_id}" not found in project "{project_id}"'
@@ -1009,5 +1140,54 @@ def discovery_v1_apis():
     return discovery
 
 
+@admin_router.get("/maintenance", tags=["admin"])
+def admin_maintenance_status():
+    return maintenance.scheduler.status()
+
+
+@admin_router.get("/pool", tags=["admin"])
+def admin_pool_status():
+    with db.budget_pools_lock:
+        budget_pools = dict(db.budget_pools)
+    reserved = {
+        name: budget_pools.get(reservations.budget(name))
+        for name in sorted(settings.reservations)
+    }
+    return {
+        **db.pool.status(),
+        "reservations": {
+            name: cursors.status()
+            for name, cursors in reserved.items()
+            if cursors is not None
+        },
+        "budgets": [
+            {
+                "threads": budget.threads,
+                "memoryLimit": budget.memory_limit,
+                "maxTempDirectorySize": budget.max_temp_directory_size,
+                **cursors.status(),
+            }
+            for budget, cursors in budget_pools.items()
+        ],
+    }
+
+
+@admin_router.get("/scheduler", tags=["admin"])
+def admin_scheduler_status():
+    return {
+        **scheduler.scheduler.status(),
+        "completions": completions.status(),
+        "singleFlight": db.single_flight.status(),
+        "continuous": continuous_queries.status(),
+    }
+
+
+@admin_router.post("/maintenance:run", tags=["admin"])
+def admin_maintenance_run():
+    maintenance.scheduler.run_cycle()
+    return maintenance.scheduler.status()
+
+
 app.include_router(bigquery_router, prefix="/bigquery/v2")
 app.include_router(discovery_router)
+app.include_router(admin_router, prefix="/admin")
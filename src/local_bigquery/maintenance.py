@@ -0,0 +1,210 @@
+import collections
+import logging
+import threading
+
+from local_bigquery import db
+from local_bigquery.settings import settings
+
+
+class MaintenanceScheduler:
+    """
+    Periodically compacts tables that have accumulated many small data files,
+    then expires old snapshots and deletes the files they no longer reference,
+    and finally deletes jobs and query results past their retention.
+
+    Compaction is rate-limited: at most `compaction_max_tables_per_cycle` tables
+    are merged per cycle, merges are spaced by `compaction_cooldown_ms`, and it
+    backs off whenever foreground requests are holding cursors.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.cycles = 0
+        self.last_cycle_time = None
+        self.tables_compacted = 0
+        self.files_merged = 0
+        self.deferred = 0
+        self.snapshots_expired = 0
+        self.files_deleted = 0
+        self.catalogs_vacuumed = 0
+        self.jobs_deleted = 0
+        self.results_expired = 0
+        self.history = collections.deque(maxlen=100)
+
+    def start(self):
+        if settings.maintenance_interval_seconds <= 0 or self.thread is not None:
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(
+            target=self.loop, name="local-bigquery-maintenance", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def loop(self):
+        while not self.stopped.is_set():
+            self.wakeup.wait(settings.maintenance_interval_seconds)
+            self.wakeup.clear()
+            if self.stopped.is_set():
+                return
+            try:
+                self.run_cycle()
+            except Exception:
+                logging.exception("Maintenance cycle failed")
+
+    def run_cycle(self):
+        with self.lock:
+            self.cycles += 1
+            self.last_cycle_time = db.timestamp_now()
+            projects = db.list_attached_projects()
+            self.compact_tables(projects)
+            for project_id in projects:
+                if self.stopped.is_set():
+                    return
+                self.expire_snapshots(project_id)
+            self.expire_jobs()
+
+    def compact_tables(self, projects: list[str]):
+        budget = settings.compaction_max_tables_per_cycle
+        for project_id in projects:
+            for stats in db.list_table_file_stats(project_id):
+                if budget <= 0:
+                    return
+                if not self.needs_compaction(stats):
+                    continue
+                if db.active_cursors.count > 0:
+                    self.deferred += 1
+                    return
+                self.compact(project_id, stats)
+                budget -= 1
+                if self.stopped.wait(settings.compaction_cooldown_ms / 1000):
+                    return
+
+    @staticmethod
+    def needs_compaction(stats: dict) -> bool:
+        if stats["file_count"] < settings.compaction_min_files:
+            return False
+        average_size = stats["file_size_bytes"] / stats["file_count"]
+        return average_size < settings.compaction_small_file_bytes
+
+    def compact(self, project_id: str, stats: dict):
+        dataset_id = stats["dataset_id"]
+        table_id = stats["table_id"]
+        entry = {
+            "action": "compact",
+            "time": db.timestamp_now(),
+            "projectId": project_id,
+            "datasetId": dataset_id,
+            "tableId": table_id,
+            "filesBefore": stats["file_count"],
+        }
+        try:
+            db.merge_table_files(project_id, dataset_id, table_id)
+        except Exception as e:
+            logging.exception(f"Compaction of {project_id}.{dataset_id}.{table_id}")
+            entry["error"] = str(e)
+        else:
+            files_after = next(
+                (
+                    s["file_count"]
+                    for s in db.list_table_file_stats(project_id)
+                    if s["dataset_id"] == dataset_id and s["table_id"] == table_id
+                ),
+                0,
+            )
+            entry["filesAfter"] = files_after
+            self.tables_compacted += 1
+            self.files_merged += stats["file_count"] - files_after
+        self.history.append(entry)
+
+    def expire_snapshots(self, project_id: str):
+        entry = {
+            "action": "expire",
+            "time": db.timestamp_now(),
+            "projectId": project_id,
+        }
+        try:
+            expired = db.expire_snapshots(
+                project_id,
+                settings.snapshot_max_age_seconds,
+                settings.snapshot_max_count,
+            )
+            deleted = db.cleanup_old_files(project_id)
+            deleted += db.delete_orphaned_files(
+                project_id, settings.orphan_file_min_age_seconds
+            )
+            if expired and db.active_cursors.count == 0:
+                db.vacuum_catalog(project_id)
+                self.catalogs_vacuumed += 1
+        except Exception as e:
+            logging.exception(f"Snapshot expiration of {project_id}")
+            entry["error"] = str(e)
+            self.history.append(entry)
+            return
+        self.snapshots_expired += expired
+        self.files_deleted += deleted
+        if expired or deleted:
+            entry["snapshotsExpired"] = expired
+            entry["filesDeleted"] = deleted
+            self.history.append(entry)
+
+    def expire_jobs(self):
+        """Deletes expired query results and old jobs, a batch at a time."""
+        now = int(db.timestamp_now())
+        batch_size = settings.retention_batch_size
+        try:
+            while not self.stopped.is_set():
+                expired = db.delete_expired_query_results(now, batch_size)
+                self.results_expired += expired
+                if expired < batch_size:
+                    break
+            if settings.job_retention_days <= 0:
+                return
+            created_before = now - settings.job_retention_days * 24 * 60 * 60
+            while not self.stopped.is_set():
+                deleted = db.delete_expired_jobs(created_before, batch_size)
+                self.jobs_deleted += deleted
+                if deleted < batch_size:
+                    break
+        except Exception as e:
+            logging.exception("Job retention")
+            self.history.append(
+                {"action": "expireJobs", "time": db.timestamp_now(), "error": str(e)}
+            )
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.thread is not None,
+            "intervalSeconds": settings.maintenance_interval_seconds,
+            "cycles": self.cycles,
+            "lastCycleTime": self.last_cycle_time,
+            "compaction": {
+                "tablesCompacted": self.tables_compacted,
+                "filesMerged": self.files_merged,
+                "deferredCycles": self.deferred,
+            },
+            "retention": {
+                "snapshotMaxAgeSeconds": settings.snapshot_max_age_seconds,
+                "snapshotMaxCount": settings.snapshot_max_count,
+                "snapshotsExpired": self.snapshots_expired,
+                "filesDeleted": self.files_deleted,
+                "catalogsVacuumed": self.catalogs_vacuumed,
+                "jobRetentionDays": settings.job_retention_days,
+                "queryResultsTtlSeconds": settings.query_results_ttl_seconds,
+                "jobsDeleted": self.jobs_deleted,
+                "resultsExpired": self.results_expired,
+            },
+            "history": list(self.history),
+        }
+
+
+scheduler = MaintenanceScheduler()
@@ -0,0 +1,235 @@
+import contextlib
+import json
+import sqlite3
+import threading
+from typing import Optional
+
+from local_bigquery.settings import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    project_id TEXT NOT NULL,
+    dataset_id TEXT NOT NULL,
+    item TEXT NOT NULL,
+    PRIMARY KEY (project_id, dataset_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS models (
+    project_id TEXT NOT NULL,
+    dataset_id TEXT NOT NULL,
+    model_id TEXT NOT NULL,
+    item TEXT NOT NULL,
+    PRIMARY KEY (project_id, dataset_id, model_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS routines (
+    project_id TEXT NOT NULL,
+    dataset_id TEXT NOT NULL,
+    routine_id TEXT NOT NULL,
+    item TEXT NOT NULL,
+    PRIMARY KEY (project_id, dataset_id, routine_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tables (
+    project_id TEXT NOT NULL,
+    dataset_id TEXT NOT NULL,
+    table_id TEXT NOT NULL,
+    item TEXT NOT NULL,
+    PRIMARY KEY (project_id, dataset_id, table_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS jobs (
+    project_id TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    state TEXT,
+    creation_time INTEGER,
+    parent_job_id TEXT,
+    user_email TEXT,
+    item TEXT NOT NULL,
+    PRIMARY KEY (project_id, job_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS jobs_by_creation_time
+    ON jobs (project_id, creation_time, job_id);
+CREATE INDEX IF NOT EXISTS jobs_by_state
+    ON jobs (project_id, state, creation_time);
+CREATE INDEX IF NOT EXISTS jobs_by_parent
+    ON jobs (project_id, parent_job_id);
+CREATE INDEX IF NOT EXISTS jobs_by_age
+    ON jobs (creation_time);
+CREATE TABLE IF NOT EXISTS job_labels (
+    project_id TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (project_id, job_id, key),
+    FOREIGN KEY (project_id, job_id)
+        REFERENCES jobs (project_id, job_id) ON DELETE CASCADE
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS job_labels_by_value
+    ON job_labels (project_id, key, value);
+CREATE TABLE IF NOT EXISTS query_results (
+    project_id TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    expire_time INTEGER,
+    item TEXT NOT NULL,
+    PRIMARY KEY (project_id, job_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS query_results_by_expiry
+    ON query_results (expire_time);
+CREATE TABLE IF NOT EXISTS continuous_queries (
+    project_id TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    source_project_id TEXT NOT NULL,
+    snapshot_id INTEGER NOT NULL,
+    PRIMARY KEY (project_id, job_id),
+    FOREIGN KEY (project_id, job_id)
+        REFERENCES jobs (project_id, job_id) ON DELETE CASCADE
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO catalog_version (id, version) VALUES (0, 0);
+"""
+
+LEGACY_TABLES = {
+    "datasets": ["project_id", "dataset_id", "item"],
+    "models": ["project_id", "dataset_id", "model_id", "item"],
+    "routines": ["project_id", "dataset_id", "routine_id", "item"],
+    "tables": ["project_id", "dataset_id", "table_id", "item"],
+    "query_results": ["project_id", "job_id", "item"],
+}
+
+local = threading.local()
+migrate_lock = threading.Lock()
+generation = 0
+
+
+def path():
+    return settings.data_dir / "metadata.sqlite"
+
+
+def connection() -> sqlite3.Connection:
+    """Returns this thread's connection to the metadata store."""
+    conn = getattr(local, "conn", None)
+    if conn is not None and local.generation == generation:
+        return conn
+    if conn is not None:
+        conn.close()
+    settings.data_dir.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path(), timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA foreign_keys = ON")
+    with migrate_lock:
+        conn.executescript(SCHEMA)
+    local.conn = conn
+    local.generation = generation
+    return conn
+
+
+@contextlib.contextmanager
+def transaction():
+    conn = connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def reset():
+    """Makes every thread reopen its connection, e.g. after the store is deleted."""
+    global generation
+    generation += 1
+
+
+def catalog_version() -> int:
+    return connection().execute("SELECT version FROM catalog_version").fetchone()[0]
+
+
+def bump_catalog_version() -> int:
+    """Records a change to the catalog, returning the new version."""
+    return (
+        connection()
+        .execute("UPDATE catalog_version SET version = version + 1 RETURNING version")
+        .fetchone()[0]
+    )
+
+
+def import_legacy(duckdb_conn, project_id: str, dataset_id: str):
+    """
+    Moves metadata from the JSON tables earlier versions kept inside the
+    internal DuckLake project into the store, then drops those tables.
+    """
+    dataset = f'"{project_id}"."{dataset_id}"'
+    found = {
+        row[0]
+        for row in duckdb_conn.execute(
+            "SELECT table_name FROM duckdb_tables() "
+            "WHERE database_name = $project_id AND schema_name = $dataset_id",
+            {"project_id": project_id, "dataset_id": dataset_id},
+        ).fetchall()
+    }
+    with transaction() as conn:
+        for table, columns in LEGACY_TABLES.items():
+            if table not in found:
+                continue
+            rows = duckdb_conn.execute(
+                f"SELECT {', '.join(columns)} FROM {dataset}.{table}"
+            ).fetchall()
+            placeholders = ", ".join("?" for _ in columns)
+            conn.executemany(
+                f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) "
+                f"VALUES ({placeholders})",
+                rows,
+            )
+        if "jobs" in found:
+            rows = duckdb_conn.execute(
+                f"SELECT project_id, job_id, item FROM {dataset}.jobs"
+            ).fetchall()
+            for project_id, job_id, item in rows:
+                put_job(conn, project_id, job_id, json.loads(item), item)
+    for table in found & {*LEGACY_TABLES, "jobs"}:
+        duckdb_conn.execute(f"DROP TABLE {dataset}.{table}")
+
+
+def put_job(conn, project_id: str, job_id: str, job: dict, item: str):
+    """Inserts or replaces a job, keeping its indexed columns in sync."""
+    status = job.get("status") or {}
+    statistics = job.get("statistics") or {}
+    configuration = job.get("configuration") or {}
+    creation_time = statistics.get("creationTime")
+    conn.execute(
+        """
+            INSERT INTO jobs (
+                project_id, job_id, state, creation_time,
+                parent_job_id, user_email, item
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (project_id, job_id) DO UPDATE SET
+                state = excluded.state,
+                creation_time = excluded.creation_time,
+                parent_job_id = excluded.parent_job_id,
+                user_email = excluded.user_email,
+                item = excluded.item
+        """,
+        (
+            project_id,
+            job_id,
+            status.get("state"),
+            int(creation_time) if creation_time else 0,
+            statistics.get("parentJobId"),
+            job.get("user_email"),
+            item,
+        ),
+    )
+    conn.execute(
+        "DELETE FROM job_labels WHERE project_id = ? AND job_id = ?",
+        (project_id, job_id),
+    )
+    labels: Optional[dict] = configuration.get("labels")
+    if labels:
+        conn.executemany(
+            "INSERT INTO job_labels (project_id, job_id, key, value) "
+            "VALUES (?, ?, ?, ?)",
+            [(project_id, job_id, k, v) for k, v in labels.items()],
+        )
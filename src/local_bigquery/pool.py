@@ -0,0 +1,193 @@
+import contextlib
+import threading
+import time
+from typing import Callable
+
+import duckdb
+
+from local_bigquery.errors import RateLimitError
+
+_untimed = threading.local()
+
+
+@contextlib.contextmanager
+def without_checkout_timeout():
+    """
+    Has checkouts on this thread wait for a slot however long it takes, for
+    work that has already been admitted by the scheduler.
+    """
+    _untimed.active = True
+    try:
+        yield
+    finally:
+        _untimed.active = False
+
+
+class _ProjectPool:
+    def __init__(self, conn: duckdb.DuckDBPyConnection, size: int):
+        self.conn = conn
+        self.size = size
+        self.slots = threading.BoundedSemaphore(size)
+        # Idle cursors and the dataset each is using, most recently used last.
+        self.idle: list[tuple[duckdb.DuckDBPyConnection, str]] = []
+        self.in_use = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.timeouts = 0
+        self.discarded = 0
+
+
+class CursorPool:
+    """
+    Hands out DuckDB cursors, at most `size` at a time per project.
+
+    Cursors are kept between requests with their dataset already in use, so a
+    checkout is usually just a pop. Cursors that fail, or that were left with
+    session state such as temporary functions, are closed rather than reused.
+    Nested checkouts from a thread that already holds one of the project's
+    cursors don't wait for a slot, so they can't deadlock against it.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[str], duckdb.DuckDBPyConnection],
+        size: int,
+        timeout_seconds: float,
+    ):
+        self.connect = connect
+        self.size = size
+        self.timeout_seconds = timeout_seconds
+        self.lock = threading.Lock()
+        self.projects: dict[str, _ProjectPool] = {}
+        self.checked_out: set[int] = set()
+        self.dirty: set[int] = set()
+        self.local = threading.local()
+
+    def project(self, project_id: str) -> _ProjectPool:
+        with self.lock:
+            pool = self.projects.get(project_id)
+        if pool is not None:
+            return pool
+        conn = self.connect(project_id)
+        with self.lock:
+            return self.projects.setdefault(
+                project_id, _ProjectPool(conn, max(self.size, 1))
+            )
+
+    def warm(self, project_id: str, dataset_id: str, count: int):
+        pool = self.project(project_id)
+        with self.lock:
+            missing = min(count, pool.size) - len(pool.idle)
+        cursors = [self.open(pool, project_id, dataset_id) for _ in range(missing)]
+        with self.lock:
+            pool.idle.extend(cursors)
+
+    @staticmethod
+    def open(pool: _ProjectPool, project_id: str, dataset_id: str):
+        cur = pool.conn.cursor()
+        return cur, CursorPool.use(cur, project_id, dataset_id)
+
+    @staticmethod
+    def use(cur, project_id: str, dataset_id: str) -> str:
+        try:
+            cur.execute(f'USE "{project_id}"."{dataset_id}"')
+        except duckdb.CatalogException:
+            dataset_id = "main"
+            cur.execute(f'USE "{project_id}"."{dataset_id}"')
+        return dataset_id
+
+    def mark_dirty(self, cur):
+        """Stops a cursor from being reused once it's checked back in."""
+        with self.lock:
+            if id(cur) in self.checked_out:
+                self.dirty.add(id(cur))
+
+    @contextlib.contextmanager
+    def cursor(self, project_id: str, dataset_id: str):
+        pool = self.project(project_id)
+        held = getattr(self.local, "held", None)
+        if held is None:
+            held = self.local.held = {}
+        nested = held.get(project_id, 0) > 0
+        if not nested:
+            started = time.monotonic()
+            untimed = getattr(_untimed, "active", False)
+            acquired = pool.slots.acquire(
+                timeout=None if untimed else self.timeout_seconds
+            )
+            waited_ms = (time.monotonic() - started) * 1000
+            with self.lock:
+                pool.waits += waited_ms >= 1
+                pool.wait_ms += waited_ms
+                pool.max_wait_ms = max(pool.max_wait_ms, waited_ms)
+                pool.timeouts += not acquired
+            if not acquired:
+                raise RateLimitError(
+                    f"Timed out after {self.timeout_seconds}s waiting for a "
+                    f"connection to project {project_id}"
+                )
+        held[project_id] = held.get(project_id, 0) + 1
+        try:
+            with self.lock:
+                pool.checkouts += 1
+                pool.in_use += 1
+                cur, current_dataset_id = pool.idle.pop() if pool.idle else (None, None)
+            if cur is None:
+                cur, current_dataset_id = self.open(pool, project_id, dataset_id)
+            elif current_dataset_id != dataset_id:
+                current_dataset_id = self.use(cur, project_id, dataset_id)
+            with self.lock:
+                self.checked_out.add(id(cur))
+            reusable = False
+            try:
+                yield cur
+                reusable = True
+            finally:
+                with self.lock:
+                    pool.in_use -= 1
+                    self.checked_out.discard(id(cur))
+                    reusable = reusable and id(cur) not in self.dirty
+                    self.dirty.discard(id(cur))
+                    if reusable and len(pool.idle) < pool.size:
+                        pool.idle.append((cur, current_dataset_id))
+                    else:
+                        pool.discarded += 1
+                        reusable = False
+                if not reusable:
+                    cur.close()
+        finally:
+            held[project_id] -= 1
+            if not nested:
+                pool.slots.release()
+
+    def clear(self):
+        with self.lock:
+            pools = list(self.projects.values())
+            self.projects.clear()
+            self.checked_out.clear()
+            self.dirty.clear()
+        for pool in pools:
+            for cur, _ in pool.idle:
+                cur.close()
+
+    def status(self) -> dict:
+        with self.lock:
+            return {
+                "sizePerProject": self.size,
+                "checkoutTimeoutSeconds": self.timeout_seconds,
+                "projects": {
+                    project_id: {
+                        "idle": len(pool.idle),
+                        "inUse": pool.in_use,
+                        "checkouts": pool.checkouts,
+                        "waits": pool.waits,
+                        "totalWaitMs": round(pool.wait_ms, 3),
+                        "maxWaitMs": round(pool.max_wait_ms, 3),
+                        "timeouts": pool.timeouts,
+                        "discarded": pool.discarded,
+                    }
+                    for project_id, pool in sorted(self.projects.items())
+                },
+            }
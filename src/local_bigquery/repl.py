@@ -102,8 +102,7 @@ class BigQueryCompleter(Completer):
 
 
 def refresh(cur, completer):
-    found_projects = {project.stem for project in settings.data_dir.glob("*.ducklake")}
-    for project in found_projects:
+    for project in db.find_projects():
         db.attach_project(cur, project)
     # `SHOW ALL TABLES` currently unsupported by DuckLake.
     result = cur.sql(
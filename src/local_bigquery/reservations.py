@@ -0,0 +1,76 @@
+import re
+from typing import NamedTuple, Optional
+
+from local_bigquery.errors import InvalidError, NotFoundError
+from local_bigquery.models import ConnectionProperty, JobConfiguration
+from local_bigquery.settings import settings
+
+# Connection properties a job can set to override its resource budget.
+BUDGET_PROPERTIES = {"threads", "memory_limit", "max_temp_directory_size"}
+# Sizes those properties accept, e.g. 512MB or 1.5GiB.
+SIZE = re.compile(r"\d+(\.\d+)?\s*[KMGT]i?B", re.IGNORECASE)
+
+
+class Budget(NamedTuple):
+    """DuckDB resource settings for a job, where empty means the server's."""
+
+    threads: int = 0
+    memory_limit: str = ""
+    max_temp_directory_size: str = ""
+
+
+def find(project_id: str, configuration: JobConfiguration) -> Optional[str]:
+    """
+    Picks the reservation a job runs in, if any.
+
+    A reservation named on the job wins, either bare or as
+    `projects/{project}/locations/{location}/reservations/{name}`. Otherwise
+    the first reservation whose labels all match the job's is used, then the
+    first that lists the job's project.
+    """
+    if configuration.reservation:
+        name = configuration.reservation.rsplit("/", 1)[-1]
+        if name not in settings.reservations:
+            raise NotFoundError(f"Reservation {configuration.reservation} not found")
+        return name
+    labels = configuration.labels or {}
+    for name, reservation in settings.reservations.items():
+        if reservation.labels and all(
+            labels.get(key) == value for key, value in reservation.labels.items()
+        ):
+            return name
+    for name, reservation in settings.reservations.items():
+        if project_id in reservation.projects:
+            return name
+    return None
+
+
+def budget(
+    reservation: Optional[str],
+    connection_properties: Optional[list[ConnectionProperty]] = None,
+) -> Optional[Budget]:
+    """
+    Works out the resource budget for a job, starting from its reservation's
+    and applying any overrides from its connection properties. Jobs with
+    neither use the server's shared instance.
+    """
+    overrides = {
+        prop.key: prop.value
+        for prop in connection_properties or []
+        if prop.key in BUDGET_PROPERTIES
+    }
+    if not reservation and not overrides:
+        return None
+    result = Budget()
+    if reservation:
+        limits = settings.reservations[reservation]
+        result = Budget(threads=limits.threads, memory_limit=limits.memory_limit)
+    if "threads" in overrides:
+        threads = overrides.pop("threads")
+        if not threads or not threads.isdigit() or int(threads) < 1:
+            raise InvalidError(f"Invalid threads connection property: {threads}")
+        result = result._replace(threads=int(threads))
+    for key, value in overrides.items():
+        if value and not SIZE.fullmatch(value):
+            raise InvalidError(f"Invalid {key} connection property: {value}")
+    return result._replace(**{key: value or "" for key, value in overrides.items()})
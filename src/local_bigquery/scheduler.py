@@ -0,0 +1,134 @@
+import threading
+from concurrent import futures
+from typing import Callable, Optional
+
+from local_bigquery.errors import InvalidError, RateLimitError
+from local_bigquery.pool import without_checkout_timeout
+from local_bigquery.settings import settings
+
+INTERACTIVE = "INTERACTIVE"
+BATCH = "BATCH"
+
+
+class _Queue:
+    def __init__(self, name: str, concurrency: int, max_queued: int):
+        self.concurrency = max(concurrency, 1)
+        self.max_queued = max(max_queued, 0)
+        self.executor = futures.ThreadPoolExecutor(
+            self.concurrency, thread_name_prefix=f"local-bigquery-{name.lower()}"
+        )
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+
+
+class QueryScheduler:
+    """
+    Runs queries by priority, each priority with its own concurrency limit.
+
+    Queries beyond the limit wait in their priority's queue, and once that is
+    full too, new ones are turned away with a rateLimitExceeded error that
+    clients retry with backoff. Jobs in a reservation use its slots instead,
+    whatever their priority, so other work can't hold them up.
+
+    A running query may still wait for one of its project's cursors, since
+    more queries can run at once than a project has cursors, but it waits
+    for as long as that takes rather than failing: it was already admitted.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queues = {
+            INTERACTIVE: _Queue(
+                INTERACTIVE,
+                settings.interactive_max_concurrency,
+                settings.interactive_max_queued,
+            ),
+            BATCH: _Queue(
+                BATCH, settings.batch_max_concurrency, settings.batch_max_queued
+            ),
+        }
+        self.reservations: dict[str, _Queue] = {}
+
+    def queue(self, priority: str, reservation: Optional[str] = None) -> _Queue:
+        queue = self.queues.get((priority or INTERACTIVE).upper())
+        if queue is None:
+            raise InvalidError(f"Invalid priority: {priority}")
+        if not reservation:
+            return queue
+        with self.lock:
+            queue = self.reservations.get(reservation)
+            if queue is None:
+                budget = settings.reservations[reservation]
+                queue = self.reservations[reservation] = _Queue(
+                    reservation, budget.slots, budget.max_queued
+                )
+            return queue
+
+    def submit(
+        self, priority: str, fn: Callable, *args, reservation: Optional[str] = None
+    ) -> futures.Future:
+        queue = self.queue(priority, reservation)
+        with self.lock:
+            if queue.queued + queue.running >= queue.concurrency + queue.max_queued:
+                queue.rejected += 1
+                raise RateLimitError(
+                    f"Too many {reservation or priority.upper()} queries are "
+                    f"running or queued, retry after "
+                    f"{settings.rate_limit_retry_after_seconds}s",
+                    retry_after_seconds=settings.rate_limit_retry_after_seconds,
+                )
+            queue.queued += 1
+        return queue.executor.submit(self.execute, queue, fn, *args)
+
+    def run(
+        self, priority: str, fn: Callable, *args, reservation: Optional[str] = None
+    ):
+        """Runs `fn` once there's capacity, waiting for its result."""
+        return self.submit(priority, fn, *args, reservation=reservation).result()
+
+    def execute(self, queue: _Queue, fn: Callable, *args):
+        with self.lock:
+            queue.queued -= 1
+            queue.running += 1
+        try:
+            with without_checkout_timeout():
+                return fn(*args)
+        finally:
+            with self.lock:
+                queue.running -= 1
+                queue.completed += 1
+
+    def stop(self):
+        with self.lock:
+            queues = [*self.queues.values(), *self.reservations.values()]
+        for queue in queues:
+            queue.executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def queue_status(queue: _Queue) -> dict:
+        return {
+            "maxConcurrency": queue.concurrency,
+            "maxQueued": queue.max_queued,
+            "running": queue.running,
+            "queued": queue.queued,
+            "completed": queue.completed,
+            "rejected": queue.rejected,
+        }
+
+    def status(self) -> dict:
+        with self.lock:
+            return {
+                **{
+                    priority: self.queue_status(queue)
+                    for priority, queue in self.queues.items()
+                },
+                "reservations": {
+                    name: self.queue_status(queue)
+                    for name, queue in sorted(self.reservations.items())
+                },
+            }
+
+
+scheduler = QueryScheduler()
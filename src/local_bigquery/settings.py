@@ -1,20 +1,82 @@
 from pathlib import Path
 
-from pydantic import Field
+from pydantic import BaseModel, Field, field_validator
 
 from pydantic_settings import BaseSettings
 
 
+class Reservation(BaseModel):
+    threads: int = 0
+    memory_limit: str = ""
+    slots: int = 1
+    max_queued: int = 100
+    projects: list[str] = []
+    labels: dict[str, str] = {}
+
+
 class Settings(BaseSettings):
     bigquery_port: int = Field(9050)
     bigquery_host: str = Field("0.0.0.0")
+    workers: int = Field(1)
     data_dir: Path = Field("/data")
+    ducklake_catalog: str = Field("")
+    memory_limit: str = Field("")
+    threads: int = Field(0)
+    temp_directory: str = Field("")
+    max_temp_directory_size: str = Field("")
+    max_job_budgets: int = Field(8)
     default_project_id: str = Field("local")
     default_dataset_id: str = Field("local")
     internal_project_id: str = Field("internal")
     internal_dataset_id: str = Field("internal")
     postgres_connection_id: str = Field("us.default")
     postgres_uri: str = Field("postgresql://postgres:example@db:5432/postgres")
+    insert_coalesce_window_ms: int = Field(0)
+    insert_coalesce_max_rows: int = Field(10000)
+    maintenance_interval_seconds: int = Field(60)
+    compaction_min_files: int = Field(50)
+    compaction_small_file_bytes: int = Field(16 * 1024 * 1024)
+    compaction_max_tables_per_cycle: int = Field(10)
+    compaction_cooldown_ms: int = Field(1000)
+    snapshot_max_age_seconds: int = Field(7 * 24 * 60 * 60)
+    snapshot_max_count: int = Field(0)
+    orphan_file_min_age_seconds: int = Field(60 * 60)
+    job_retention_days: int = Field(30)
+    query_results_ttl_seconds: int = Field(24 * 60 * 60)
+    retention_batch_size: int = Field(1000)
+    storage_api_port: int = Field(0)
+    storage_api_max_streams: int = Field(4)
+    storage_api_batch_rows: int = Field(10000)
+    flight_port: int = Field(0)
+    flight_batch_rows: int = Field(10000)
+    incremental_results_batch_rows: int = Field(1000)
+    continuous_query_interval_ms: int = Field(1000)
+    pool_size_per_project: int = Field(8)
+    pool_warm_cursors: int = Field(2)
+    pool_checkout_timeout_seconds: float = Field(30)
+    pool_instance_per_project: bool = Field(False)
+    interactive_max_concurrency: int = Field(16)
+    interactive_max_queued: int = Field(100)
+    batch_max_concurrency: int = Field(2)
+    batch_max_queued: int = Field(1000)
+    rate_limit_retry_after_seconds: int = Field(1)
+    project_groups: dict[str, list[str]] = Field({})
+    isolate_projects: bool = Field(False)
+    max_workers: int = Field(16)
+    worker_base_port: int = Field(9100)
+    worker_memory_limit: str = Field("")
+    worker_start_timeout_seconds: float = Field(30)
+    reservations: dict[str, Reservation] = Field({})
+
+    @field_validator("ducklake_catalog")
+    @classmethod
+    def check_ducklake_catalog(cls, value: str) -> str:
+        if value and not value.startswith("postgres:"):
+            raise ValueError(
+                f"Unsupported DuckLake catalog: {value} "
+                "(expected a postgres: connection string, or empty)"
+            )
+        return value
 
 
 settings = Settings()
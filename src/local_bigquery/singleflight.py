@@ -0,0 +1,65 @@
+import threading
+from concurrent import futures
+from typing import Callable, Hashable, Optional, TypeVar
+
+from local_bigquery.errors import JobTimeoutError
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Shares one execution among identical calls that overlap.
+
+    The first call for a key runs it, and calls arriving while it's running
+    wait for its result (or error) instead of running it again. Nothing is
+    kept once it finishes, so this is no cache: later calls run afresh.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: dict[Hashable, futures.Future] = {}
+        self.executed = 0
+        self.shared = 0
+
+    def run(
+        self,
+        key: Hashable,
+        fn: Callable[[], T],
+        timeout_seconds: Optional[float] = None,
+    ) -> T:
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = futures.Future()
+                self.executed += 1
+            else:
+                self.shared += 1
+        if not leader:
+            try:
+                return call.result(timeout_seconds)
+            except futures.TimeoutError:
+                raise JobTimeoutError(
+                    "Job execution was cancelled: "
+                    f"Job timed out after {timeout_seconds}s"
+                )
+        try:
+            result = fn()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+    def status(self) -> dict:
+        with self.lock:
+            return {
+                "inFlight": len(self.calls),
+                "executed": self.executed,
+                "shared": self.shared,
+            }
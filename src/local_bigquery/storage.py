@@ -0,0 +1,152 @@
+import contextlib
+import re
+import threading
+import uuid
+from concurrent import futures
+from datetime import datetime, timedelta, timezone
+
+import duckdb
+import grpc
+import sqlglot
+from google.cloud.bigquery_storage_v1 import types
+
+from local_bigquery import db
+from local_bigquery.errors import NotFoundError
+from local_bigquery.settings import settings
+
+SERVICE_NAME = "google.cloud.bigquery.storage.v1.BigQueryRead"
+SESSION_LIFETIME = timedelta(hours=6)
+TABLE_PATH = re.compile(r"projects/([^/]+)/datasets/([^/]+)/tables/([^/]+)")
+STREAM_PATH = re.compile(r"(.+/sessions/[^/]+)/streams/(\d+)")
+
+
+class BigQueryRead:
+    """
+    A local stand-in for the BigQuery Storage Read API.
+
+    Sessions are split into streams over contiguous row ID ranges, and rows
+    are served as Arrow IPC record batches straight from DuckDB.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions: dict[str, dict] = {}
+
+    def create_read_session(self, request, context):
+        read_session = request.read_session
+        match = TABLE_PATH.fullmatch(read_session.table)
+        if not match:
+            context.abort(
+                grpc.StatusCode.INVALID_ARGUMENT,
+                f"Invalid table: {read_session.table}",
+            )
+        project_id, dataset_id, table_id = match.groups()
+        max_streams = settings.storage_api_max_streams
+        if request.max_stream_count:
+            max_streams = min(request.max_stream_count, max_streams)
+        read_options = read_session.read_options
+        with self.errors(context):
+            session = db.create_read_session(
+                project_id,
+                dataset_id,
+                table_id,
+                selected_fields=list(read_options.selected_fields),
+                row_restriction=read_options.row_restriction,
+                max_streams=max_streams,
+            )
+            with db.cursor(project_id, dataset_id) as cur:
+                schema = cur.execute(f"{session['sql']} LIMIT 0").arrow().schema
+
+        name = f"projects/{project_id}/locations/us/sessions/{uuid.uuid4().hex}"
+        now = datetime.now(timezone.utc)
+        session["expire_time"] = now + SESSION_LIFETIME
+        session["arrow_schema"] = types.ArrowSchema(
+            serialized_schema=schema.serialize().to_pybytes()
+        )
+        with self.lock:
+            self.sessions = {
+                k: v for k, v in self.sessions.items() if v["expire_time"] > now
+            }
+            self.sessions[name] = session
+        return types.ReadSession(
+            name=name,
+            expire_time=session["expire_time"],
+            data_format=types.DataFormat.ARROW,
+            arrow_schema=session["arrow_schema"],
+            table=read_session.table,
+            read_options=read_options,
+            streams=[
+                types.ReadStream(name=f"{name}/streams/{i}")
+                for i in range(len(session["ranges"]))
+            ],
+            estimated_row_count=session["total_rows"],
+        )
+
+    def read_rows(self, request, context):
+        match = STREAM_PATH.fullmatch(request.read_stream)
+        with self.lock:
+            session = self.sessions.get(match.group(1)) if match else None
+        if session is None:
+            context.abort(
+                grpc.StatusCode.NOT_FOUND, f"Stream {request.read_stream} not found"
+            )
+        duckdb_sql = db.read_stream_sql(session, int(match.group(2)), request.offset)
+        with self.errors(context):
+            with db.cursor(session["project_id"], session["dataset_id"]) as cur:
+                reader = cur.execute(duckdb_sql).to_arrow_reader(
+                    settings.storage_api_batch_rows
+                )
+                for i, batch in enumerate(reader):
+                    response = types.ReadRowsResponse(
+                        arrow_record_batch=types.ArrowRecordBatch(
+                            serialized_record_batch=batch.serialize().to_pybytes(),
+                            row_count=batch.num_rows,
+                        ),
+                        row_count=batch.num_rows,
+                    )
+                    if i == 0:
+                        response.arrow_schema = session["arrow_schema"]
+                    yield response
+
+    def split_read_stream(self, request, context):
+        # Streams are never split, which the API allows.
+        return types.SplitReadStreamResponse()
+
+    @staticmethod
+    @contextlib.contextmanager
+    def errors(context):
+        try:
+            yield
+        except NotFoundError as e:
+            context.abort(grpc.StatusCode.NOT_FOUND, str(e))
+        except (sqlglot.ParseError, duckdb.Error) as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+
+def serve(port: int) -> grpc.Server:
+    service = BigQueryRead()
+    handler = grpc.method_handlers_generic_handler(
+        SERVICE_NAME,
+        {
+            "CreateReadSession": grpc.unary_unary_rpc_method_handler(
+                service.create_read_session,
+                request_deserializer=types.CreateReadSessionRequest.deserialize,
+                response_serializer=types.ReadSession.serialize,
+            ),
+            "ReadRows": grpc.unary_stream_rpc_method_handler(
+                service.read_rows,
+                request_deserializer=types.ReadRowsRequest.deserialize,
+                response_serializer=types.ReadRowsResponse.serialize,
+            ),
+            "SplitReadStream": grpc.unary_unary_rpc_method_handler(
+                service.split_read_stream,
+                request_deserializer=types.SplitReadStreamRequest.deserialize,
+                response_serializer=types.SplitReadStreamResponse.serialize,
+            ),
+        },
+    )
+    server = grpc.server(futures.ThreadPoolExecutor())
+    server.add_generic_rpc_handlers((handler,))
+    server.add_insecure_port(f"{settings.bigquery_host}:{port}")
+    server.start()
+    return server
@@ -4,6 +4,7 @@ from typing import Any, List, Optional
 
 from duckdb.typing import DuckDBPyType
 import base64
+import sqlglot
 
 from local_bigquery.models import (
     QueryParameter,
@@ -15,8 +16,15 @@ from local_bigquery.models import (
 )
 
 
+def quote_identifier(name: str, dialect: str = "bigquery") -> str:
+    return sqlglot.exp.to_identifier(name, quoted=True).sql(dialect)
+
+
 def field_to_sql(field):
-    name = field.name
+    return f"{quote_identifier(field.name)} {field_type_to_sql(field)}"
+
+
+def field_type_to_sql(field):
     mode = field.mode or "NULLABLE"
     typ = (field.type or "").upper()
 
@@ -27,9 +35,31 @@ def field_to_sql(field):
         sql_type = typ
 
     if mode == "REPEATED":
-        return f"{name} ARRAY<{sql_type}>"
+        return f"ARRAY<{sql_type}>"
     nullable = "NOT NULL" if mode == "REQUIRED" else ""
-    return f"{name} {sql_type} {nullable}".strip()
+    return f"{sql_type} {nullable}".strip()
+
+
+STANDARD_SQL_TYPES = {
+    "INTEGER": "INT64",
+    "FLOAT": "FLOAT64",
+    "BOOLEAN": "BOOL",
+}
+
+
+def field_to_type_name(field: TableFieldSchema) -> str:
+    """Spells a field's type as GoogleSQL does, e.g. `ARRAY<STRUCT<a INT64>>`."""
+    typ = (field.type or "").upper()
+    if typ in {"RECORD", "STRUCT"}:
+        subfields = ", ".join(
+            f"{f.name} {field_to_type_name(f)}" for f in field.fields or []
+        )
+        type_name = f"STRUCT<{subfields}>"
+    else:
+        type_name = STANDARD_SQL_TYPES.get(typ, typ)
+    if field.mode == "REPEATED":
+        return f"ARRAY<{type_name}>"
+    return type_name
 
 
 def bigquery_schema_to_sql(schema: list, table_name: str) -> str:
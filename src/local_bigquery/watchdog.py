@@ -0,0 +1,69 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Callable
+
+
+class Deadline:
+    def __init__(self, at: float, callback: Callable[[], None]):
+        self.at = at
+        self.callback = callback
+        self.fired = False
+        self.cancelled = False
+
+
+class Watchdog:
+    """
+    Calls back whatever overruns its deadline, from a single thread.
+
+    Callbacks run while holding the lock, so once `cancel` returns a deadline
+    can no longer fire. They must be quick, like interrupting a cursor.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.deadlines: list[tuple[float, int, Deadline]] = []
+        self.counter = itertools.count()
+        self.thread = None
+        self.fired = 0
+
+    def watch(self, timeout_seconds: float, callback: Callable[[], None]) -> Deadline:
+        deadline = Deadline(time.monotonic() + timeout_seconds, callback)
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.loop, name="local-bigquery-watchdog", daemon=True
+                )
+                self.thread.start()
+            heapq.heappush(self.deadlines, (deadline.at, next(self.counter), deadline))
+            self.condition.notify()
+        return deadline
+
+    def cancel(self, deadline: Deadline):
+        with self.condition:
+            deadline.cancelled = True
+
+    def loop(self):
+        with self.condition:
+            while True:
+                while self.deadlines and self.deadlines[0][2].cancelled:
+                    heapq.heappop(self.deadlines)
+                if not self.deadlines:
+                    self.condition.wait()
+                    continue
+                wait = self.deadlines[0][0] - time.monotonic()
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+                _, _, deadline = heapq.heappop(self.deadlines)
+                deadline.fired = True
+                self.fired += 1
+                try:
+                    deadline.callback()
+                except Exception:
+                    logging.exception("Watchdog callback failed")
+
+
+watchdog = Watchdog()
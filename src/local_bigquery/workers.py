@@ -0,0 +1,39 @@
+import contextlib
+import fcntl
+
+from local_bigquery.settings import settings
+
+leader_lock = None
+
+
+@contextlib.contextmanager
+def exclusive(name: str):
+    """Holds a lock on `DATA_DIR/{name}.lock`, shared by every worker process."""
+    settings.data_dir.mkdir(parents=True, exist_ok=True)
+    with open(settings.data_dir / f"{name}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def is_leader() -> bool:
+    """
+    Whether this process runs the work only one worker should do, like
+    background maintenance and the gRPC servers.
+
+    The first worker to ask becomes the leader, and stays so until it exits.
+    """
+    global leader_lock
+    if settings.workers <= 1 or leader_lock is not None:
+        return True
+    settings.data_dir.mkdir(parents=True, exist_ok=True)
+    lock = open(settings.data_dir / "leader.lock", "a")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        return False
+    leader_lock = lock
+    return True
@@ -1,11 +1,17 @@
+import concurrent.futures
+import os
 import pathlib
+import signal
 import threading
 import time
+import uuid
 import datetime
 
+import duckdb
 import pytest
 import requests
 import uvicorn
+from google.api_core import exceptions
 from google.api_core.client_options import ClientOptions
 from google.auth.credentials import AnonymousCredentials
 from google.cloud import bigquery
@@ -13,8 +19,18 @@ from google.cloud.bigquery import QueryJobConfig
 from sqlalchemy import column, create_engine, select, text
 from testcontainers.postgres import PostgresContainer
 
+from local_bigquery import frontend, jobs, scheduler
+from local_bigquery.continuous import continuous_queries
+from local_bigquery.errors import JobTimeoutError, RateLimitError
 from local_bigquery.main import app, db
-from local_bigquery.settings import settings
+from local_bigquery.models import (
+    GetQueryResultsResponse,
+    JobConfiguration,
+    TableCell,
+    TableRow,
+)
+from local_bigquery.pool import CursorPool
+from local_bigquery.settings import Reservation, Settings, settings
 
 
 @pytest.fixture(scope="session")
@@ -60,8 +76,10 @@ def query(
     bq: bigquery.Client,
     sql: str,
     config: bigquery.QueryJobConfig = None,
+    project: str = None,
 ) -> list[dict]:
-    return [dict(row.items()) for row in bq.query_and_wait(sql, job_config=config)]
+    rows = bq.query_and_wait(sql, job_config=config, project=project)
+    return [dict(row.items()) for row in rows]
 
 
 def test_default_dataset(server_url):
@@ -572,6 +590,1079 @@ def test_javascript_udf(bq):
     ]
 
 
+def test_coalesced_inserts(bq, monkeypatch):
+    monkeypatch.setattr(settings, "insert_coalesce_window_ms", 200)
+    bq.create_dataset("project1.dataset1", exists_ok=True)
+    bq.delete_table("project1.dataset1.coalesced", not_found_ok=True)
+    table = bq.create_table(
+        bigquery.Table(
+            "project1.dataset1.coalesced",
+            schema=[bigquery.SchemaField("id", "INTEGER")],
+        )
+    )
+    with db.cursor("project1") as cur:
+        before = cur.sql("SELECT count(*) FROM ducklake_snapshots('project1')")
+        before = before.fetchone()[0]
+    threads = [
+        threading.Thread(target=bq.insert_rows, args=(table, [{"id": i}]))
+        for i in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with db.cursor("project1") as cur:
+        after = cur.sql("SELECT count(*) FROM ducklake_snapshots('project1')")
+        after = after.fetchone()[0]
+    assert after - before < 10
+    assert query(bq, "SELECT id FROM project1.dataset1.coalesced ORDER BY id") == [
+        {"id": i} for i in range(10)
+    ]
+
+
+def test_compaction(bq, server_url, monkeypatch):
+    monkeypatch.setattr(settings, "compaction_min_files", 2)
+    monkeypatch.setattr(settings, "compaction_cooldown_ms", 0)
+    bq.create_dataset("project1.dataset1", exists_ok=True)
+    query(bq, "DROP TABLE IF EXISTS project1.dataset1.compacted")
+    query(bq, "CREATE TABLE project1.dataset1.compacted (id INT64)")
+    for _ in range(3):
+        query(
+            bq,
+            """
+            INSERT INTO project1.dataset1.compacted
+            SELECT id FROM UNNEST(GENERATE_ARRAY(1, 100)) AS id
+            """,
+        )
+    status = requests.post(f"{server_url}/admin/maintenance:run").json()
+    history = [
+        entry for entry in status["history"] if entry.get("tableId") == "compacted"
+    ]
+    assert history[-1]["filesBefore"] == 3
+    assert history[-1]["filesAfter"] == 1
+    assert query(bq, "SELECT count(*) AS n FROM project1.dataset1.compacted") == [
+        {"n": 300}
+    ]
+
+
+def test_snapshot_expiration(bq, server_url, monkeypatch):
+    monkeypatch.setattr(settings, "snapshot_max_count", 1)
+    monkeypatch.setattr(settings, "orphan_file_min_age_seconds", 0)
+    bq.create_dataset("project1.dataset1", exists_ok=True)
+    query(bq, "DROP TABLE IF EXISTS project1.dataset1.expired")
+    query(bq, "CREATE TABLE project1.dataset1.expired AS SELECT 1 AS id")
+    query(bq, "DELETE FROM project1.dataset1.expired WHERE TRUE")
+    query(bq, "INSERT INTO project1.dataset1.expired VALUES (2)")
+    requests.post(f"{server_url}/admin/maintenance:run").raise_for_status()
+    with db.cursor("project1") as cur:
+        snapshots = cur.sql("SELECT count(*) FROM ducklake_snapshots('project1')")
+        assert snapshots.fetchone() == (1,)
+    assert query(bq, "SELECT id FROM project1.dataset1.expired") == [{"id": 2}]
+
+
+def test_list_rows(bq, server_url):
+    bq.create_dataset("project1.dataset1", exists_ok=True)
+    bq.delete_table("project1.dataset1.listed", not_found_ok=True)
+    table = bq.create_table(
+        bigquery.Table(
+            "project1.dataset1.listed",
+            schema=[
+                bigquery.SchemaField("id", "INTEGER"),
+                bigquery.SchemaField("name", "STRING"),
+            ],
+        )
+    )
+    query(
+        bq,
+        """
+        INSERT INTO project1.dataset1.listed
+        SELECT id, CAST(id AS STRING) FROM UNNEST(GENERATE_ARRAY(0, 24)) AS id
+        """,
+    )
+    rows = bq.list_rows(table, start_index=5, page_size=10)
+    assert [dict(row.items()) for row in rows] == [
+        {"id": i, "name": str(i)} for i in range(5, 25)
+    ]
+    assert rows.total_rows == 25
+    rows = bq.list_rows(
+        table, selected_fields=[bigquery.SchemaField("name", "STRING")], page_size=7
+    )
+    pages = list(rows.pages)
+    assert len(pages) == 4
+    assert [dict(row.items()) for page in pages for row in page] == [
+        {"name": str(i)} for i in range(25)
+    ]
+    assert rows.total_rows == 25
+
+    # Bad page tokens and quoted field names are rejected as invalid.
+    rows_url = (
+        f"{server_url}/bigquery/v2/projects/project1/datasets/dataset1"
+        "/tables/listed/data"
+    )
+    for token in ["not a token", db.encode_page_token({"snapshot": 1})]:
+        response = requests.get(rows_url, params={"pageToken": token})
+        assert response.status_code == 400
+        assert response.json()["error"]["errors"][0]["reason"] == "invalid"
+    response = requests.get(rows_url, params={"selectedFields": 'name" FROM x; --'})
+    assert response.status_code == 404
+    assert 'name" FROM x; --' in response.json()["error"]["message"]
+
+
+def test_storage_read_api(bq, monkeypatch):
+    import grpc
+    from google.cloud import bigquery_storage
+    from google.cloud.bigquery_storage_v1.services.big_query_read.transports import (
+        BigQueryReadGrpcTransport,
+    )
+
+    from local_bigquery import storage
+
+    monkeypatch.setattr(settings, "storage_api_port", 9060)
+    monkeypatch.setattr(settings, "storage_api_max_streams", 3)
+    server = storage.serve(9060)
+    try:
+        transport = BigQueryReadGrpcTransport(
+            channel=grpc.insecure_channel("127.0.0.1:9060")
+        )
+        bqstorage_client = bigquery_storage.BigQueryReadClient(transport=transport)
+        bq.create_dataset("project1.dataset1", exists_ok=True)
+        bq.delete_table("project1.dataset1.streamed", not_found_ok=True)
+        table = bq.create_table(
+            bigquery.Table(
+                "project1.dataset1.streamed",
+                schema=[
+                    bigquery.SchemaField("id", "INTEGER"),
+                    bigquery.SchemaField("name", "STRING"),
+                ],
+            )
+        )
+        query(
+            bq,
+            """
+            INSERT INTO project1.dataset1.streamed
+            SELECT id, CAST(id AS STRING) FROM UNNEST(GENERATE_ARRAY(0, 99)) AS id
+            """,
+        )
+        arrow = bq.list_rows(table).to_arrow(bqstorage_client=bqstorage_client)
+        assert sorted(arrow["id"].to_pylist()) == list(range(100))
+
+        arrow = bq.query(
+            "SELECT id * 2 AS doubled FROM project1.dataset1.streamed WHERE id < 10"
+        ).to_arrow(bqstorage_client=bqstorage_client)
+        assert sorted(arrow["doubled"].to_pylist()) == [i * 2 for i in range(10)]
+
+        # Pages come from the results table, in order.
+        job = bq.query("SELECT id FROM project1.dataset1.streamed ORDER BY id")
+        rows = job.result(page_size=30)
+        assert rows.total_rows == 100
+        assert [row.id for row in rows] == list(range(100))
+    finally:
+        server.stop(grace=None)
+
+
+def test_flight(bq):
+    from google.protobuf import any_pb2, wrappers_pb2
+    from pyarrow import flight as pa_flight
+
+    from local_bigquery import flight
+
+    server = flight.serve(9070)
+    try:
+        client = pa_flight.connect("grpc://127.0.0.1:9070")
+        ticket = pa_flight.Ticket(
+            b"SELECT id, CAST(id AS STRING) AS name "
+            b"FROM UNNEST(GENERATE_ARRAY(1, 5)) AS id"
+        )
+        table = client.do_get(ticket).read_all()
+        assert table.column_names == ["id", "name"]
+        assert table["id"].to_pylist() == [1, 2, 3, 4, 5]
+
+        descriptor = pa_flight.FlightDescriptor.for_command(
+            '{"query": "SELECT 1 AS x", "projectId": "project1"}'
+        )
+        info = client.get_flight_info(descriptor)
+        table = client.do_get(info.endpoints[0].ticket).read_all()
+        assert table.to_pylist() == [{"x": 1}]
+
+        command = any_pb2.Any(
+            type_url=flight.STATEMENT_QUERY_TYPE,
+            value=wrappers_pb2.StringValue(value="SELECT 2 AS y").SerializeToString(),
+        )
+        descriptor = pa_flight.FlightDescriptor.for_command(command.SerializeToString())
+        info = client.get_flight_info(descriptor)
+        table = client.do_get(info.endpoints[0].ticket).read_all()
+        assert table.to_pylist() == [{"y": 2}]
+    finally:
+        server.shutdown()
+
+
+def test_job_metadata(bq):
+    from local_bigquery import metadata
+
+    job = bq.query("SELECT 1", job_config=QueryJobConfig(labels={"team": "data"}))
+    job.result()
+    assert bq.get_job(job.job_id).labels == {"team": "data"}
+    row = (
+        metadata.connection()
+        .execute(
+            "SELECT state FROM jobs JOIN job_labels USING (project_id, job_id) "
+            "WHERE key = 'team' AND value = 'data'"
+        )
+        .fetchone()
+    )
+    assert row == ("DONE",)
+
+    # Metadata kept in the internal DuckLake project by earlier versions is
+    # moved into the store.
+    dataset = f'"{settings.internal_project_id}"."legacy"'
+    with db.cursor(settings.internal_project_id) as cur:
+        cur.execute(f"CREATE SCHEMA IF NOT EXISTS {dataset}")
+        cur.execute(
+            f"CREATE OR REPLACE TABLE {dataset}.jobs "
+            "(project_id TEXT, job_id TEXT, item JSON)"
+        )
+        cur.execute(
+            f"INSERT INTO {dataset}.jobs VALUES "
+            """('project', 'legacy-job', '{"status": {"state": "DONE"}}')"""
+        )
+        metadata.import_legacy(cur, settings.internal_project_id, "legacy")
+    assert db.get_job("project", "legacy-job").status.state == "DONE"
+
+
+def test_catalog_cache(bq):
+    from local_bigquery import metadata
+
+    bq.create_dataset("project1.cached", exists_ok=True)
+    assert "cached" in [d.dataset_id for d in bq.list_datasets("project1")]
+    assert list(bq.list_tables("project1.cached")) == []
+
+    # Reads are answered from memory and no longer write metadata rows.
+    with db.cursor("project1") as cur:
+        cur.execute('CREATE SCHEMA IF NOT EXISTS "project1"."unlisted"')
+    db.catalog.invalidate("project1")
+    assert bq.get_dataset("project1.unlisted").dataset_id == "unlisted"
+    stored = (
+        metadata.connection()
+        .execute("SELECT count(*) FROM datasets WHERE dataset_id = 'unlisted'")
+        .fetchone()
+    )
+    assert stored == (0,)
+
+    # DDL run through queries is reflected in listings.
+    query(bq, "CREATE TABLE project1.cached.t1 (id INT64)")
+    assert [t.table_id for t in bq.list_tables("project1.cached")] == ["t1"]
+    assert db.catalog.get_table("project1", "cached", "t1") == [("id", "BIGINT", True)]
+    query(bq, "DROP TABLE project1.cached.t1")
+    assert list(bq.list_tables("project1.cached")) == []
+    bq.delete_dataset("project1.cached", delete_contents=True)
+    assert "cached" not in [d.dataset_id for d in bq.list_datasets("project1")]
+
+
+def test_job_retention(bq, server_url, monkeypatch):
+    job = bq.query("SELECT 1 AS x")
+    assert [dict(row) for row in job.result()] == [{"x": 1}]
+
+    # Results expire after their TTL, while the job itself is kept.
+    now = int(db.timestamp_now())
+    monkeypatch.setattr(db, "timestamp_now", lambda: str(now + 24 * 60 * 60))
+    response = requests.get(
+        f"{server_url}/bigquery/v2/projects/{bq.project}/queries/{job.job_id}"
+    )
+    assert response.status_code == 404
+    assert "expired" in response.json()["error"]["message"]
+    requests.post(f"{server_url}/admin/maintenance:run")
+    assert db.get_job(bq.project, job.job_id) is not None
+
+    # Jobs are deleted once they are older than the retention period.
+    monkeypatch.setattr(db, "timestamp_now", lambda: str(now + 31 * 24 * 60 * 60))
+    status = requests.post(f"{server_url}/admin/maintenance:run").json()
+    assert status["retention"]["jobsDeleted"] >= 1
+    assert db.get_job(bq.project, job.job_id) is None
+
+
+def test_list_jobs(bq):
+    job_ids = [bq.query(f"SELECT {i}").job_id for i in range(5)]
+    listed = [job.job_id for job in bq.list_jobs(page_size=2)]
+    assert set(job_ids) <= set(listed)
+    assert len(listed) == len(set(listed))
+
+    pages = bq.list_jobs(max_results=3, page_size=2).pages
+    assert [len(list(page)) for page in pages] == [2, 1]
+
+    done = list(bq.list_jobs(state_filter="done", max_results=1))
+    assert done[0].state == "DONE"
+    assert list(bq.list_jobs(state_filter="pending")) == []
+
+    future = datetime.datetime.now() + datetime.timedelta(days=1)
+    assert list(bq.list_jobs(min_creation_time=future)) == []
+
+    response = bq._connection.api_request(
+        "GET", "/projects/project1/jobs", query_params={"projection": "minimal"}
+    )
+    assert all("configuration" not in job for job in response["jobs"])
+
+
+def test_get_table(bq):
+    bq.create_dataset("project1.dataset1", exists_ok=True)
+    bq.delete_table("project1.dataset1.described", not_found_ok=True)
+    bq.create_table(
+        bigquery.Table(
+            "project1.dataset1.described",
+            schema=[
+                bigquery.SchemaField("id", "INTEGER", mode="REQUIRED"),
+                bigquery.SchemaField("name", "STRING"),
+                bigquery.SchemaField("tags", "STRING", mode="REPEATED"),
+            ],
+        )
+    )
+    query(
+        bq,
+        """
+        INSERT INTO project1.dataset1.described (id, name, tags)
+        SELECT id, CAST(id AS STRING), [] FROM UNNEST(GENERATE_ARRAY(1, 1000)) AS id
+        """,
+    )
+    query(bq, "INSERT INTO project1.dataset1.described (id) VALUES (0)")
+    query(bq, "DELETE FROM project1.dataset1.described WHERE id <= 10")
+
+    table = bq.get_table("project1.dataset1.described")
+    assert [(f.name, f.field_type, f.mode) for f in table.schema] == [
+        ("id", "INTEGER", "REQUIRED"),
+        ("name", "STRING", "NULLABLE"),
+        ("tags", "STRING", "REPEATED"),
+    ]
+    assert table.num_rows == 990
+    assert table.num_bytes > 0
+    assert table.created <= table.modified
+
+    with pytest.raises(exceptions.NotFound):
+        bq.get_table("project1.dataset1.missing")
+
+
+def test_update_table(bq):
+    bq.create_dataset("project1.dataset1", exists_ok=True)
+    bq.delete_table("project1.dataset1.evolving", not_found_ok=True)
+    table = bigquery.Table(
+        "project1.dataset1.evolving",
+        schema=[
+            bigquery.SchemaField("id", "INTEGER", mode="REQUIRED"),
+            bigquery.SchemaField("name", "STRING", description="Display name"),
+        ],
+    )
+    table.description = "Evolving table"
+    table.labels = {"team": "data"}
+    table.clustering_fields = ["id"]
+    bq.create_table(table)
+    query(bq, "INSERT INTO project1.dataset1.evolving (id, name) VALUES (1, 'a')")
+
+    table = bq.get_table("project1.dataset1.evolving")
+    assert table.description == "Evolving table"
+    assert table.labels == {"team": "data"}
+    assert table.clustering_fields == ["id"]
+    assert table.schema[1].description == "Display name"
+
+    table.schema = [
+        bigquery.SchemaField("id", "INTEGER", mode="NULLABLE"),
+        *table.schema[1:],
+        bigquery.SchemaField("score", "FLOAT", description="Added later"),
+    ]
+    table.description = "Evolved table"
+    table = bq.update_table(table, ["schema", "description"])
+    assert [(f.name, f.mode) for f in table.schema] == [
+        ("id", "NULLABLE"),
+        ("name", "NULLABLE"),
+        ("score", "NULLABLE"),
+    ]
+    assert table.schema[2].description == "Added later"
+    assert table.description == "Evolved table"
+    assert table.labels == {"team": "data"}
+    query(bq, "INSERT INTO project1.dataset1.evolving (name) VALUES ('b')")
+    assert bq.get_table("project1.dataset1.evolving").num_rows == 2
+
+    table.schema = [
+        *table.schema,
+        bigquery.SchemaField("required", "STRING", mode="REQUIRED"),
+    ]
+    with pytest.raises(exceptions.BadRequest):
+        bq.update_table(table, ["schema"])
+
+    # Reserved and mixed-case column names evolve too.
+    bq.delete_table("project1.dataset1.reserved", not_found_ok=True)
+    table = bq.create_table(
+        bigquery.Table(
+            "project1.dataset1.reserved",
+            schema=[bigquery.SchemaField("select", "INTEGER", mode="REQUIRED")],
+        )
+    )
+    table.schema = [
+        bigquery.SchemaField("select", "INTEGER", mode="NULLABLE"),
+        bigquery.SchemaField("Order", "STRING"),
+    ]
+    table = bq.update_table(table, ["schema"])
+    assert [(f.name, f.mode) for f in table.schema] == [
+        ("select", "NULLABLE"),
+        ("Order", "NULLABLE"),
+    ]
+
+    # Nested fields can be added to records, but not changed.
+    bq.delete_table("project1.dataset1.nested", not_found_ok=True)
+    table = bq.create_table(
+        bigquery.Table(
+            "project1.dataset1.nested",
+            schema=[
+                bigquery.SchemaField("amount", "NUMERIC"),
+                bigquery.SchemaField(
+                    "rec", "RECORD", fields=[bigquery.SchemaField("a", "INTEGER")]
+                ),
+                bigquery.SchemaField(
+                    "items",
+                    "RECORD",
+                    mode="REPEATED",
+                    fields=[bigquery.SchemaField("a", "INTEGER")],
+                ),
+            ],
+        )
+    )
+    amount, rec, items = table.schema
+    table.schema = [
+        amount,
+        bigquery.SchemaField(
+            "rec",
+            "RECORD",
+            fields=[*rec.fields, bigquery.SchemaField("b", "STRING")],
+        ),
+        bigquery.SchemaField(
+            "items",
+            "RECORD",
+            mode="REPEATED",
+            fields=[*items.fields, bigquery.SchemaField("Select", "STRING")],
+        ),
+    ]
+    table = bq.update_table(table, ["schema"])
+    assert [f.name for f in table.schema[1].fields] == ["a", "b"]
+    assert [f.name for f in table.schema[2].fields] == ["a", "Select"]
+    query(
+        bq,
+        """
+        INSERT INTO project1.dataset1.nested (rec, items)
+        VALUES (STRUCT(1 AS a, 'x' AS b), [STRUCT(2 AS a, 'y' AS `Select`)])
+        """,
+    )
+    assert query(bq, "SELECT rec.b FROM project1.dataset1.nested") == [{"b": "x"}]
+    for changed in [
+        [bigquery.SchemaField("amount", "FLOAT64"), *table.schema[1:]],
+        [
+            amount,
+            bigquery.SchemaField(
+                "rec",
+                "RECORD",
+                fields=[bigquery.SchemaField("a", "STRING"), rec.fields[0]][:1]
+                + [bigquery.SchemaField("b", "STRING")],
+            ),
+            table.schema[2],
+        ],
+        [
+            amount,
+            bigquery.SchemaField(
+                "rec",
+                "RECORD",
+                fields=[
+                    bigquery.SchemaField("a", "INTEGER", mode="REPEATED"),
+                    bigquery.SchemaField("b", "STRING"),
+                ],
+            ),
+            table.schema[2],
+        ],
+    ]:
+        table.schema = changed
+        with pytest.raises(exceptions.BadRequest):
+            bq.update_table(table, ["schema"])
+
+    # A table recreated with SQL doesn't inherit the old one's metadata.
+    query(bq, "CREATE OR REPLACE TABLE project1.dataset1.evolving (id INT64)")
+    table = bq.get_table("project1.dataset1.evolving")
+    assert table.description is None
+    assert table.labels == {}
+    query(bq, "DROP TABLE project1.dataset1.reserved")
+    assert db.get_table_resource("project1", "dataset1", "reserved") == {}
+
+
+def test_information_schema(bq):
+    bq.create_dataset("project1.dataset1", exists_ok=True)
+    bq.delete_table("project1.dataset1.inspected", not_found_ok=True)
+    bq.create_table(
+        bigquery.Table(
+            "project1.dataset1.inspected",
+            schema=[
+                bigquery.SchemaField("id", "INTEGER", mode="REQUIRED"),
+                bigquery.SchemaField("tags", "STRING", mode="REPEATED"),
+            ],
+        )
+    )
+    job = bq.query("INSERT INTO project1.dataset1.inspected (id) VALUES (1), (2)")
+    job.result()
+
+    tables = query(
+        bq,
+        """
+        SELECT table_catalog, table_name, table_type, creation_time IS NOT NULL AS created
+        FROM `project1.region-us.INFORMATION_SCHEMA.TABLES`
+        WHERE table_schema = 'dataset1' AND table_name = 'inspected'
+        """,
+    )
+    assert tables == [
+        {
+            "table_catalog": "project1",
+            "table_name": "inspected",
+            "table_type": "BASE TABLE",
+            "created": True,
+        }
+    ]
+
+    columns = query(
+        bq,
+        """
+        SELECT column_name, ordinal_position, is_nullable, data_type
+        FROM dataset1.INFORMATION_SCHEMA.COLUMNS
+        WHERE table_name = 'inspected'
+        ORDER BY ordinal_position
+        """,
+    )
+    assert columns == [
+        {
+            "column_name": "id",
+            "ordinal_position": 1,
+            "is_nullable": "NO",
+            "data_type": "INT64",
+        },
+        {
+            "column_name": "tags",
+            "ordinal_position": 2,
+            "is_nullable": "YES",
+            "data_type": "ARRAY<STRING>",
+        },
+    ]
+
+    storage = query(
+        bq,
+        """
+        SELECT s.total_rows, p.partition_id
+        FROM `region-us`.INFORMATION_SCHEMA.TABLE_STORAGE AS s
+        JOIN dataset1.INFORMATION_SCHEMA.PARTITIONS AS p USING (table_name)
+        WHERE s.table_schema = 'dataset1' AND s.table_name = 'inspected'
+        """,
+    )
+    assert storage == [{"total_rows": 2, "partition_id": None}]
+
+    jobs = query(
+        bq,
+        f"""
+        SELECT job_type, state, query
+        FROM `region-us`.INFORMATION_SCHEMA.JOBS
+        WHERE job_id = '{job.job_id}'
+        """,
+    )
+    assert jobs == [{"job_type": "QUERY", "state": "DONE", "query": job.query}]
+
+    with pytest.raises(exceptions.NotFound):
+        query(bq, "SELECT * FROM missing.INFORMATION_SCHEMA.TABLES")
+
+
+def test_cursor_pool(bq, server_url):
+    query(bq, "SELECT 1")
+    status = requests.get(f"{server_url}/admin/pool").json()
+    assert status["projects"]["project1"]["checkouts"] > 0
+
+    pool = CursorPool(db.get_project_connection, size=1, timeout_seconds=0.05)
+    with pool.cursor("project1", "main") as cur:
+        # Other threads have to wait for the only cursor.
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            checkout = executor.submit(
+                lambda: pool.cursor("project1", "main").__enter__()
+            )
+            with pytest.raises(RateLimitError):
+                checkout.result()
+    with pool.cursor("project1", "main") as reused:
+        assert reused is cur
+        # The same thread can check out another without waiting.
+        with pool.cursor("project1", "main") as nested:
+            assert nested is not cur
+        pool.mark_dirty(reused)
+    with pool.cursor("project1", "main") as fresh:
+        assert fresh is not cur
+    status = pool.status()["projects"]["project1"]
+    assert status["timeouts"] == 1
+    assert status["discarded"] == 1
+
+
+def test_scheduled_queries_wait_for_cursors(bq, monkeypatch):
+    # More queries run at once than the project has cursors.
+    pool = CursorPool(db.get_project_connection, size=1, timeout_seconds=0.01)
+    monkeypatch.setattr(db, "pool", pool)
+    slow = "SELECT count(*) AS n FROM range(30000000) t(i) WHERE i % {} = 3"
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda m: query(bq, slow.format(m)), range(5, 9)))
+    assert [len(rows) for rows in results] == [1] * 4
+    status = pool.status()["projects"]["project1"]
+    assert status["waits"] > 0
+    assert status["timeouts"] == 0
+
+
+def test_shared_catalog(bq, monkeypatch):
+    monkeypatch.setattr(settings, "workers", 2)
+    bq.delete_dataset("project1.shared", delete_contents=True, not_found_ok=True)
+    bq.create_dataset("project1.shared")
+    assert list(bq.list_tables("project1.shared")) == []
+
+    # Another worker creates a table through its own DuckDB instance.
+    conn = duckdb.connect()
+    try:
+        db.attach_project(conn, "project1")
+        conn.execute('CREATE TABLE "project1"."shared"."elsewhere" (id BIGINT)')
+    finally:
+        conn.close()
+    db.metadata.bump_catalog_version()
+
+    tables = bq.list_tables("project1.shared")
+    assert [table.table_id for table in tables] == ["elsewhere"]
+
+
+def test_project_isolation(monkeypatch):
+    monkeypatch.setenv("PYTHONPATH", str(pathlib.Path(__file__).parents[2] / "src"))
+    monkeypatch.setenv("MAINTENANCE_INTERVAL_SECONDS", "0")
+    monkeypatch.setattr(settings, "project_groups", {"etl": ["isolated"]})
+    monkeypatch.setattr(settings, "worker_base_port", 9110)
+    config = uvicorn.Config(frontend.app, host="127.0.0.1", port=9080)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    try:
+        url = "http://127.0.0.1:9080"
+        while not server.started:
+            time.sleep(0.01)
+        bq = bigquery.Client(
+            project="isolated",
+            credentials=AnonymousCredentials(),
+            client_options=ClientOptions(api_endpoint=url),
+        )
+        assert query(bq, "SELECT 1 AS x") == [{"x": 1}]
+        assert query(bq, "SELECT 2 AS x", project="shared") == [{"x": 2}]
+
+        workers = requests.get(f"{url}/frontend/workers").json()
+        assert workers["etl"]["running"] and workers["default"]["running"]
+        assert workers["etl"]["pid"] != workers["default"]["pid"]
+
+        # A worker that dies is restarted by the next request for its projects.
+        os.kill(workers["etl"]["pid"], signal.SIGKILL)
+        while requests.get(f"{url}/frontend/workers").json()["etl"]["running"]:
+            time.sleep(0.01)
+        assert query(bq, "SELECT 3 AS x") == [{"x": 3}]
+        assert requests.get(f"{url}/frontend/workers").json()["etl"]["starts"] == 2
+
+        # Only projects that exist get a worker of their own, up to MAX_WORKERS.
+        monkeypatch.setattr(settings, "isolate_projects", True)
+        monkeypatch.setattr(settings, "max_workers", 3)
+        unknown = f"unknown-{uuid.uuid4().hex}"
+        requests.get(f"{url}/bigquery/v2/projects/{unknown}/datasets")
+        assert query(bq, "SELECT 4 AS x", project="shared") == [{"x": 4}]
+        assert query(bq, "SELECT 5 AS x", project="project1") == [{"x": 5}]
+        workers = requests.get(f"{url}/frontend/workers").json()
+        assert sorted(workers) == ["default", "etl", "shared"]
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def test_query_priorities(bq, server_url, monkeypatch):
+    config = QueryJobConfig(priority=bigquery.QueryPriority.BATCH)
+    job = bq.query("SELECT 42 AS answer", job_config=config)
+    assert [dict(row.items()) for row in job.result()] == [{"answer": 42}]
+    assert job.state == "DONE"
+
+    failed = bq.query("SELECT * FROM dataset1.missing", job_config=config)
+    with pytest.raises(exceptions.NotFound):
+        failed.result()
+    assert failed.error_result["reason"] == "notFound"
+
+    # Once a queue is full, new jobs are turned away until there's capacity.
+    queue = scheduler.scheduler.queues["BATCH"]
+    monkeypatch.setattr(queue, "concurrency", 0)
+    monkeypatch.setattr(queue, "max_queued", 0)
+    response = requests.post(
+        f"{server_url}/bigquery/v2/projects/project1/jobs",
+        json={"configuration": {"query": {"query": "SELECT 1", "priority": "BATCH"}}},
+    )
+    assert response.status_code == 429
+    assert response.json()["error"]["errors"][0]["reason"] == "rateLimitExceeded"
+    assert response.headers["Retry-After"] == "1"
+    assert scheduler.scheduler.status()["BATCH"]["rejected"] == 1
+
+
+def test_reservations(bq, server_url, monkeypatch):
+    monkeypatch.setattr(
+        settings,
+        "reservations",
+        {
+            "etl": Reservation(threads=1, memory_limit="512MB", labels={"team": "etl"}),
+            "ci": Reservation(threads=2, projects=["project1"]),
+        },
+    )
+    sql = "SELECT current_setting('threads') AS threads"
+
+    # Labels pick a reservation before the project does.
+    job = bq.query(sql, job_config=QueryJobConfig(labels={"team": "etl"}))
+    assert [dict(row.items()) for row in job.result()] == [{"threads": 1}]
+    assert job._properties["statistics"]["reservation_id"] == "etl"
+    assert query(bq, sql) == [{"threads": 2}]
+
+    response = requests.post(
+        f"{server_url}/bigquery/v2/projects/project1/queries",
+        json={
+            "query": "SELECT current_setting('memory_limit') AS memory_limit",
+            "reservation": "projects/project1/locations/US/reservations/etl",
+        },
+    )
+    assert response.json()["rows"] == [{"f": [{"v": "488.2 MiB"}]}]
+    response = requests.post(
+        f"{server_url}/bigquery/v2/projects/project1/queries",
+        json={"query": "SELECT 1", "reservation": "missing"},
+    )
+    assert response.status_code == 404
+    assert scheduler.scheduler.status()["reservations"]["etl"]["completed"] == 2
+    pools = requests.get(f"{server_url}/admin/pool").json()["reservations"]
+    assert pools["etl"]["projects"]["project1"]["checkouts"] > 0
+
+
+def test_job_resources(bq, server_url, monkeypatch):
+    def properties(**values):
+        return [bigquery.ConnectionProperty(k, v) for k, v in values.items()]
+
+    sql = """
+    SELECT current_setting('threads') AS threads,
+           current_setting('memory_limit') AS memory_limit
+    """
+    config = QueryJobConfig(
+        connection_properties=properties(threads="1", memory_limit="64MB")
+    )
+    assert query(bq, sql, config) == [{"threads": 1, "memory_limit": "61.0 MiB"}]
+    temp_directory = query(bq, "SELECT current_setting('temp_directory') AS d")[0]["d"]
+    assert pathlib.Path(temp_directory).parent == settings.data_dir / "tmp"
+
+    # Sorting more than fits in memory spills to disk, unless the quota is too small.
+    sort = """
+    SELECT count(*) AS n FROM (
+        SELECT md5(i::VARCHAR) AS s FROM range(2000000) t(i) ORDER BY s
+    )
+    """
+    assert query(bq, sort, config) == [{"n": 2000000}]
+    config = QueryJobConfig(
+        connection_properties=properties(
+            threads="1", memory_limit="64MB", max_temp_directory_size="1MB"
+        )
+    )
+    with pytest.raises(exceptions.BadRequest, match="max_temp_directory_size"):
+        query(bq, sort, config)
+    with pytest.raises(exceptions.BadRequest, match="threads"):
+        query(
+            bq,
+            "SELECT 1",
+            QueryJobConfig(connection_properties=properties(threads="x")),
+        )
+    injected = "1GB'; CREATE TABLE pwned AS SELECT 1 x; SET memory_limit='2GB"
+    with pytest.raises(exceptions.BadRequest, match="memory_limit"):
+        query(
+            bq,
+            "SELECT 1",
+            QueryJobConfig(connection_properties=properties(memory_limit=injected)),
+        )
+
+    # Each new set of overrides opens an instance, so only so many are allowed.
+    monkeypatch.setattr(settings, "max_job_budgets", 0)
+    with pytest.raises(exceptions.BadRequest, match="budgets"):
+        query(
+            bq,
+            "SELECT 1",
+            QueryJobConfig(connection_properties=properties(threads="3")),
+        )
+    assert (
+        query(
+            bq,
+            sql,
+            QueryJobConfig(
+                connection_properties=properties(threads="1", memory_limit="64MB")
+            ),
+        )[0]["threads"]
+        == 1
+    )
+
+
+def test_job_timeouts(bq, server_url):
+    endless = "SELECT count(*) AS n FROM range(1000000000000) t(i) WHERE i % 7 = 3"
+    config = QueryJobConfig(job_timeout_ms=200)
+    with pytest.raises(exceptions.BadRequest, match="timed out"):
+        query(bq, endless, config)
+
+    # jobs.query returns once timeoutMs passes, and the query keeps running.
+    response = requests.post(
+        f"{server_url}/bigquery/v2/projects/project1/queries",
+        json={"query": endless, "jobTimeoutMs": "500", "timeoutMs": 50},
+    ).json()
+    assert response["jobComplete"] is False
+    job_id = response["jobReference"]["jobId"]
+    job = bq.get_job(job_id)
+    assert job.state == "RUNNING"
+    with pytest.raises(exceptions.GoogleAPICallError, match="timed out"):
+        job.result()
+    assert job.error_result["reason"] == "timeout"
+
+
+def test_long_poll(server_url):
+    jobs_url = f"{server_url}/bigquery/v2/projects/project1/jobs"
+    job = requests.post(
+        jobs_url,
+        json={
+            "configuration": {
+                "jobTimeoutMs": "1000",
+                "query": {
+                    "query": "SELECT count(*) FROM range(1000000000000) t(i) WHERE i % 7 = 3",
+                    "priority": "BATCH",
+                },
+            }
+        },
+    ).json()
+    job_id = job["jobReference"]["jobId"]
+    results_url = f"{server_url}/bigquery/v2/projects/project1/queries/{job_id}"
+    response = requests.get(results_url, params={"timeoutMs": 50}).json()
+    assert response["jobComplete"] is False
+
+    # The request is held until the job finishes, not for the whole timeout.
+    started = time.monotonic()
+    response = requests.get(results_url, params={"timeoutMs": 60000}).json()
+    assert time.monotonic() - started < 10
+    assert response["jobComplete"] is True
+    assert response["errors"][0]["reason"] == "timeout"
+    job = requests.get(f"{jobs_url}/{job_id}", params={"timeoutMs": 60000}).json()
+    assert job["status"]["state"] == "DONE"
+    status = requests.get(f"{server_url}/admin/scheduler").json()
+    assert status["completions"]["waiting"] == 0
+
+
+def test_single_flight(bq):
+    bq.create_dataset("project1.dataset1", exists_ok=True)
+    bq.delete_table("project1.dataset1.flights", not_found_ok=True)
+    query(bq, "CREATE TABLE dataset1.flights (id INT64)")
+    sql = "SELECT count(*) AS n FROM dataset1.flights"
+    key, translated = db.single_flight_key("project1", None, sql, {})
+    assert key[2] == translated.sql("duckdb")
+    assert key == db.single_flight_key("project1", None, sql, {})[0]
+    assert key != db.single_flight_key("project1", None, sql + " WHERE id = 1", {})[0]
+    query(bq, "INSERT INTO dataset1.flights VALUES (1)")
+    # A commit since means identical queries no longer share results.
+    assert key != db.single_flight_key("project1", None, sql, {})[0]
+    assert db.single_flight_key("project1", None, "SELECT RAND()", {}) is None
+    assert db.single_flight_key("project1", None, "DELETE FROM x WHERE 1=1", {}) is None
+    storage = "SELECT * FROM dataset1.INFORMATION_SCHEMA.TABLE_STORAGE"
+    assert db.single_flight_key("project1", None, storage, {}) is None
+
+    slow = "SELECT count(*) AS n FROM range(100000000) t(i) WHERE i % 7 = 3"
+    before = db.single_flight.status()
+    with concurrent.futures.ThreadPoolExecutor(5) as executor:
+        results = list(executor.map(lambda _: query(bq, slow), range(5)))
+    assert results == [[{"n": 14285714}]] * 5
+    after = db.single_flight.status()
+    assert after["executed"] - before["executed"] < 5
+    assert after["shared"] > before["shared"]
+    assert after["inFlight"] == 0
+
+    # Queries sharing an execution each get their own results table.
+    paths = [settings.data_dir / f"shared-{i}.parquet" for i in range(3)]
+    with concurrent.futures.ThreadPoolExecutor(3) as executor:
+        results = list(
+            executor.map(
+                lambda path: db.query("project1", None, slow, results_path=path),
+                paths,
+            )
+        )
+    assert [rows for rows, _ in results] == [results[0][0]] * 3
+    assert all(path.exists() for path in paths)
+
+    # A query timing out doesn't fail identical ones allowed longer.
+    endless = "SELECT count(*) AS n FROM range(1000000000000) t(i) WHERE i % 7 = 3"
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        leader = executor.submit(
+            db.query, "project1", None, endless, timeout_seconds=0.5
+        )
+        time.sleep(0.1)
+        follower = executor.submit(
+            db.query, "project1", None, endless, timeout_seconds=1.5
+        )
+        with pytest.raises(JobTimeoutError, match="0.5s"):
+            leader.result()
+        with pytest.raises(JobTimeoutError, match="1.5s"):
+            follower.result()
+
+
+def test_client_job_ids(bq, server_url):
+    bq.create_dataset("project1.dataset1", exists_ok=True)
+    bq.delete_table("project1.dataset1.retries", not_found_ok=True)
+    query(bq, "CREATE TABLE dataset1.retries (id INT64)")
+    job_id = f"retry_{uuid.uuid4().hex}"
+    body = {
+        "jobReference": {"projectId": "project1", "jobId": job_id},
+        "configuration": {
+            "query": {"query": "INSERT INTO dataset1.retries VALUES (1)"}
+        },
+    }
+    jobs_url = f"{server_url}/bigquery/v2/projects/project1/jobs"
+    first = requests.post(jobs_url, json=body).json()
+    assert first["jobReference"]["jobId"] == job_id
+    assert first["status"]["state"] == "DONE"
+
+    # Retrying returns the same job without applying the DML again.
+    retry = requests.post(jobs_url, json=body).json()
+    assert retry["jobReference"]["jobId"] == job_id
+    assert retry["statistics"]["creationTime"] == first["statistics"]["creationTime"]
+    assert query(bq, "SELECT count(*) AS n FROM dataset1.retries") == [{"n": 1}]
+
+    body["configuration"]["query"]["query"] = "SELECT 1"
+    response = requests.post(jobs_url, json=body)
+    assert response.status_code == 409
+    with pytest.raises(exceptions.Conflict):
+        bq.query("SELECT 2", job_id=job_id, job_retry=None).result()
+    body["jobReference"]["jobId"] = "not a job id"
+    assert requests.post(jobs_url, json=body).status_code == 400
+
+
+def test_incremental_results(server_url, monkeypatch):
+    monkeypatch.setattr(settings, "incremental_results_batch_rows", 100)
+    written = []
+    set_query_results = db.set_query_results
+
+    def record(project_id, job_id, results):
+        written.append((results.jobComplete, results.totalRows))
+        return set_query_results(project_id, job_id, results)
+
+    monkeypatch.setattr(db, "set_query_results", record)
+    response = requests.post(
+        f"{server_url}/bigquery/v2/projects/project1/queries",
+        json={
+            "query": "SELECT i FROM range(1000) t(i)",
+            "writeIncrementalResults": True,
+        },
+    ).json()
+    assert response["totalRows"] == "1000"
+    assert [row["f"][0]["v"] for row in response["rows"]] == [
+        str(i) for i in range(1000)
+    ]
+    # Results so far are rewritten each time they double, then once more at the end.
+    assert written == [
+        (False, "100"),
+        (False, "200"),
+        (False, "400"),
+        (False, "800"),
+        (True, "1000"),
+    ]
+
+    # While the job runs, the pages written so far can be read.
+    job_id = f"incremental_{uuid.uuid4().hex}"
+    configuration = bigquery.QueryJobConfig(write_incremental_results=True)
+    job = jobs.query_job(
+        "project1",
+        job_id,
+        JobConfiguration.model_validate(configuration.to_api_repr()),
+        "RUNNING",
+    )
+    db.create_job("project1", job_id, job)
+    set_query_results(
+        "project1",
+        job_id,
+        GetQueryResultsResponse(
+            jobComplete=False,
+            jobReference=job.jobReference,
+            rows=[TableRow(f=[TableCell(v="1")])],
+            totalRows="1",
+        ),
+    )
+    results_url = f"{server_url}/bigquery/v2/projects/project1/queries/{job_id}"
+    page = requests.get(results_url, params={"timeoutMs": 0}).json()
+    assert page["jobComplete"] is False
+    assert page["rows"] == [{"f": [{"v": "1"}]}]
+    page = requests.get(
+        results_url, params={"timeoutMs": 0, "pageToken": page["pageToken"]}
+    ).json()
+    assert page["jobComplete"] is False
+    assert "rows" not in page
+
+
+def test_continuous_queries(bq, server_url, monkeypatch):
+    monkeypatch.setattr(settings, "continuous_query_interval_ms", 50)
+    bq.create_dataset("project1.dataset1", exists_ok=True)
+    bq.delete_table("project1.dataset1.events", not_found_ok=True)
+    bq.delete_table("project1.dataset1.clicks", not_found_ok=True)
+    query(bq, "CREATE TABLE dataset1.events (id INT64, kind STRING)")
+    query(bq, "CREATE TABLE dataset1.clicks (id INT64)")
+    query(bq, "INSERT INTO dataset1.events VALUES (1, 'click')")
+    jobs_url = f"{server_url}/bigquery/v2/projects/project1/jobs"
+    job = requests.post(
+        jobs_url,
+        json={
+            "configuration": {
+                "query": {
+                    "query": "INSERT INTO dataset1.clicks "
+                    "SELECT id FROM dataset1.events WHERE kind = 'click'",
+                    "continuous": True,
+                }
+            }
+        },
+    ).json()
+    job_id = job["jobReference"]["jobId"]
+    assert job["status"]["state"] == "RUNNING"
+
+    def clicks():
+        return query(bq, "SELECT id FROM dataset1.clicks ORDER BY id")
+
+    # Only rows inserted after the job started are processed, once each.
+    query(bq, "INSERT INTO dataset1.events VALUES (2, 'click'), (3, 'view')")
+    query(bq, "INSERT INTO dataset1.events VALUES (4, 'click')")
+    deadline = time.monotonic() + 10
+    while len(clicks()) < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    time.sleep(0.2)
+    assert clicks() == [{"id": 2}, {"id": 4}]
+
+    # After a restart, the job picks up from the last snapshot it processed.
+    # Maintenance keeps the snapshots it still needs, and retention the job.
+    continuous_queries.stop()
+    query(bq, "INSERT INTO dataset1.events VALUES (6, 'click')")
+    query(bq, "INSERT INTO dataset1.events VALUES (7, 'view')")
+    monkeypatch.setattr(settings, "snapshot_max_count", 1)
+    requests.post(f"{server_url}/admin/maintenance:run").raise_for_status()
+    db.delete_expired_jobs(int(db.timestamp_now()) + 60, 1000)
+    continuous_queries.resume()
+    deadline = time.monotonic() + 10
+    while len(clicks()) < 3 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    time.sleep(0.2)
+    assert clicks() == [{"id": 2}, {"id": 4}, {"id": 6}]
+
+    cancelled = requests.post(f"{jobs_url}/{job_id}/cancel").json()["job"]
+    assert cancelled["status"]["state"] == "DONE"
+    assert cancelled["status"]["errorResult"]["reason"] == "stopped"
+    query(bq, "INSERT INTO dataset1.events VALUES (5, 'click')")
+    time.sleep(0.2)
+    assert clicks() == [{"id": 2}, {"id": 4}, {"id": 6}]
+
+    invalid = requests.post(
+        jobs_url,
+        json={
+            "configuration": {
+                "query": {"query": "SELECT * FROM dataset1.events", "continuous": True}
+            }
+        },
+    )
+    assert invalid.status_code == 400
+
+
 @pytest.fixture
 def postgres_url():
     postgres = PostgresContainer("postgres:17")
@@ -598,6 +1689,51 @@ def postgres_url():
     postgres.stop()
 
 
+def test_postgres_catalog_workers(monkeypatch, tmp_path):
+    with pytest.raises(ValueError, match="Unsupported DuckLake catalog"):
+        Settings(ducklake_catalog="mysql:db=ducklake")
+
+    postgres = PostgresContainer("postgres:17")
+    postgres.start()
+    catalog = (
+        f"postgres:dbname={postgres.dbname} host={postgres.get_container_host_ip()} "
+        f"port={postgres.get_exposed_port(5432)} user={postgres.username} "
+        f"password={postgres.password}"
+    )
+    monkeypatch.setenv("PYTHONPATH", str(pathlib.Path(__file__).parents[2] / "src"))
+    env = {
+        "DATA_DIR": str(tmp_path),
+        "DUCKLAKE_CATALOG": catalog,
+        "WORKERS": "2",
+        "MAINTENANCE_INTERVAL_SECONDS": "0",
+    }
+    # Two workers share the catalog, each through its own DuckDB instance.
+    workers = [frontend.Worker(f"pg{i}", 9120 + i, env) for i in range(2)]
+    try:
+        clients = []
+        for worker in workers:
+            worker.ensure_started()
+            clients.append(
+                bigquery.Client(
+                    project="project1",
+                    credentials=AnonymousCredentials(),
+                    client_options=ClientOptions(api_endpoint=worker.url),
+                )
+            )
+        first, second = clients
+        first.create_dataset("project1.shared")
+        query(first, "CREATE TABLE shared.numbers (n INT64)")
+        query(second, "INSERT INTO shared.numbers VALUES (1), (2)")
+        rows = query(first, "SELECT n FROM shared.numbers ORDER BY n")
+        assert rows == [{"n": 1}, {"n": 2}]
+        tables = second.list_tables("project1.shared")
+        assert [table.table_id for table in tables] == ["numbers"]
+    finally:
+        for worker in workers:
+            worker.stop()
+        postgres.stop()
+
+
 def test_external_query(postgres_url, bq):
     assert query(
         bq,